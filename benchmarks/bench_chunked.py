@@ -0,0 +1,104 @@
+# Benchmark and check of src/chunked_features.py on a long synthetic minute-bar history.
+#   - build_features_chunked gives the same partition as build_features on the whole history (exact, full and compact frames,
+#     from the raw store and from pd.read_csv(chunksize=...)), also with awkward block sizes (1 bar, shorter than the windows)
+#   - no rows (an empty iterator or header-only CSV) writes nothing, and a later CSV block whose Volume parses as float64
+#     raises a clear ValueError and leaves no partition behind
+#   - peak memory: every case runs in a fresh process and reports its max RSS, for a history and one 4x longer; the chunked
+#     peak stays flat while the whole-history peak grows with the history
+# Run from the repo root: python benchmarks/bench_chunked.py [n_rows] [chunk_rows]
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import chunked_features
+import feature_engineering as fe
+import storage
+from bench_suite import synthetic_bars
+
+def raw_history(n_rows, seed=0):
+    df = synthetic_bars(n_rows, seed, frequency='minute')
+    rng = np.random.default_rng(seed)
+    df.loc[rng.integers(100, n_rows, max(n_rows // 20_000, 2)), 'Close'] = np.nan # a few missing prints, to test the gaps too
+    return df
+
+def run_case(mode, raw_root, features_root, ticker, chunk_rows, compact=False):
+    '''
+    Function to build one ticker's features in this process (a fresh worker), so its max RSS belongs to this case alone.
+    :return: Tuple (seconds, max RSS in bytes).
+    '''
+    start = time.perf_counter()
+    if mode == 'whole':
+        fe.build_features(storage.read_partition(raw_root, ticker), ticker, root=features_root, compact=compact)
+    else:
+        chunked_features.build_features_chunked(storage.iter_partition(raw_root, ticker, chunk_rows), ticker, root=features_root,
+                                                compact=compact)
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def isolated(*args, **kwargs):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(run_case, *args, **kwargs).result()
+
+def same_partition(root_a, root_b, ticker):
+    pd.testing.assert_frame_equal(storage.read_partition(root_a, ticker), storage.read_partition(root_b, ticker), check_exact=True)
+
+def main(n_rows=1_000_000, chunk_rows=100_000):
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        # small history: every block size edge case, both frame types and the CSV reader
+        small = raw_history(5_000, seed=1)
+        whole = fe.build_features(small.copy(), 'SMALL', root=tmp / 'whole')
+        compact = fe.build_features(small.copy(), 'SMALL', root=tmp / 'whole_compact', compact=True)
+        for size in (1, 19, 50, 51, 1_000, 10_000):
+            chunks = (small.iloc[start:start + size] for start in range(0, len(small), size))
+            chunked_features.build_features_chunked(chunks, 'SMALL', root=tmp / f'chunked_{size}')
+            same_partition(tmp / 'whole', tmp / f'chunked_{size}', 'SMALL')
+        chunks = (small.iloc[start:start + 333] for start in range(0, len(small), 333))
+        chunked_features.build_features_chunked(chunks, 'SMALL', root=tmp / 'chunked_compact', compact=True)
+        same_partition(tmp / 'whole_compact', tmp / 'chunked_compact', 'SMALL')
+        small.to_csv(tmp / 'small.csv', index=False)
+        fe.build_features(pd.read_csv(tmp / 'small.csv', parse_dates=['Date']), 'CSV', root=tmp / 'whole')
+        chunked_features.build_features_chunked(pd.read_csv(tmp / 'small.csv', parse_dates=['Date'], chunksize=777), 'CSV',
+                                                root=tmp / 'chunked_csv')
+        same_partition(tmp / 'whole', tmp / 'chunked_csv', 'CSV')
+        print(f"{len(whole)} / {len(compact)} rows: identical for block sizes 1..10000, compact frames and CSV chunks")
+
+        small.iloc[:0].to_csv(tmp / 'empty.csv', index=False)
+        for chunks in (iter([]), pd.read_csv(tmp / 'empty.csv', parse_dates=['Date'], chunksize=100)):
+            assert chunked_features.build_features_chunked(chunks, 'EMPTY', root=tmp / 'empty')['path'] is None
+        assert not (tmp / 'empty').exists()
+        gappy = small.astype({'Volume': object})
+        gappy.loc[4000, 'Volume'] = None # Volume parses as int64 until this block, then as float64
+        gappy.to_csv(tmp / 'gappy.csv', index=False)
+        try:
+            chunked_features.build_features_chunked(pd.read_csv(tmp / 'gappy.csv', parse_dates=['Date'], chunksize=1000), 'GAPPY',
+                                                    root=tmp / 'gappy')
+            raise AssertionError("a block with different dtypes must be refused")
+        except ValueError as error:
+            assert 'Volume' in str(error), error
+        assert not [path for path in (tmp / 'gappy').rglob('*') if path.is_file()] # no partition and no leftover tmp file
+        print("no rows: nothing written; a block with other dtypes: clear error, nothing published")
+
+        # long histories: exactness at scale, time and peak memory
+        results = {}
+        for rows in (n_rows // 4, n_rows):
+            ticker = f'M{rows}'
+            storage.write_partition(raw_history(rows), tmp / 'raw', ticker)
+            for mode in ('whole', 'chunked'):
+                results[mode, rows] = isolated(mode, tmp / 'raw', tmp / mode, ticker, chunk_rows)
+            same_partition(tmp / 'whole', tmp / 'chunked', ticker)
+        print(f"{n_rows:,} minute bars in blocks of {chunk_rows:,}: partitions identical to the whole-history build")
+        for (mode, rows), (seconds, rss) in results.items():
+            print(f"{mode:8s} {rows:>10,} bars  {seconds:7.2f}s  {rows / seconds:>12,.0f} bars/s  peak RSS {rss / 2 ** 20:8.1f} MiB")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
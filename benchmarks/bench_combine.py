@@ -0,0 +1,52 @@
+# Benchmark: combine_datasets vs. the old pd.concat-inside-the-loop version, as the number of tickers grows.
+# Run from the repo root: python benchmarks/bench_combine.py [max_tickers] [n_rows]
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+from bench_feature_plan import synthetic_ohlcv
+
+def concat_in_loop(df_list, df_names):
+    '''
+    The old combine_datasets (copies the growing frame once per ticker).
+    '''
+    combined_df = pd.DataFrame()
+    for df, name in zip(df_list, df_names):
+        df = df.copy()
+        df['Dataset'] = name
+        combined_df = pd.concat([combined_df, df], ignore_index=True)
+    return combined_df
+
+def measure(func, *args):
+    '''
+    Function to time one call, then run it again under tracemalloc for the peak memory (tracemalloc slows the call down).
+    '''
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+def main(max_tickers=400, n_rows=1000):
+    template = fe.compute_features(synthetic_ohlcv(n_rows, seed=0))
+    n_tickers = 25
+    while n_tickers <= max_tickers:
+        frames = [template] * n_tickers
+        names = [f'T{i:04d}' for i in range(n_tickers)]
+        old, old_seconds, old_peak = measure(concat_in_loop, frames, names)
+        new, new_seconds, new_peak = measure(fe.combine_datasets, frames, names)
+        pd.testing.assert_frame_equal(new.astype({'Dataset': str}), old, check_exact=True)
+        print(f"{n_tickers:5d} tickers  concat-in-loop {old_seconds:7.3f}s {old_peak / 1e6:8.1f} MB peak   "
+              f"combine_datasets {new_seconds:7.3f}s {new_peak / 1e6:8.1f} MB peak")
+        n_tickers *= 2
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
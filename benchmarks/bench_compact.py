@@ -0,0 +1,36 @@
+# Benchmark: memory footprint of full vs. compact feature frames (feature_engineering.compute_features(..., compact=True)),
+# and what a 20-year daily panel of a few thousand symbols would take in RAM at each footprint.
+# Run from the repo root: python benchmarks/bench_compact.py [n_tickers] [n_rows]
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+from bench_feature_plan import synthetic_ohlcv
+
+def main(n_tickers=100, n_rows=5000, panel_tickers=5000, panel_years=20):
+    frames = [synthetic_ohlcv(n_rows, seed=i) for i in range(n_tickers)]
+    names = [f'T{i:04d}' for i in range(n_tickers)]
+    results = {}
+    for compact in (False, True):
+        start = time.perf_counter()
+        combined = fe.combine_datasets([fe.compute_features(df, compact=compact) for df in frames], names)
+        seconds = time.perf_counter() - start
+        results[compact] = (fe.memory_report(combined), seconds, combined)
+
+    full, compact = results[False][2], results[True][2]
+    assert full.index.equals(compact.index), "compact mode must keep the same rows"
+    worst = max(np.nanmax(np.abs(compact[column].to_numpy(np.float64) - full[column].to_numpy()) /
+                          np.maximum(np.abs(full[column].to_numpy()), 1e-300), initial=0.0)
+                for column in compact.columns if compact[column].dtype == np.float32)
+    panel_rows = panel_tickers * panel_years * 252
+    print(f"{n_tickers} tickers x {n_rows} rows, same rows in both modes, worst float32 relative error {worst:.1e}")
+    for mode, (report, seconds, df) in (('full', results[False]), ('compact', results[True])):
+        print(f"{mode:8s} {len(df.columns):3d} columns {report['bytes_per_row']:7.1f} bytes/row  {report['bytes'] / 1e6:8.1f} MB  "
+              f"build {seconds:6.2f}s  -> {panel_tickers} symbols x {panel_years}y: {report['bytes_per_row'] * panel_rows / 1e9:6.1f} GB")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
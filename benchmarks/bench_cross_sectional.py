@@ -0,0 +1,94 @@
+# Benchmark and check of src/cross_sectional.py against the straightforward long-format pandas version of every feature
+# (groupby('Date') for the per-date ranks and z-scores, one Series.rolling per ticker over that ticker's own bars for relative
+# strength, betas/correlations and regimes, with SPY/QQQ taken on the same dates).
+# The universe has staggered listing dates and missing bars (see bench_panel_features.synthetic_universe); SPY and QQQ are
+# part of the panel. A missing bar must only cost its own row: after the 60-bar warm-up every bar has a beta. Ranks, relative strength and regimes must be identical, z-scores, betas and correlations agree to 1e-9
+# (moments from rolling sums vs. pandas' own rolling cov/corr).
+# Run from the repo root: python benchmarks/bench_cross_sectional.py [n_tickers] [n_rows]
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import cross_sectional as cs
+import feature_engineering as fe
+from bench_feature_plan import synthetic_ohlcv
+from bench_panel_features import synthetic_universe
+
+SECTORS = ('Tech', 'Energy', 'Health', 'Financials')
+
+def reference(frames, panel, features, sectors):
+    '''
+    Function to compute the same features in long format, one date group or one ticker at a time.
+    :return: DataFrame indexed by (Date, Ticker) with one column per feature.
+    '''
+    long = features.stack(level=1, future_stack=True).rename_axis(['Date', 'Ticker'])
+    long = long[fe.panel_mask(panel).ravel()] # bars only, like the stage's output
+    by_date = long.groupby(level='Date')
+    out = pd.DataFrame(index=long.index)
+    for column in cs.DEFAULT_COLUMNS:
+        out[f'{column}_CS_Rank'] = by_date[column].rank(pct=True)
+        out[f'{column}_CS_ZScore'] = by_date[column].transform(lambda x: (x - x.mean()) / x.std() if x.std() > 0 else x * np.nan)
+    out['Sector_Relative_Return'] = long['Daily_Return'] - long.groupby([long.index.get_level_values('Date'),
+                                                                          long.index.get_level_values('Ticker').map(sectors)])['Daily_Return'].transform('mean')
+
+    close = panel['Close']
+    spy_own = close['SPY'].dropna()
+    spy_regime = regime(spy_own / spy_own.shift(1) - 1)
+    columns = {}
+    for ticker, frame in frames.items():
+        dates = pd.DatetimeIndex(frame['Date']) # the ticker's own bars
+        own, spy, qqq = (close[name].reindex(dates) for name in (ticker, 'SPY', 'QQQ'))
+        returns = features['Daily_Return'][ticker].reindex(dates)
+        market = (spy / spy.shift(1) - 1).where(returns.notna())
+        ticker_return = own / own.shift(20)
+        columns[ticker] = pd.DataFrame({
+            'Relative_Strength_SPY_20': ticker_return / (spy / spy.shift(20)) - 1,
+            'Relative_Strength_QQQ_20': ticker_return / (qqq / qqq.shift(20)) - 1,
+            'Beta_SPY_60': returns.rolling(60).cov(market, ddof=0) / market.rolling(60).var(ddof=0),
+            'Correlation_SPY_60': returns.rolling(60).corr(market),
+            'Volatility_Regime': regime(returns),
+            'Market_Volatility_Regime': spy_regime.reindex(dates),
+        })
+    rolling = pd.concat(columns, names=['Ticker', 'Date']).swaplevel().reindex(out.index)
+    return pd.concat([out, rolling], axis=1)
+
+def regime(returns):
+    ratio = returns.rolling(20).std() / returns.rolling(250, min_periods=60).std()
+    return pd.Series(np.where(ratio < 0.8, 0.0, np.where(ratio > 1.25, 2.0, 1.0)), index=returns.index).where(ratio.notna())
+
+def main(n_tickers=500, n_rows=1500):
+    frames = synthetic_universe(n_tickers, n_rows)
+    frames['SPY'] = synthetic_ohlcv(n_rows, seed=10_000)
+    frames['QQQ'] = synthetic_ohlcv(n_rows, seed=10_001)
+    sectors = {ticker: SECTORS[i % len(SECTORS)] for i, ticker in enumerate(frames) if i % 10} # some tickers have no sector
+    panel = fe.make_panel(frames)
+    features = fe.compute_panel_features(panel)
+
+    start = time.perf_counter()
+    result = cs.cross_sectional_features(panel, features, sectors=sectors)
+    stage = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = reference(frames, panel, features, sectors)
+    naive = time.perf_counter() - start
+
+    got = result.stack(level=1, future_stack=True).rename_axis(['Date', 'Ticker']).reindex(expected.index)
+    for name in expected.columns:
+        a, b = got[name].to_numpy(), expected[name].to_numpy()
+        assert (np.isnan(a) == np.isnan(b)).all(), f"{name}: NaN positions differ"
+        error = np.nanmax(np.abs(a - b)) if np.isfinite(a).any() else 0.0
+        tolerance = 1e-9 if name.endswith(('_ZScore', '_60', 'Sector_Relative_Return')) else 0.0
+        assert error <= tolerance, f"{name}: max error {error:.3e}"
+    betas = got['Beta_SPY_60'].notna().groupby(level='Ticker').sum()
+    bars = pd.Series({ticker: len(frame) for ticker, frame in frames.items()})
+    assert (betas == bars.reindex(betas.index) - 60).all(), "a missing bar cost more than its own row"
+    print(f"{len(frames)} tickers x {n_rows} rows ({len(expected):,} bars), {len(expected.columns)} features match the reference")
+    print(f"{'vectorized stage':18s} {stage:8.3f}s")
+    print(f"{'long-format pandas':18s} {naive:8.3f}s")
+    print(f"speedup:           {naive / stage:8.2f}x")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,98 @@
+# Check of the incremental downloader in src/data_collection.py against an in-memory provider (LocalProvider, no network).
+#   - interrupted run: one ticker keeps failing after its retries and another fails once and succeeds on a retry; the others are
+#     stored and checkpointed, and a resumed run only fetches the failed ticker, then removes the checkpoint
+#   - updates re-fetch the last OVERLAP_ROWS stored bars (not the day after the watermark); when the provider re-adjusted the past
+#     (a 2:1 split), the full history is rewritten with the new prices instead of appending a fake jump
+#   - minute bars update without gaps or duplicated bars
+# Every store must end up identical to the provider's frames. It also times an up-to-date run and a rewrite.
+# Run from the repo root: python benchmarks/bench_download.py [n_tickers] [n_rows]
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import data_collection as dc
+import storage
+from bench_suite import synthetic_bars
+
+def quiet_download(*args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()): # download() prints one line per ticker
+        return dc.download(*args, rate=1e9, backoff=0.0, **kwargs)
+
+def stale_store(root, frames, rows):
+    shutil.rmtree(root, ignore_errors=True)
+    for ticker, df in frames.items():
+        storage.write_partition(df.iloc[:rows].reset_index(drop=True), root, ticker)
+
+def assert_store(root, frames):
+    for ticker, df in frames.items():
+        pd.testing.assert_frame_equal(storage.read_partition(root, ticker), df.reset_index(drop=True), check_exact=True)
+
+def end_of(frames):
+    return (max(df['Date'].iloc[-1] for df in frames.values()) + pd.Timedelta(days=1)).date().isoformat()
+
+def main(n_tickers=20, n_rows=2_000):
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        frames = {f'T{i:03d}': synthetic_bars(n_rows, seed=i) for i in range(n_tickers)}
+        tickers, end = list(frames), end_of(frames)
+        root = tmp / 'raw'
+        stale_store(root, frames, n_rows - 50)
+
+        # interrupted run, then a resume
+        provider = dc.LocalProvider(frames, failures={tickers[0]: 10, tickers[1]: 1})
+        result = quiet_download(tickers, end_date=end, provider=provider, root=str(root), max_retries=2)
+        assert list(result['failed']) == [tickers[0]], result['failed']
+        assert os.path.exists(root / dc.CHECKPOINT_FILE)
+        assert_store(root, {ticker: df for ticker, df in frames.items() if ticker != tickers[0]})
+        watermark_row = frames[tickers[2]].iloc[n_rows - 50 - dc.OVERLAP_ROWS]['Date'].date().isoformat()
+        assert (tickers[2], watermark_row, end) in provider.calls, "an update must re-fetch the last stored bars"
+        provider = dc.LocalProvider(frames)
+        result = quiet_download(tickers, end_date=end, provider=provider, root=str(root))
+        assert not result['failed'] and [call[0] for call in provider.calls] == [tickers[0]], provider.calls
+        assert not os.path.exists(root / dc.CHECKPOINT_FILE)
+        assert_store(root, frames)
+        print(f"{n_tickers} tickers: interrupted run, retry and resume leave the store identical to the provider")
+
+        # the provider re-adjusted the past: a 2:1 split 20 bars before the end of the new data
+        split = n_rows - 20
+        adjusted = {}
+        for ticker, df in frames.items():
+            df = df.copy()
+            df.loc[:split - 1, ['Close', 'High', 'Low', 'Open']] /= 2
+            df.loc[:split - 1, 'Volume'] *= 2
+            adjusted[ticker] = df
+        stale_store(root, frames, n_rows - 50)
+        start = time.perf_counter()
+        result = quiet_download(tickers, end_date=end, provider=dc.LocalProvider(adjusted), root=str(root))
+        rewrite_seconds = time.perf_counter() - start
+        assert result['rows'] == {ticker: 50 for ticker in tickers}, result['rows']
+        assert_store(root, adjusted)
+        start = time.perf_counter()
+        result = quiet_download(tickers, end_date=end, provider=dc.LocalProvider(adjusted), root=str(root))
+        current_seconds = time.perf_counter() - start
+        assert sum(result['rows'].values()) == 0
+        assert_store(root, adjusted)
+        print("changed overlap (split re-adjustment): full history rewritten, no price jump stored")
+
+        # intraday bars: the watermark is a timestamp inside a session
+        minutes = {ticker: synthetic_bars(n_rows, seed=i, frequency='minute') for i, ticker in enumerate(tickers[:3])}
+        stale_store(tmp / 'minute', minutes, n_rows - 100)
+        quiet_download(list(minutes), end_date=end_of(minutes), provider=dc.LocalProvider(minutes), root=str(tmp / 'minute'))
+        assert_store(tmp / 'minute', minutes)
+        print("minute bars: updated without gaps or duplicates")
+
+        print(f"{'up-to-date run':30s} {current_seconds:8.3f}s for {n_tickers} tickers")
+        print(f"{'rewrite after a split':30s} {rewrite_seconds:8.3f}s for {n_tickers} tickers")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,78 @@
+# Benchmark: fused FeaturePlan (build_features today) vs. the old chain of DataFrame helpers.
+# Run from the repo root: python benchmarks/bench_feature_plan.py [n_tickers] [n_rows]
+# It also checks that both paths give bit-for-bit identical frames before printing the timings.
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+
+def synthetic_ohlcv(n_rows, seed):
+    '''
+    Function to generate a random-walk OHLCV frame with the same columns yfinance gives us.
+    :param n_rows: Number of daily bars.
+    :param seed: Seed for the random generator.
+    :return: DataFrame with Date, Close, High, Low, Open and Volume columns.
+    '''
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_rows)))
+    flat = rng.integers(1, n_rows, n_rows // 50)
+    close[flat] = close[flat - 1] # a few unchanged closes so OBV sees zero price changes too
+    return pd.DataFrame({
+        'Date': pd.bdate_range('2000-01-03', periods=n_rows),
+        'Close': close,
+        'High': close * (1 + rng.uniform(0, 0.02, n_rows)),
+        'Low': close * (1 - rng.uniform(0, 0.02, n_rows)),
+        'Open': close * (1 + rng.normal(0, 0.01, n_rows)),
+        'Volume': rng.integers(1_000_000, 50_000_000, n_rows),
+    })
+
+def chained_features(df):
+    '''
+    The helper chain build_features used before the fused plan (kept here as the reference implementation).
+    '''
+    df = fe.get_target_variable(df)
+    df = fe.daily_returns(df)
+    df = fe.price_relative_to_ma(df, window=20)
+    df = fe.price_relative_to_ma(df, window=50)
+    df = fe.multi_day_returns(df, n_days=10)
+    df = fe.relative_strength_index(df, window=14)
+    df = fe.moving_average_convergence_divergence(df, short_window=12, long_window=26, signal_window=9)
+    df = fe.bollinger_normalized(df, window=20)
+    df = fe.volume_ratio(df, window=20)
+    df = fe.on_balance_volume(df)
+    df = fe.obv_rate_of_change(df, window=20)
+    return fe.drop_nans_warmup(df)
+
+def best_of(func, frames, repeat=3):
+    '''
+    Function to time func over every frame and keep the best of `repeat` runs.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for df in frames:
+            func(df.copy())
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main(n_tickers=200, n_rows=2500):
+    frames = [synthetic_ohlcv(n_rows, seed) for seed in range(n_tickers)]
+
+    for df in frames[:20]:
+        pd.testing.assert_frame_equal(chained_features(df.copy()), fe.compute_features(df.copy()), check_exact=True)
+    print(f"bit-for-bit check passed on {min(n_tickers, 20)} tickers")
+
+    chained = best_of(chained_features, frames)
+    fused = best_of(fe.compute_features, frames)
+    print(f"{n_tickers} tickers x {n_rows} rows")
+    print(f"chained helpers: {chained:8.3f}s  ({chained / n_tickers * 1000:.2f} ms/ticker)")
+    print(f"fused plan:      {fused:8.3f}s  ({fused / n_tickers * 1000:.2f} ms/ticker)")
+    print(f"speedup:         {chained / fused:8.2f}x")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+# Startup benchmark: importing the feature library must not do any I/O or pull in optional dependencies, and must stay
+# within a fixed budget on top of pandas/numpy (which any process using it already pays for). Every probe imports pandas and
+# numpy first and only times the library import after them, in the same process, so the figure is the library's own cost
+# rather than the difference of two noisy interpreter startups.
+# Run from the repo root: python benchmarks/bench_import_time.py [budget_ms] [repeats]
+# Exits with status 1 when the budget is exceeded or a lazily imported module is loaded at import time.
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+BUDGET_MS = 50.0 # import cost of feature_engineering after 'import pandas, numpy' ran in the same process
+LAZY_MODULES = ['ta', 'yfinance', 'storage', 'feature_cache', 'streaming_indicators'] # must not be loaded by the import
+
+PROBE = '''
+import json, os, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import pandas, numpy
+setup = time.perf_counter() - start
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'setup_seconds': setup, 'seconds': elapsed, 'modules': sorted(sys.modules), 'files': sorted(os.listdir('.'))}}))
+'''
+
+def import_time(statement, cwd):
+    '''
+    Function to time an import statement in a fresh interpreter, after pandas and numpy are imported there.
+    :param statement: Python code to time.
+    :param cwd: Working directory of the child process (an empty folder, to check that nothing is written).
+    :return: Dictionary with 'setup_seconds' (import pandas, numpy), 'seconds' (the statement alone), 'modules' (loaded after
+             the statement) and 'files' (in cwd afterwards).
+    '''
+    probe = PROBE.format(src=str(SRC), statement=statement)
+    output = subprocess.run([sys.executable, '-c', probe], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def median_ms(statement, cwd, repeats):
+    runs = [import_time(statement, cwd) for _ in range(repeats)]
+    return (statistics.median(run['seconds'] for run in runs) * 1e3, statistics.median(run['setup_seconds'] for run in runs) * 1e3,
+            runs[-1])
+
+def main(budget_ms=BUDGET_MS, repeats=7):
+    with tempfile.TemporaryDirectory() as cwd:
+        library_ms, baseline_ms, run = median_ms('import feature_engineering', cwd, repeats)
+        streaming_ms, _, _ = median_ms('import streaming_indicators', cwd, repeats)
+
+    loaded = [name for name in LAZY_MODULES if name in run['modules']]
+    print(f"{'import pandas, numpy':32s} {baseline_ms:8.1f} ms")
+    print(f"{'+ feature_engineering':32s} {library_ms:8.1f} ms (budget {budget_ms:.0f} ms)")
+    print(f"{'+ streaming_indicators':32s} {streaming_ms:8.1f} ms")
+
+    failures = []
+    if library_ms > budget_ms:
+        failures.append(f"importing feature_engineering costs {library_ms:.1f} ms, over the {budget_ms:.0f} ms budget")
+    if loaded:
+        failures.append(f"modules that should be imported lazily were loaded: {', '.join(loaded)}")
+    if run['files']:
+        failures.append(f"importing feature_engineering wrote files: {', '.join(run['files'])}")
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    raise SystemExit(main(float(args[0]) if args else BUDGET_MS, int(args[1]) if len(args) > 1 else 7))
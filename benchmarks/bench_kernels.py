@@ -0,0 +1,142 @@
+# Micro-benchmarks and validation of the native kernels in src/kernels.py against what the helpers used before:
+# ta's RSIIndicator, Series/DataFrame.rolling(...).mean()/.std() and .ewm(..., adjust=False).mean().
+# Every kernel must match its reference to 1e-12 (relative) on series with gaps, flat stretches and late listings; the rolling
+# std is checked against an exact two-pass reference in extended precision instead, because pandas' running sums drift away
+# from it (the drift is printed).
+# The scalar loops of the numba backend are checked too (in plain Python on a short slice when numba isn't installed).
+# Kernels that FeatureArrays uses instead of pandas on a backend (kernels.replaces_pandas) must give pandas' exact bits there.
+# The timings run on every backend that is available (numpy always, numba when installed: pip install -e ".[fast]").
+# Run from the repo root: python benchmarks/bench_kernels.py [n_rows] [n_series]
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import kernels
+
+TOLERANCE = 1e-12
+KERNEL_NAMES = {'ema_12': 'ema', 'wilder_14': 'wilder', 'rolling_mean_20': 'rolling_mean', 'rolling_mean_50': 'rolling_mean',
+                'rolling_mean_20_min5': 'rolling_mean', 'rolling_std_20': 'rolling_std', 'rsi_14': 'rsi'}
+
+def synthetic_closes(n_rows, n_series, seed=0, gaps=True):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_rows, n_series)), axis=0))
+    if gaps:
+        close[rng.random(close.shape) < 0.02] = np.nan # missing bars
+        close[:rng.integers(0, n_rows // 10), 0] = np.nan # late listing
+        close[n_rows // 3:n_rows // 3 + 60, -1] = close[n_rows // 3, -1] # flat stretch (constant windows)
+    return close
+
+def relative_error(values, reference):
+    values, reference = np.asarray(values, dtype=np.float64), np.asarray(reference, dtype=np.float64)
+    if not np.array_equal(np.isnan(values), np.isnan(reference)):
+        return np.inf
+    finite = ~np.isnan(reference)
+    if not finite.any():
+        return 0.0
+    return float(np.max(np.abs(values[finite] - reference[finite]) / np.maximum(np.abs(reference[finite]), 1e-300)))
+
+def exact_rolling_std(x, window):
+    '''
+    Two-pass rolling standard deviation in extended precision, NaN when the window has a missing value.
+    '''
+    padded = np.vstack([np.full((window - 1, x.shape[1]), np.nan), x]).astype(np.longdouble)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    deviations = windows - windows.mean(axis=-1, keepdims=True)
+    return np.sqrt((deviations * deviations).sum(axis=-1) / (window - 1)).astype(np.float64)
+
+def references():
+    return {
+        'ema_12': (lambda v: kernels.ema(v, span=12), lambda v: pd.DataFrame(v).ewm(span=12, adjust=False).mean().to_numpy()),
+        'wilder_14': (lambda v: kernels.wilder(v, 14),
+                      lambda v: pd.DataFrame(v).ewm(alpha=1 / 14, min_periods=14, adjust=False).mean().to_numpy()),
+        'rolling_mean_20': (lambda v: kernels.rolling_mean(v, 20), lambda v: pd.DataFrame(v).rolling(20).mean().to_numpy()),
+        'rolling_mean_50': (lambda v: kernels.rolling_mean(v, 50), lambda v: pd.DataFrame(v).rolling(50).mean().to_numpy()),
+        'rolling_mean_20_min5': (lambda v: kernels.rolling_mean(v, 20, 5),
+                                 lambda v: pd.DataFrame(v).rolling(20, min_periods=5).mean().to_numpy()),
+        'rolling_std_20': (lambda v: kernels.rolling_std(v, 20), lambda v: exact_rolling_std(v, 20)),
+        'rsi_14': (lambda v: kernels.rsi(v, 14),
+                   lambda v: np.column_stack([RSIIndicator(pd.Series(v[:, j]), 14).rsi().to_numpy() for j in range(v.shape[1])])),
+    }
+
+def validate(x, label):
+    failures = []
+    for name, (kernel, reference) in references().items():
+        for gaps in (True, False):
+            values = x if gaps else np.nan_to_num(x, nan=100.0)
+            result, expected = kernel(values), reference(values)
+            error = relative_error(result, expected)
+            if error > TOLERANCE:
+                failures.append(f"{label} {name} ({'gaps' if gaps else 'no gaps'}): {error:.1e}")
+            if kernels.replaces_pandas(KERNEL_NAMES[name]) and not np.array_equal(result, expected, equal_nan=True):
+                failures.append(f"{label} {name} ({'gaps' if gaps else 'no gaps'}): used by build_features but not bit-identical to pandas")
+    pandas_drift = np.nanmax(np.abs(pd.DataFrame(x).rolling(20).std().to_numpy() - exact_rolling_std(x, 20)))
+    exact = sorted({kernel for kernel in KERNEL_NAMES.values() if kernels.replaces_pandas(kernel)})
+    print(f"{label:6s} backend: all kernels within {TOLERANCE:.0e} of ta/pandas ({'FAILED' if failures else 'ok'}); "
+          f"pandas rolling std is off the exact value by up to {pandas_drift:.1e}; "
+          f"build_features uses {', '.join(exact) if exact else 'no kernel (pandas is faster or the bits differ)'}")
+    return failures
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def time_kernels(n_rows, n_series):
+    for rows, series in ((n_rows, 1), (n_rows, n_series)):
+        x = synthetic_closes(rows, series, seed=1, gaps=False)
+        df = pd.DataFrame(x)
+        column = df[0]
+        benchmarks = {
+            'rsi_14': (lambda: kernels.rsi(x, 14), lambda: [RSIIndicator(df[j], 14).rsi() for j in df.columns], 'ta RSIIndicator per series'),
+            'ema_12': (lambda: kernels.ema(x, span=12), lambda: df.ewm(span=12, adjust=False).mean(), 'pandas ewm'),
+            'rolling_mean_20': (lambda: kernels.rolling_mean(x, 20), lambda: df.rolling(20).mean(), 'pandas rolling mean'),
+            'rolling_std_20': (lambda: kernels.rolling_std(x, 20), lambda: df.rolling(20).std(), 'pandas rolling std'),
+            'rsi_14 (helper)': (lambda: kernels.rsi(x[:, 0], 14), lambda: RSIIndicator(column, 14).rsi(), 'one Series through ta'),
+        }
+        print(f"{rows} rows x {series} series")
+        for name, (kernel, current, label) in benchmarks.items():
+            if name.endswith('(helper)') and series != 1:
+                continue
+            kernel_seconds, current_seconds = best_of(kernel), best_of(current, repeat=1 if series > 1 and 'ta' in label else 5)
+            print(f"  {name:18s} kernel {kernel_seconds * 1e3:9.3f} ms   {label:28s} {current_seconds * 1e3:9.3f} ms   "
+                  f"{current_seconds / kernel_seconds:6.2f}x")
+
+def main(n_rows=2500, n_series=500):
+    failures = []
+    x = synthetic_closes(n_rows, 8)
+    kernels._resolved.clear()
+    kernels.BACKEND = 'numpy'
+    failures += validate(x, 'numpy')
+    kernels._resolved.clear()
+    kernels.BACKEND = 'auto'
+    if kernels._backend() == 'numba':
+        failures += validate(x, 'numba')
+    else:
+        kernels._resolved['auto'] = 'numba' # runs the scalar loops as plain Python, on a short slice because they are slow there
+        failures += validate(x[:400, :4], 'loops')
+    kernels._resolved.clear()
+
+    for backend in ('numpy', 'numba'):
+        kernels.BACKEND = backend
+        try:
+            kernels._backend()
+        except ImportError:
+            continue
+        print(f"\nbackend: {backend}")
+        time_kernels(n_rows, n_series)
+    kernels.BACKEND = 'auto'
+
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main(*(int(arg) for arg in sys.argv[1:])))
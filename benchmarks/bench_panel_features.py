@@ -0,0 +1,64 @@
+# Benchmark: panel mode (every ticker in one pass) vs. build_features once per ticker + combine_datasets.
+# Run from the repo root: python benchmarks/bench_panel_features.py [n_tickers] [n_rows]
+# Tickers get staggered listing dates and random missing bars, and every path must give identical long frames: the per-ticker
+# loop, compute_panel_long (straight from the packed arrays) and compute_panel_features + panel_to_long (the date-aligned
+# features the cross-sectional mode needs). Each path is timed best of `repeat` runs, and the check fails if compute_panel_long
+# isn't at least MIN_SPEEDUP times faster than the loop (with enough tickers for the panel to pay off).
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+from bench_feature_plan import synthetic_ohlcv
+
+def synthetic_universe(n_tickers, n_rows):
+    '''
+    Function to generate tickers that don't share the same dates: each one lists up to a year late and misses ~1% of its bars.
+    :return: Dictionary mapping ticker -> raw DataFrame.
+    '''
+    rng = np.random.default_rng(42)
+    frames = {}
+    for i in range(n_tickers):
+        df = synthetic_ohlcv(n_rows, seed=i)
+        df = df.iloc[rng.integers(0, 250):] # late listing
+        df = df[rng.random(len(df)) > 0.01] # missing bars
+        frames[f'T{i:04d}'] = df.reset_index(drop=True)
+    return frames
+
+MIN_SPEEDUP = 1.5
+
+def per_ticker(frames):
+    return fe.combine_datasets([fe.compute_features(df.copy()) for df in frames.values()], list(frames))
+
+def panel(frames):
+    return fe.compute_panel_long(fe.make_panel(frames))
+
+def panel_date_aligned(frames):
+    p = fe.make_panel(frames)
+    return fe.panel_to_long(p, fe.compute_panel_features(p))
+
+def main(n_tickers=500, n_rows=2500, repeat=3):
+    frames = synthetic_universe(n_tickers, n_rows)
+    timings = {}
+    results = {}
+    for name, func in (('per-ticker loop', per_ticker), ('panel', panel), ('panel, date-aligned', panel_date_aligned)):
+        timings[name] = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name] = func(frames)
+            timings[name] = min(timings[name], time.perf_counter() - start)
+    for name in ('panel', 'panel, date-aligned'):
+        pd.testing.assert_frame_equal(results['per-ticker loop'], results[name], check_exact=True)
+    print(f"{n_tickers} tickers x {n_rows} rows, outputs identical")
+    for name, seconds in timings.items():
+        print(f"{name:20s} {seconds:8.3f}s ({timings['per-ticker loop'] / seconds:.2f}x)")
+    speedup = timings['per-ticker loop'] / timings['panel']
+    if n_tickers >= 100 and speedup < MIN_SPEEDUP:
+        raise SystemExit(f"panel mode is only {speedup:.2f}x faster than the per-ticker loop (expected at least {MIN_SPEEDUP}x)")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,49 @@
+# Benchmark: serial feature pipeline vs. src/pipeline.py with 1, 2, 4, ... worker processes (up to the number of CPUs).
+# Every run must write byte-identical partitions and return the same combined frame as the serial path.
+# Run from the repo root: python benchmarks/bench_pipeline.py [n_tickers] [n_rows]
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+import pipeline
+import storage
+from bench_feature_plan import synthetic_ohlcv
+
+def read_bytes(root, tickers):
+    return [Path(storage.partition_path(root, ticker)).read_bytes() for ticker in tickers]
+
+def main(n_tickers=400, n_rows=2500):
+    tmp = Path(tempfile.mkdtemp())
+    tickers = [f'T{i:04d}' for i in range(n_tickers)]
+    try:
+        for i, ticker in enumerate(tickers):
+            storage.write_partition(synthetic_ohlcv(n_rows, seed=i), tmp / 'raw', ticker)
+
+        start = time.perf_counter()
+        serial = [fe.build_features(storage.read_partition(tmp / 'raw', ticker), ticker, root=tmp / 'serial') for ticker in tickers]
+        serial_seconds = time.perf_counter() - start
+        expected_frame = fe.combine_datasets(serial, tickers)
+        expected_bytes = read_bytes(tmp / 'serial', tickers)
+        print(f"{n_tickers} tickers x {n_rows} rows, serial loop {serial_seconds:.2f}s")
+
+        counts = sorted({1, *[2 ** k for k in range(1, 8) if 2 ** k <= (os.cpu_count() or 1)], os.cpu_count() or 1})
+        for workers in counts:
+            root = tmp / f'workers_{workers}'
+            report, combined = pipeline.run_pipeline(tickers, tmp / 'raw', root, workers=workers, collect=True)
+            pd.testing.assert_frame_equal(combined, expected_frame, check_exact=True)
+            assert read_bytes(root, tickers) == expected_bytes, "partitions differ from the serial path"
+            stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in report['stages'].items())
+            print(f"{workers:3d} workers {report['wall']:7.2f}s  speedup {serial_seconds / report['wall']:5.2f}x  "
+                  f"efficiency {serial_seconds / report['wall'] / workers:5.0%}  ({stages})")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
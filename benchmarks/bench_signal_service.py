@@ -0,0 +1,185 @@
+# Benchmark and end-to-end check of src/signal_service.py.
+# Builds a raw store (one ticker listed late, so its history is shorter, and two tickers that miss a session: one during the
+# warm-up history, one in the live sessions 5 sessions before the end), warms the service up on all but the last sessions,
+# then feeds those sessions through the local HTTP API and measures the latency of every endpoint (p50/p99, and per symbol).
+# Checks along the way:
+#   - after every session, each ticker's features are identical to the batch FeaturePlan on that ticker's own history, and the
+#     probabilities are the model's predict_proba on those features (to 1e-12: a batched matrix product rounds differently);
+#     a ticker without a bar in the session has null features and no probability
+#   - a replayed session is refused (409) and leaves the state untouched
+#   - orders go through the fake broker and its positions match the signals, and a slow broker doesn't hold up ingests
+#   - a service restarted from its saved state serves the same signals and keeps producing the same features
+# Run from the repo root: python benchmarks/bench_signal_service.py [n_tickers] [n_rows] [n_sessions]
+import http.client
+import json
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+import signal_service
+import storage
+from bench_feature_plan import synthetic_ohlcv
+
+def percentiles(timings):
+    timings = np.asarray(timings) * 1e3
+    return f"p50 {np.percentile(timings, 50):7.3f} ms  p99 {np.percentile(timings, 99):7.3f} ms"
+
+def request(connection, method, path, body=None):
+    start = time.perf_counter()
+    connection.request(method, path, body=None if body is None else json.dumps(body), headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    return response.status, payload, time.perf_counter() - start
+
+def expected_signals(frames, tickers, end, model):
+    '''
+    Function to compute the last session's features of every ticker with the batch FeaturePlan on its own history up to `end`.
+    :return: Dictionary mapping ticker -> (features dictionary, probability).
+    '''
+    expected = {}
+    for ticker in tickers:
+        history = frames[ticker][frames[ticker]['Date'] <= end]
+        if history.empty or history['Date'].iloc[-1] != end: # no bar in this session
+            expected[ticker] = ({name: np.nan for name in signal_service.MODEL_FEATURES}, None)
+            continue
+        features = fe.DEFAULT_FEATURE_PLAN.compute(history['Close'].to_numpy(), history['Volume'].to_numpy())
+        row = {name: features[name][-1] for name in signal_service.MODEL_FEATURES}
+        x = np.array([[row[name] for name in signal_service.MODEL_FEATURES]])
+        expected[ticker] = (row, model.predict_proba(x)[0, 1] if np.isfinite(x).all() else None)
+    return expected
+
+def check_signals(payload, expected):
+    for ticker, (row, probability) in expected.items():
+        signal = payload['signals'][ticker]
+        for name, value in row.items():
+            got = signal['features'][name]
+            assert (got is None and not np.isfinite(value)) or got == value, (ticker, name, got, value)
+        if probability is None:
+            assert signal['probability'] is None, ticker
+        else:
+            assert abs(signal['probability'] - probability) < 1e-12, (ticker, signal['probability'], probability)
+
+class SlowBroker(signal_service.FakeBroker):
+    '''
+    Fake broker whose positions take a network round-trip; `called` is set once a rebalance reached it.
+    '''
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.called = threading.Event()
+
+    def get_positions(self):
+        self.called.set()
+        time.sleep(self.delay)
+        return super().get_positions()
+
+def check_slow_broker(state_path, model, date, close, volume, delay=0.5):
+    '''
+    Function to check that an ingest doesn't wait for a rebalance that is waiting on the broker.
+    '''
+    service = signal_service.SignalService.from_state(state_path, model, broker=SlowBroker(delay))
+    rebalance = threading.Thread(target=service.rebalance, kwargs={'threshold': 0.0})
+    rebalance.start()
+    service.broker.called.wait()
+    start = time.perf_counter()
+    service.ingest_arrays(date, close, volume, save=False)
+    seconds = time.perf_counter() - start
+    rebalance.join()
+    assert seconds < delay / 2, f"ingest waited {seconds:.2f}s for the broker"
+    print(f"ingest during a rebalance on a {delay}s broker: {seconds * 1e3:.2f} ms")
+
+def main(n_tickers=500, n_rows=1500, n_sessions=20):
+    tickers = [f'T{i:04d}' for i in range(n_tickers)]
+    frames = {ticker: synthetic_ohlcv(n_rows, seed=i) for i, ticker in enumerate(tickers)}
+    frames[tickers[0]] = frames[tickers[0]].iloc[n_rows // 2:].reset_index(drop=True) # listed late
+    dates = frames[tickers[1]]['Date']
+    cutoff = dates.iloc[-n_sessions - 1] # the service warms up to here, the rest arrives through the API
+    for ticker, missing in ((tickers[2], dates.iloc[-n_sessions - 30]), (tickers[3], dates.iloc[-5])): # halted for one session
+        frames[ticker] = frames[ticker][frames[ticker]['Date'] != missing].reset_index(drop=True)
+
+    rng = np.random.default_rng(0)
+    model = signal_service.LogisticModel(rng.normal(0, 0.1, len(signal_service.MODEL_FEATURES)), 0.0, signal_service.MODEL_FEATURES)
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        for ticker, df in frames.items():
+            storage.write_partition(df[df['Date'] <= cutoff].reset_index(drop=True), tmp / 'raw', ticker)
+        (tmp / 'model.pkl').write_bytes(pickle.dumps(model))
+
+        start = time.perf_counter()
+        broker = signal_service.FakeBroker()
+        service = signal_service.SignalService.from_store(tickers, signal_service.load_model(tmp / 'model.pkl'), tmp / 'raw',
+                                                          broker=broker, state_path=str(tmp / 'state.npz'))
+        print(f"{n_tickers} tickers x {n_rows} bars, warm-up {time.perf_counter() - start:.2f}s")
+        check_signals(json.loads(service.snapshot.encoded()), expected_signals(frames, tickers, cutoff, model))
+
+        server = signal_service.serve(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        connection = http.client.HTTPConnection(*server.server_address)
+        timings = {'POST /bars': [], 'GET /signals': [], 'GET /signals/<ticker>': [], 'GET /health': []}
+        try:
+            for date in dates[dates > cutoff]:
+                bars = {ticker: {'Close': float(df.loc[df['Date'] == date, 'Close'].iloc[0]),
+                                 'Volume': int(df.loc[df['Date'] == date, 'Volume'].iloc[0])}
+                        for ticker, df in frames.items() if (df['Date'] == date).any()}
+                status, payload, seconds = request(connection, 'POST', '/bars', {'date': date.isoformat(), 'bars': bars})
+                assert status == 200, payload
+                timings['POST /bars'].append(seconds)
+                check_signals(payload, expected_signals(frames, tickers, date, model))
+                for _ in range(5):
+                    timings['GET /signals'].append(request(connection, 'GET', '/signals')[2])
+                for ticker in tickers:
+                    status, payload, seconds = request(connection, 'GET', f'/signals/{ticker}')
+                    assert status == 200 and payload['date'] == date.isoformat()
+                    timings['GET /signals/<ticker>'].append(seconds)
+                timings['GET /health'].append(request(connection, 'GET', '/health')[2])
+
+            bars_before = service.streaming.bars
+            status, payload, _ = request(connection, 'POST', '/bars', {'date': date.isoformat(), 'bars': bars})
+            assert status == 409 and service.streaming.bars == bars_before, "a replayed session must be refused"
+            assert request(connection, 'GET', '/signals/NOPE')[0] == 404
+
+            status, payload, _ = request(connection, 'POST', '/orders', {'threshold': 0.55, 'notional': 10_000})
+            assert status == 200
+            snapshot = service.snapshot
+            bought = {order['ticker'] for order in payload['orders'] if order['side'] == 'buy'}
+            assert bought == {ticker for i, ticker in enumerate(tickers) if snapshot.probability[i] > 0.55}
+            assert request(connection, 'GET', '/positions')[1]['positions'] == broker.get_positions()
+            print(f"{len(payload['orders'])} orders filled by the fake broker")
+        finally:
+            connection.close()
+            server.shutdown()
+            server.server_close()
+
+        service.flush()
+        restarted = signal_service.SignalService.from_state(str(tmp / 'state.npz'), model)
+        assert restarted.snapshot.encoded() == service.snapshot.encoded(), "restarted service serves different signals"
+        assert restarted.last_date == service.last_date
+
+        ingest = []
+        for i in range(200): # in-process ingest on copies of the state (same bar, so every run does identical work)
+            copy = signal_service.SignalService.from_state(str(tmp / 'state.npz'), model)
+            close = np.array([bars[ticker]['Close'] for ticker in tickers]) * (1 + 0.001 * (i % 7))
+            volume = np.array([bars[ticker]['Volume'] for ticker in tickers], dtype=np.float64)
+            start = time.perf_counter()
+            copy.ingest_arrays(date + np.timedelta64(1, 'D'), close, volume, save=False)
+            ingest.append(time.perf_counter() - start)
+
+        check_slow_broker(str(tmp / 'state.npz'), model, date + np.timedelta64(1, 'D'), close, volume)
+        print(f"{'ingest (in-process)':24s} {percentiles(ingest)}  -> {np.percentile(ingest, 99) / n_tickers * 1e6:.2f} us/symbol at p99")
+        for name, values in timings.items():
+            per_symbol = f"  -> {np.percentile(values, 99) / n_tickers * 1e6:.2f} us/symbol at p99" if name in ('POST /bars', 'GET /signals') else ''
+            print(f"{name:24s} {percentiles(values)}{per_symbol}")
+        print("signals identical to the batch features after every session, also after missed sessions")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,66 @@
+# Benchmark: CSV files (what the pipeline used to write) vs. the Arrow IPC store in src/storage.py.
+# Run from the repo root: python benchmarks/bench_storage.py [n_tickers] [n_rows]
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+import storage
+from bench_feature_plan import synthetic_ohlcv
+
+def timed(label, func, results):
+    start = time.perf_counter()
+    value = func()
+    results[label] = time.perf_counter() - start
+    return value
+
+def main(n_tickers=50, n_rows=5000):
+    frames = {f'T{i:04d}': fe.compute_features(synthetic_ohlcv(n_rows, seed=i)) for i in range(n_tickers)}
+    tmp = Path(tempfile.mkdtemp())
+    results = {}
+    try:
+        def write_csv():
+            for ticker, df in frames.items():
+                df.to_csv(tmp / f'{ticker}_with_features.csv', index=False)
+        def read_csv():
+            return [pd.read_csv(tmp / f'{ticker}_with_features.csv', parse_dates=['Date']) for ticker in frames]
+        def read_csv_combined():
+            return fe.combine_datasets(read_csv(), list(frames))
+        def write_store():
+            for ticker, df in frames.items():
+                storage.write_partition(df, tmp / 'store', ticker)
+        def read_store():
+            return [storage.read_partition(tmp / 'store', ticker) for ticker in frames]
+        def read_store_pruned():
+            return [storage.read_partition(tmp / 'store', ticker, columns=['Date', 'RSI_14', 'Target']) for ticker in frames]
+        def read_store_combined():
+            return storage.read_dataset(tmp / 'store')
+
+        timed('csv write', write_csv, results)
+        timed('csv read (parse_dates)', read_csv, results)
+        timed('csv read + combine_datasets', read_csv_combined, results)
+        timed('store write', write_store, results)
+        stored = timed('store read', read_store, results)
+        timed('store read, 3 columns', read_store_pruned, results)
+        timed('store combined view', read_store_combined, results)
+
+        for ticker, df in zip(frames, stored):
+            pd.testing.assert_frame_equal(df, frames[ticker].reset_index(drop=True), check_exact=True) # the index isn't stored, same as to_csv(index=False)
+        csv_size = sum(path.stat().st_size for path in tmp.glob('*.csv'))
+        store_size = sum(path.stat().st_size for path in (tmp / 'store').rglob('*.arrow'))
+    finally:
+        shutil.rmtree(tmp)
+
+    print(f"{n_tickers} tickers x {n_rows} rows, store round-trip identical")
+    for label, seconds in results.items():
+        print(f"{label:30s} {seconds:8.3f}s")
+    print(f"{'csv size':30s} {csv_size / 1e6:8.1f} MB")
+    print(f"{'store size':30s} {store_size / 1e6:8.1f} MB")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,333 @@
+# Benchmark suite for the data and feature pipeline, meant to catch regressions between commits.
+# For every bar frequency (daily, minute) and universe size (1 to 10,000 tickers) it generates a synthetic OHLCV panel and times:
+#   - every indicator helper in feature_engineering.py on its own, compute_features and build_features (with the per-stage
+#     breakdown from build_features' profiling hook), combine_datasets in memory and into an Arrow file
+#   - CSV vs. columnar (storage.py) writes and reads, and data_collection.download from an in-memory provider (daily bars only)
+# Each case is timed `repeat` times (best and median are kept) and then run once more under tracemalloc for its peak traced
+# memory and the number/size of the allocations it leaves behind (caches, leaks); numpy and pandas buffers are included, pyarrow's
+# own buffers are not (see the process-wide peak RSS in the report for those).
+# Cases larger than --max-rows input rows are recorded as skipped, so the 10,000 ticker sizes only run when asked for.
+# The report is a JSON file keyed by '<frequency>/<tickers>/<case>' with sorted keys, so two reports diff cleanly, and
+# --baseline/--diff compare reports and exit with status 1 when a case got slower or bigger than --threshold.
+# Run from the repo root:
+#   python benchmarks/bench_suite.py [--tickers 1 10 100] [--frequency daily minute] [--output bench_suite.json]
+#   python benchmarks/bench_suite.py --tickers 1 10 100 1000 10000 --max-rows 50000000 --baseline old.json
+#   python benchmarks/bench_suite.py --diff old.json new.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+import data_collection
+import feature_engineering as fe
+import kernels
+import storage
+
+BARS_PER_SESSION = 390 # 09:30 to 16:00
+DEFAULT_ROWS = {'daily': 2520, 'minute': 10 * BARS_PER_SESSION} # ten years of daily bars, two weeks of minute bars
+
+# Every indicator helper with the parameters build_features uses; each is timed on a fresh copy of the raw frame
+# (obv_rate_of_change gets the OBV column it needs added beforehand, outside the timer).
+FEATURE_FUNCTIONS = [
+    ('get_target_variable', fe.get_target_variable, {}),
+    ('daily_returns', fe.daily_returns, {}),
+    ('multi_day_returns_10', fe.multi_day_returns, {'n_days': 10}),
+    ('simple_moving_average_20', fe.simple_moving_average, {'window': 20}),
+    ('price_relative_to_ma_20', fe.price_relative_to_ma, {'window': 20}),
+    ('price_relative_to_ma_50', fe.price_relative_to_ma, {'window': 50}),
+    ('relative_strength_index_14', fe.relative_strength_index, {'window': 14}),
+    ('moving_average_convergence_divergence', fe.moving_average_convergence_divergence, {}),
+    ('bollinger_bands_20', fe.bollinger_bands, {'window': 20}),
+    ('bollinger_normalized_20', fe.bollinger_normalized, {'window': 20}),
+    ('volume_sma_20', fe.volume_sma, {'window': 20}),
+    ('volume_ratio_20', fe.volume_ratio, {'window': 20}),
+    ('on_balance_volume', fe.on_balance_volume, {}),
+    ('obv_rate_of_change_20', fe.obv_rate_of_change, {'window': 20}),
+]
+
+def synthetic_bars(n_rows, seed, frequency='daily'):
+    '''
+    Function to generate a random-walk OHLCV frame with the same columns yfinance gives us.
+    :param n_rows: Number of bars.
+    :param seed: Seed for the random generator.
+    :param frequency: 'daily' (business days) or 'minute' (390 bars per business day from 09:30).
+    :return: DataFrame with Date, Close, High, Low, Open and Volume columns.
+    '''
+    rng = np.random.default_rng(seed)
+    volatility = 0.02 if frequency == 'daily' else 0.02 / np.sqrt(BARS_PER_SESSION)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, volatility, n_rows)))
+    flat = rng.integers(1, n_rows, n_rows // 50) if n_rows > 1 else np.array([], dtype=int)
+    close[flat] = close[flat - 1] # a few unchanged closes so OBV sees zero price changes too
+    if frequency == 'daily':
+        dates = pd.bdate_range('2000-01-03', periods=n_rows)
+        volume = rng.integers(1_000_000, 50_000_000, n_rows)
+    else:
+        sessions = pd.bdate_range('2020-01-02', periods=-(-n_rows // BARS_PER_SESSION))
+        minutes = pd.Timedelta(hours=9, minutes=30) + pd.to_timedelta(np.arange(BARS_PER_SESSION), unit='min')
+        dates = pd.DatetimeIndex((sessions.to_numpy()[:, None] + minutes.to_numpy()[None, :]).ravel()[:n_rows])
+        volume = rng.integers(1_000, 200_000, n_rows)
+    return pd.DataFrame({
+        'Date': dates,
+        'Close': close,
+        'High': close * (1 + rng.uniform(0, volatility, n_rows)),
+        'Low': close * (1 - rng.uniform(0, volatility, n_rows)),
+        'Open': close * (1 + rng.normal(0, volatility / 2, n_rows)),
+        'Volume': volume,
+    })
+
+def synthetic_panel(n_tickers, n_rows, frequency='daily'):
+    '''
+    Function to generate one synthetic frame per ticker.
+    :return: Dictionary mapping ticker -> DataFrame (see synthetic_bars).
+    '''
+    return {f'T{i:05d}': synthetic_bars(n_rows, seed=i, frequency=frequency) for i in range(n_tickers)}
+
+def measure(run, setup=None, repeat=3, memory=True):
+    '''
+    Function to time one benchmark case and measure its memory.
+    :param run: Callable doing the timed work; it gets the value returned by setup (or None).
+    :param setup: Optional callable run before every repetition, outside the timer (e.g. to empty an output folder).
+    :param repeat: Number of timed repetitions.
+    :param memory: Whether to run the case once more under tracemalloc.
+    :return: Dictionary with 'seconds' (best), 'seconds_median', 'repeat' and, with memory=True, 'peak_bytes' (peak traced memory
+             above what was allocated before the case), 'retained_bytes' and 'retained_blocks' (allocations still alive afterwards).
+    '''
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+    result = {'seconds': min(timings), 'seconds_median': statistics.median(timings), 'repeat': repeat}
+    if memory:
+        state = setup() if setup else None
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run(state) # the return value is dropped right away, so only what the case leaves behind (caches, leaks) is retained
+        _, peak = tracemalloc.get_traced_memory()
+        retained = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        tracemalloc.stop()
+        result['peak_bytes'] = peak - baseline
+        result['retained_bytes'] = int(sum(stat.size_diff for stat in retained))
+        result['retained_blocks'] = int(sum(stat.count_diff for stat in retained))
+    return result
+
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()): # download() prints one line per ticker
+        return func(*args, **kwargs)
+
+def run_cases(frames, frequency, tmp, repeat, memory):
+    '''
+    Function to run every benchmark case on one synthetic panel.
+    :param frames: Dictionary mapping ticker -> raw OHLCV DataFrame.
+    :param frequency: 'daily' or 'minute'.
+    :param tmp: Scratch folder for the files the cases write.
+    :return: Dictionary mapping case name -> measurement (see measure), with 'rows' and 'rows_per_sec' added.
+    '''
+    tickers = list(frames)
+    n_rows = sum(len(df) for df in frames.values())
+    cases = {}
+
+    def add(name, run, setup=None, rows=n_rows):
+        result = measure(run, setup, repeat, memory)
+        result['rows'] = rows
+        result['rows_per_sec'] = rows / result['seconds'] if result['seconds'] else 0.0
+        cases[name] = result
+        return result
+
+    def fresh(path):
+        def setup():
+            shutil.rmtree(path, ignore_errors=True)
+            return path
+        return setup
+
+    with_obv = {ticker: fe.on_balance_volume(df.copy()) for ticker, df in frames.items()}
+    for name, func, kwargs in FEATURE_FUNCTIONS:
+        inputs = with_obv if func is fe.obv_rate_of_change else frames
+        add(f'feature/{name}', lambda copies: [func(df, **kwargs) for df in copies],
+            setup=lambda inputs=inputs: [df.copy() for df in inputs.values()])
+
+    add('compute_features', lambda _: [fe.compute_features(df) for df in frames.values()])
+    profile = {}
+    def build(root):
+        stages = {}
+        built = [fe.build_features(df, ticker, root=root, profile=stages) for ticker, df in frames.items()]
+        if not tracemalloc.is_tracing(): # keeps the stages of the last timed repetition, not of the (slower) tracemalloc run
+            profile.update(stages)
+        return built
+    add('build_features', build, setup=fresh(tmp / 'features'))
+    cases['build_features']['stages'] = profile
+
+    features = [fe.compute_features(df) for df in frames.values()]
+    add('combine_datasets', lambda _: fe.combine_datasets(features, tickers))
+    add('combine_datasets_arrow', lambda path: fe.combine_datasets(features, tickers, output_path=path),
+        setup=lambda: str(tmp / 'combined.arrow'))
+
+    csv_dir = tmp / 'csv'
+    def write_csv(path):
+        path.mkdir(parents=True)
+        for ticker, df in frames.items():
+            df.to_csv(path / f'{ticker}.csv', index=False)
+    add('io/csv_write', write_csv, setup=fresh(csv_dir))
+    add('io/csv_read', lambda _: [pd.read_csv(csv_dir / f'{ticker}.csv', parse_dates=['Date']) for ticker in tickers])
+
+    raw_root = tmp / 'raw'
+    add('io/arrow_write', lambda root: [storage.write_partition(df, root, ticker) for ticker, df in frames.items()], setup=fresh(raw_root))
+    add('io/arrow_read', lambda _: [storage.read_partition(raw_root, ticker) for ticker in tickers])
+    add('io/arrow_read_dataset', lambda _: storage.read_dataset(raw_root))
+
+    if frequency == 'daily':
+        provider = data_collection.LocalProvider(frames)
+        end = (max(df['Date'].iloc[-1] for df in frames.values()) + pd.Timedelta(days=1)).date().isoformat()
+        start = min(df['Date'].iloc[0] for df in frames.values()).date().isoformat()
+        add('download', lambda root: _quiet(data_collection.download, tickers, start, end, provider, str(root), rate=1e9),
+            setup=fresh(tmp / 'download'))
+        # incremental run: the store already has everything but the last ~5% of bars, which download() fetches and appends
+        cutoff = {ticker: df['Date'].iloc[int(len(df) * 0.95)] for ticker, df in frames.items()}
+        def stale_store():
+            root = fresh(tmp / 'update')()
+            for ticker, df in frames.items():
+                storage.write_partition(df[df['Date'] < cutoff[ticker]].reset_index(drop=True), root, ticker)
+            return root
+        add('download_update', lambda root: _quiet(data_collection.download, tickers, start, end, provider, str(root), rate=1e9),
+            setup=stale_store, rows=sum(int((df['Date'] >= cutoff[ticker]).sum()) for ticker, df in frames.items()))
+    return cases
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    '''
+    Function to describe the code and machine a report was made on.
+    '''
+    import pyarrow
+
+    status = _git('status', '--porcelain', '--', 'src')
+    return {'commit': _git('rev-parse', 'HEAD'), 'dirty': bool(status) if status is not None else None,
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'pyarrow': pyarrow.__version__,
+            'kernels_backend': kernels._backend(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+def run_suite(tickers=(1, 10, 100), frequencies=('daily', 'minute'), rows=None, repeat=3, memory=True, max_rows=5_000_000):
+    '''
+    Function to run the benchmark cases for every frequency and universe size.
+    :param tickers: Universe sizes to benchmark.
+    :param frequencies: Bar frequencies to benchmark ('daily' and/or 'minute').
+    :param rows: Optional dictionary frequency -> bars per ticker (defaults to DEFAULT_ROWS).
+    :param repeat: Timed repetitions per case.
+    :param memory: Whether to also measure memory under tracemalloc.
+    :param max_rows: Panels with more input rows than this are skipped (and recorded as such).
+    :return: Report dictionary with 'environment', 'settings', 'cases' ('<frequency>/<tickers>/<case>' -> measurement) and
+             'max_rss_bytes'.
+    '''
+    rows = {**DEFAULT_ROWS, **(rows or {})}
+    report = {'environment': environment(),
+              'settings': {'tickers': list(tickers), 'frequencies': list(frequencies), 'rows': rows, 'repeat': repeat,
+                           'memory': memory, 'max_rows': max_rows},
+              'cases': {}}
+    for frequency in frequencies:
+        for n_tickers in tickers:
+            prefix = f'{frequency}/{n_tickers}'
+            if n_tickers * rows[frequency] > max_rows:
+                report['cases'][f'{prefix}/skipped'] = {'skipped': f"{n_tickers * rows[frequency]} rows is over --max-rows {max_rows}"}
+                print(f"{prefix}: skipped ({n_tickers * rows[frequency]} rows)")
+                continue
+            frames = synthetic_panel(n_tickers, rows[frequency], frequency)
+            tmp = Path(tempfile.mkdtemp())
+            try:
+                for name, result in run_cases(frames, frequency, tmp, repeat, memory).items():
+                    report['cases'][f'{prefix}/{name}'] = result
+                    print(f"{prefix + '/' + name:52s} {result['seconds'] * 1e3:10.2f} ms {result['rows_per_sec']:>14,.0f} rows/s"
+                          + (f" {result['peak_bytes'] / 2 ** 20:9.1f} MB peak" if memory else ''))
+            finally:
+                shutil.rmtree(tmp)
+    report['max_rss_bytes'] = max_rss_bytes()
+    return report
+
+def max_rss_bytes():
+    '''
+    Function to get the peak resident memory of this process so far (None where the resource module is missing, e.g. Windows).
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # bytes on macOS, kilobytes on Linux
+
+def diff_reports(old, new, threshold=0.2):
+    '''
+    Function to compare two reports case by case.
+    :param old: Baseline report (e.g. from the previous commit).
+    :param new: Report to check.
+    :param threshold: Relative increase in best time or peak memory that counts as a regression.
+    :return: List of regression messages (empty when nothing got worse).
+    '''
+    regressions = []
+    print(f"{'case':52s} {'old ms':>10s} {'new ms':>10s} {'time':>7s} {'memory':>7s}")
+    for case in sorted(set(old['cases']) & set(new['cases'])):
+        before, after = old['cases'][case], new['cases'][case]
+        if 'seconds' not in before or 'seconds' not in after:
+            continue
+        time_ratio = after['seconds'] / before['seconds'] if before['seconds'] else 1.0
+        memory_ratio = after['peak_bytes'] / before['peak_bytes'] if before.get('peak_bytes') and 'peak_bytes' in after else 1.0
+        print(f"{case:52s} {before['seconds'] * 1e3:10.2f} {after['seconds'] * 1e3:10.2f} {time_ratio:6.2f}x {memory_ratio:6.2f}x")
+        if time_ratio > 1 + threshold:
+            regressions.append(f"{case} is {time_ratio:.2f}x slower")
+        if memory_ratio > 1 + threshold:
+            regressions.append(f"{case} uses {memory_ratio:.2f}x the peak memory")
+    for case in sorted(set(old['cases']) ^ set(new['cases'])):
+        print(f"{case:52s} only in the {'old' if case in old['cases'] else 'new'} report")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data and feature pipeline on synthetic OHLCV panels.")
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 10, 100], help="universe sizes (up to 10000)")
+    parser.add_argument('--frequency', nargs='+', choices=['daily', 'minute'], default=['daily', 'minute'])
+    parser.add_argument('--daily-rows', type=int, default=DEFAULT_ROWS['daily'], help="daily bars per ticker")
+    parser.add_argument('--minute-rows', type=int, default=DEFAULT_ROWS['minute'], help="minute bars per ticker")
+    parser.add_argument('--repeat', type=int, default=3, help="timed repetitions per case (the best one is reported)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run of every case")
+    parser.add_argument('--max-rows', type=int, default=5_000_000, help="skip panels with more input rows than this")
+    parser.add_argument('--output', default='bench_suite.json', help="where to write the JSON report")
+    parser.add_argument('--baseline', default=None, help="report to compare this run against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative slowdown/memory growth that fails the comparison")
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), default=None, help="only compare two existing reports")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        old, new = (json.loads(Path(path).read_text()) for path in args.diff)
+    else:
+        new = run_suite(args.tickers, args.frequency, {'daily': args.daily_rows, 'minute': args.minute_rows}, args.repeat,
+                        not args.no_memory, args.max_rows)
+        Path(args.output).write_text(json.dumps(new, indent=1, sort_keys=True) + '\n')
+        print(f"report written to {args.output}")
+        if args.baseline is None:
+            return 0
+        old = json.loads(Path(args.baseline).read_text())
+    regressions = diff_reports(old, new, args.threshold)
+    for regression in regressions:
+        print("REGRESSION:", regression)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+# Benchmark and check of src/training.py on a synthetic feature store.
+# Checks:
+#   - the numpy logistic regression reaches the optimum of its objective (gradient ~ 0) for weak and strong regularization
+#   - score_predictions matches a direct pandas computation, including the confidence slice
+#   - a search across a process pool gives the same scores as the same search in-process
+#   - every fold leaves TARGET_HORIZON dates between its train and test windows, so no train label (the next bar's direction)
+#     is computed from a test date's close
+#   - a rerun loads every fold from the model cache and gives identical scores; after appending dates only the new folds are
+#     fitted, and adding a parameter value only fits that value
+# Run from the repo root: python benchmarks/bench_training.py [n_tickers] [n_rows] [workers]
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+import feature_engineering as fe
+import storage
+import training
+from bench_feature_plan import synthetic_ohlcv
+
+SCORE_COLUMNS = ['model', 'config', 'fold', 'test_start', 'test_end', 'n_train', 'n_test', 'accuracy', 'precision', 'recall',
+                 'baseline', 'log_loss', 'confident_count', 'confident_accuracy']
+
+def check_logistic(data):
+    X = data[training.DEFAULT_FEATURES].to_numpy()[:2000]
+    y = data['Target'].to_numpy()[:2000]
+    for C in (0.01, 1.0, 100.0):
+        model = training.fit_logistic(X, y, training.DEFAULT_FEATURES, C=C)
+        p = model.predict_proba(X)[:, 1]
+        gradient = np.append(model.coef + C * (X.T @ (p - y)), C * (p - y).sum())
+        scale = C * np.abs(X).sum() / len(X) * len(y)
+        assert np.abs(gradient).max() <= 1e-8 * scale, (C, np.abs(gradient).max())
+
+def check_scores():
+    rng = np.random.default_rng(1)
+    y = rng.integers(0, 2, 1000)
+    p = np.clip(rng.normal(0.5, 0.12, 1000), 0, 1)
+    df = pd.DataFrame({'y': y, 'p': p, 'pred': (p > 0.5).astype(int)})
+    confident = df[(df['p'] > 0.6) | (df['p'] < 0.4)]
+    scores = training.score_predictions(y, p, 0.6)
+    assert scores['accuracy'] == (df['y'] == df['pred']).mean()
+    assert scores['precision'] == df.loc[df['pred'] == 1, 'y'].mean()
+    assert scores['recall'] == df.loc[df['y'] == 1, 'pred'].mean()
+    assert scores['confident_count'] == len(confident)
+    assert scores['confident_accuracy'] == (confident['y'] == confident['pred']).mean()
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def same_scores(a, b):
+    pd.testing.assert_frame_equal(a[SCORE_COLUMNS].reset_index(drop=True), b[SCORE_COLUMNS].reset_index(drop=True))
+
+def main(n_tickers=20, n_rows=2500, workers=2):
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        tickers = [f'T{i:03d}' for i in range(n_tickers)]
+        for i, ticker in enumerate(tickers):
+            storage.write_partition(fe.compute_features(synthetic_ohlcv(n_rows, seed=i)), tmp / 'features', ticker)
+        data = training.load_training_data(tickers, tmp / 'features')
+        check_logistic(data)
+        check_scores()
+
+        grids = {'logistic': {'C': [0.01, 0.1, 1.0, 10.0]}}
+        options = dict(train_size=504, test_size=126)
+        (serial, _), serial_seconds = timed(training.run_search, data, grids, workers=1, cache_dir=None, **options)
+        (cold, importances), cold_seconds = timed(training.run_search, data, grids, workers=workers, cache_dir=tmp / 'cache', **options)
+        same_scores(serial, cold)
+        dates = data['Date'].unique()
+        gaps = np.searchsorted(dates, cold['test_start']) - np.searchsorted(dates, cold['train_end'])
+        assert (gaps == training.TARGET_HORIZON + 1).all(), "train labels must not look into the test window"
+        assert np.allclose(importances.groupby(['config', 'fold'])['importance'].sum(), 1.0)
+        (warm, _), warm_seconds = timed(training.run_search, data, grids, workers=workers, cache_dir=tmp / 'cache', **options)
+        same_scores(cold, warm)
+        assert warm['cached'].all() and not cold['cached'].any()
+
+        (shorter, _), _ = timed(training.run_search, data[data['Date'] <= dates[-253]], grids, workers=workers,
+                                cache_dir=tmp / 'cache2', **options)
+        (longer, _), append_seconds = timed(training.run_search, data, grids, workers=workers, cache_dir=tmp / 'cache2', **options)
+        assert longer['cached'].sum() == len(shorter) and (~longer['cached']).sum() == len(longer) - len(shorter)
+        same_scores(longer, cold)
+        (wider, _), _ = timed(training.run_search, data, {'logistic': {'C': [0.01, 0.1, 1.0, 10.0, 100.0]}}, workers=workers,
+                              cache_dir=tmp / 'cache', **options)
+        assert (~wider['cached']).sum() == (wider['config'] == 'C=100.0').sum()
+
+        folds = cold['fold'].nunique()
+        print(f"{n_tickers} tickers x {n_rows} rows ({len(data):,} rows), {len(cold)} fits ({folds} folds x {len(cold) // folds} configs)")
+        print(f"{'in-process':28s} {serial_seconds:8.3f}s")
+        print(f"{f'{workers} workers, cold cache':28s} {cold_seconds:8.3f}s")
+        print(f"{f'{workers} workers, warm cache':28s} {warm_seconds:8.3f}s")
+        print(f"{'after appending 252 dates':28s} {append_seconds:8.3f}s  ({(~longer['cached']).sum()} new fits)")
+        print(training.summarize(cold).to_string(float_format=lambda value: f'{value:.4f}'))
+        print("logistic optimum, scores, parallel/serial and cache checks passed")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
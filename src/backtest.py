@@ -0,0 +1,248 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Vectorized walk-forward backtest for the swing strategy (2-5 day holds).
+# Inputs are date-aligned arrays: close prices and model signals (e.g. the predicted probability of an up move), shaped
+# (n_dates, n_tickers) with NaN where a ticker has no bar. A signal at date t is acted on at the close of t and the position is
+# closed at the close of t + hold_days, so only information available at t is used.
+#
+# The portfolio is split into hold_days sleeves (one per entry date): every day's entries get 1/hold_days of the capital, split
+# equally between the tickers that signal, and are held for hold_days bars. Daily returns are the weighted close-to-close
+# returns of everything held (against each ticker's last valid close, so gaps inside a holding period keep their move), minus
+# costs and slippage on both the entry and the exit. Everything is computed with array ops over the whole (dates, tickers) grid,
+# there is no loop over bars or trades.
+#
+# Walk-forward: walk_forward_folds() splits the dates into consecutive train/test windows and run_sweep() backtests every
+# (parameter set, fold) pair across a process pool, with the arrays memory-mapped into the workers instead of copied.
+
+PERIODS_PER_YEAR = 252
+
+def _shift(values, periods):
+    shifted = np.full_like(values, np.nan)
+    if periods > 0:
+        shifted[periods:] = values[:-periods]
+    else:
+        shifted[:periods] = values[-periods:]
+    return shifted
+
+def _last_valid(values):
+    '''
+    Function to forward-fill every column of a 2-D array: each NaN takes the column's last valid value (NaN before the first).
+    '''
+    rows = np.arange(len(values))[:, None]
+    last_seen = np.maximum.accumulate(np.where(np.isnan(values), -1, rows), axis=0)
+    return np.where(last_seen >= 0, np.take_along_axis(values, np.maximum(last_seen, 0), axis=0), np.nan)
+
+def _rank_rows(scores):
+    '''
+    Function to rank every row of a 2-D array in descending order (0 = highest), NaN last.
+    '''
+    order = np.argsort(-np.where(np.isnan(scores), -np.inf, scores), axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(scores.shape[1])[None, :].repeat(scores.shape[0], axis=0), axis=1)
+    return ranks
+
+def entry_matrix(signals, threshold=0.6, top_k=None, allow_short=False):
+    '''
+    Function to turn signals into entries.
+    :param signals: Array (n_dates, n_tickers) of model scores, NaN = no signal.
+    :param threshold: Go long when the signal is above threshold (and short below 1 - threshold if allow_short).
+    :param top_k: Optional maximum number of new longs (and shorts) per date; the strongest signals are kept.
+    :param allow_short: Whether low signals open short positions.
+    :return: Array of the same shape with +1 (long entry), -1 (short entry) or 0.
+    '''
+    longs = signals > threshold # NaN compares False
+    shorts = (signals < 1 - threshold) if allow_short else np.zeros_like(longs)
+    if top_k is not None:
+        longs &= _rank_rows(np.where(longs, signals, np.nan)) < top_k
+        if allow_short:
+            shorts &= _rank_rows(np.where(shorts, -signals, np.nan)) < top_k
+    return longs.astype(np.float64) - shorts.astype(np.float64)
+
+def simulate(close, signals, hold_days=3, threshold=0.6, cost_bps=5.0, slippage_bps=5.0, top_k=None, allow_short=False):
+    '''
+    Function to backtest one parameter set.
+    :param close: Array (n_dates, n_tickers) (or 1-D for one ticker) of close prices, NaN where there is no bar.
+    :param signals: Array with the same shape as close.
+    :param hold_days: Number of bars every position is held.
+    :param threshold: Entry threshold (see entry_matrix).
+    :param cost_bps: Commission per side, in basis points of the traded value.
+    :param slippage_bps: Slippage per side, in basis points of the traded value.
+    :param top_k: Optional maximum number of new positions per date and side.
+    :param allow_short: Whether low signals open short positions.
+    :return: Dictionary with 'returns' (net daily returns), 'gross_returns', 'costs', 'exposure' (gross weight held each day),
+             'trade_returns' (net return of every trade, in entry date then ticker order) and 'metrics' (see performance_metrics).
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    signals = np.asarray(signals, dtype=np.float64)
+    if close.ndim == 1:
+        close, signals = close[:, None], signals[:, None]
+    if close.shape != signals.shape:
+        raise ValueError(f"close and signals must have the same shape, got {close.shape} and {signals.shape}")
+    if hold_days < 1:
+        raise ValueError("hold_days must be at least 1")
+    side_cost = (cost_bps + slippage_bps) / 1e4
+    n_dates = len(close)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exit_close = _shift(close, -hold_days)
+        trade_gross = exit_close / close - 1
+        # each bar's return is against the ticker's last valid close, so a position held across a missing bar gets the move on
+        # the next bar (a bar without a price returns 0) and the daily returns add up to the same moves as trade_returns
+        bar_returns = np.nan_to_num(close / _shift(_last_valid(close), 1) - 1, nan=0.0, posinf=0.0, neginf=0.0)
+    entries = entry_matrix(signals, threshold, top_k, allow_short)
+    entries[~np.isfinite(trade_gross)] = 0 # no entry without a price now and at the exit (end of data, gaps, delistings)
+
+    n_entries = np.abs(entries).sum(axis=1, keepdims=True)
+    weights = entries / np.maximum(n_entries, 1) / hold_days # each entry date's sleeve gets 1/hold_days of the capital
+
+    # positions held over bar t are the entries of dates t-hold_days .. t-1: a difference of cumulative sums
+    cumulative = np.zeros((n_dates + 1, close.shape[1]))
+    np.cumsum(weights, axis=0, out=cumulative[1:])
+    held = cumulative[:-1] - cumulative[np.maximum(np.arange(n_dates) - hold_days, 0)]
+
+    gross_returns = (held * bar_returns).sum(axis=1)
+    turnover = np.abs(weights).sum(axis=1) # opened at t
+    turnover[hold_days:] += np.abs(weights[:-hold_days]).sum(axis=1) # closed at t (every entry has its exit inside the data)
+    costs = side_cost * turnover
+    returns = gross_returns - costs
+
+    traded = entries != 0
+    trade_returns = (entries * trade_gross)[traded] - 2 * side_cost
+    exposure = np.abs(held).sum(axis=1)
+    return {'returns': returns, 'gross_returns': gross_returns, 'costs': costs, 'exposure': exposure,
+            'trade_returns': trade_returns, 'metrics': performance_metrics(returns, trade_returns, exposure)}
+
+def performance_metrics(returns, trade_returns=None, exposure=None, periods_per_year=PERIODS_PER_YEAR):
+    '''
+    Function to compute the performance metrics of a daily return series.
+    :param returns: Array of net daily returns.
+    :param trade_returns: Optional array of per-trade returns (for the trade statistics).
+    :param exposure: Optional array of the gross weight held each day.
+    :param periods_per_year: Bars per year, used to annualize.
+    :return: Dictionary with total_return, annual_return, volatility, sharpe, max_drawdown, n_trades, win_rate,
+             avg_trade_return and avg_exposure.
+    '''
+    returns = np.asarray(returns, dtype=np.float64)
+    n = len(returns)
+    equity = np.cumprod(1 + returns)
+    final = equity[-1] if n else 1.0
+    std = returns.std(ddof=1) if n > 1 else 0.0
+    peaks = np.maximum.accumulate(np.concatenate([[1.0], equity]))
+    trade_returns = np.asarray(trade_returns if trade_returns is not None else [], dtype=np.float64)
+    metrics = {
+        'total_return': final - 1,
+        'annual_return': final ** (periods_per_year / n) - 1 if n and final > 0 else (-1.0 if n else 0.0),
+        'volatility': std * np.sqrt(periods_per_year),
+        'sharpe': returns.mean() / std * np.sqrt(periods_per_year) if std > 0 else 0.0,
+        'max_drawdown': (np.concatenate([[1.0], equity]) / peaks - 1).min(),
+        'n_trades': len(trade_returns),
+        'win_rate': (trade_returns > 0).mean() if len(trade_returns) else np.nan,
+        'avg_trade_return': trade_returns.mean() if len(trade_returns) else np.nan,
+        'avg_exposure': np.mean(exposure) if exposure is not None and n else np.nan,
+    }
+    return {name: value if name == 'n_trades' else float(value) for name, value in metrics.items()}
+
+def walk_forward_folds(n_dates, train_size, test_size, step=None, expanding=False, embargo=0):
+    '''
+    Function to split a date range into consecutive walk-forward folds (every test window starts after its train window).
+    :param n_dates: Number of dates.
+    :param train_size: Number of dates in the (first) train window.
+    :param test_size: Number of dates in every test window.
+    :param step: Number of dates between the starts of consecutive folds (defaults to test_size, i.e. back-to-back test windows).
+    :param expanding: Whether every train window starts at the first date (otherwise it rolls with a fixed size).
+    :param embargo: Number of dates left out between every train window and its test window. A label that looks h dates ahead
+                    (e.g. the next day's direction, h = 1) needs embargo >= h, or the last train rows are labelled with test prices.
+    :return: List of (train_start, train_end, test_start, test_end) index tuples, ends exclusive.
+    '''
+    step = step or test_size
+    folds = []
+    test_start = train_size + embargo
+    while test_start + test_size <= n_dates:
+        train_end = test_start - embargo
+        folds.append((0 if expanding else train_end - train_size, train_end, test_start, test_start + test_size))
+        test_start += step
+    return folds
+
+def parameter_grid(grid):
+    '''
+    Function to expand a dictionary of parameter lists into every combination.
+    :param grid: Dictionary mapping parameter name -> list of values (e.g. {'hold_days': [2, 3, 4, 5]}).
+    :return: List of parameter dictionaries, in itertools.product order.
+    '''
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+_SWEEP_ARRAYS = {} # set in every worker by _init_sweep_worker
+
+def _init_sweep_worker(close_path, signals_path):
+    _SWEEP_ARRAYS['close'] = np.load(close_path, mmap_mode='r')
+    _SWEEP_ARRAYS['signals'] = np.load(signals_path, mmap_mode='r')
+
+def _run_config(task):
+    params, (start, end) = task
+    result = simulate(_SWEEP_ARRAYS['close'][start:end], _SWEEP_ARRAYS['signals'][start:end], **params)
+    return result['metrics']
+
+def run_sweep(close, signals, grid, folds=None, dates=None, workers=None, chunksize=None):
+    '''
+    Function to backtest every combination of a parameter grid on every fold, across a process pool.
+    :param close: Array (n_dates, n_tickers) of close prices.
+    :param signals: Array of signals with the same shape (out-of-sample predictions for each fold's test window).
+    :param grid: Dictionary mapping simulate() parameter -> list of values, or a list of parameter dictionaries.
+    :param folds: List of fold tuples from walk_forward_folds (only the test windows are backtested); None = all dates as one fold.
+    :param dates: Optional date index of the arrays, used to label the folds.
+    :param workers: Number of worker processes (defaults to the number of CPUs); 0 or 1 runs in this process.
+    :param chunksize: Number of configurations sent to a worker at a time (defaults to an even split into 4 chunks per worker).
+    :return: DataFrame with one row per (parameter set, fold): the parameters, the fold number and bounds, and the metrics.
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    signals = np.asarray(signals, dtype=np.float64)
+    configs = parameter_grid(grid) if isinstance(grid, dict) else list(grid)
+    windows = [(fold[-2], fold[-1]) for fold in folds] if folds is not None else [(0, len(close))]
+    tasks = [(params, window) for params in configs for window in windows]
+    fold_numbers = [fold for _ in configs for fold in range(len(windows))]
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers <= 1:
+        _SWEEP_ARRAYS.update(close=close, signals=signals)
+        metrics = [_run_config(task) for task in tasks]
+        _SWEEP_ARRAYS.clear()
+    else:
+        folder = tempfile.mkdtemp(prefix='backtest_')
+        try:
+            paths = [os.path.join(folder, 'close.npy'), os.path.join(folder, 'signals.npy')]
+            np.save(paths[0], close)
+            np.save(paths[1], signals)
+            chunksize = chunksize or max(1, len(tasks) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker, initargs=tuple(paths)) as pool:
+                metrics = list(pool.map(_run_config, tasks, chunksize=chunksize)) # map keeps the task order
+        finally:
+            shutil.rmtree(folder)
+
+    rows = []
+    for (params, (start, end)), fold, values in zip(tasks, fold_numbers, metrics):
+        bounds = {'test_start': dates[start], 'test_end': dates[end - 1]} if dates is not None else {'test_start': start, 'test_end': end}
+        rows.append({**params, 'fold': fold, **bounds, **values})
+    return pd.DataFrame(rows)
+
+def load_backtest_panel(tickers, signal_column, root=None):
+    '''
+    Function to load the aligned close prices and a signal column stored in the feature store (e.g. out-of-sample predictions).
+    :param tickers: List of ticker symbols.
+    :param signal_column: Name of the stored column to use as the signal.
+    :param root: Feature store folder (defaults to storage.FEATURES_ROOT).
+    :return: Tuple (dates, close array, signal array), arrays shaped (n_dates, n_tickers) in the order of tickers.
+    '''
+    import storage
+    from feature_engineering import make_panel
+
+    root = root or storage.FEATURES_ROOT
+    panel = make_panel({ticker: storage.read_partition(root, ticker, columns=['Date', 'Close', signal_column]) for ticker in tickers})
+    return panel.index, panel['Close'][list(tickers)].to_numpy(), panel[signal_column][list(tickers)].to_numpy()
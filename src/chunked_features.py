@@ -0,0 +1,352 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import DEFAULT_FEATURE_PLAN, FeatureArrays, compact_dtype, format_profile, memory_report, profile_stage
+
+# Out-of-core feature building for histories that don't fit in memory (years of minute bars): build_features_chunked() reads the
+# bars in fixed-size blocks, computes the features of every block with the same FeaturePlan and appends them to the ticker's
+# partition as they are done, so memory holds two blocks (the current one and the next, for the one-bar look-ahead of Target)
+# plus a small carried state, whatever the length of the history.
+#
+# The output is bit-for-bit the output of build_features on the whole history. Every primitive of the plan carries what it
+# needs from one block to the next:
+#   - shifts (Daily_Return, Return_Day_n, OBV_ROC_20, the Close.diff() behind RSI/OBV) keep the last rows of their column;
+#     Target's shift(-1) reads the first bar of the next block
+#   - rolling means and standard deviations (MA_20/50, Bollinger bands, Volume_SMA_20) keep their last `window` values and the
+#     exact running state pandas keeps internally (Kahan-compensated sums, Welford's mean/variance). Restarting a window from
+#     its raw values is not enough: pandas' running sums carry rounding from the whole history, so a restarted window differs
+#     in the last bits. The replay is a scalar loop over Python floats (the same operations as streaming_indicators), ~0.5 us
+#     per bar and window
+#   - EMAs (12/26 and the 9-bar signal line) and Wilder's RSI smoothing keep their last value and run pandas' ewm on the block
+#     with that value in front: pandas then restarts from exactly the state it had (see _ewm)
+#   - OBV's cumulative sum keeps its running total
+# The state lives in ChunkedFeatures.state, keyed like the FeatureArrays memo ('sma', column, window) and so on.
+
+def _rolling_mean(values, window, state):
+    '''
+    Function to continue Series.rolling(window).mean() over the next block of one series (pandas' add/remove loop with Kahan
+    compensation, same operations as streaming_indicators.RollingMean).
+    :param values: 1-D float64 array with the block's values.
+    :param window: Number of bars in the window.
+    :param state: Dictionary with the running state, empty before the first block; updated in place.
+    :return: 1-D array with the rolling means of the block.
+    '''
+    values = values.tolist() # Python floats: the loop is ~10x faster than on NumPy scalars
+    if not state:
+        state.update(sum_x=0.0, compensation_add=0.0, compensation_remove=0.0, nobs=0, neg_ct=0, same_count=0,
+                     prev_value=values[0] if values else math.nan, tail=[])
+    sum_x, compensation_add, compensation_remove = state['sum_x'], state['compensation_add'], state['compensation_remove']
+    nobs, neg_ct, same_count, prev_value = state['nobs'], state['neg_ct'], state['same_count'], state['prev_value']
+    buffer = state['tail'] + values # the last `window` values of the previous blocks, then this block
+    offset = len(state['tail'])
+    out = [math.nan] * len(values)
+    for i, value in enumerate(values):
+        if offset + i >= window: # remove the value leaving the window
+            old = buffer[offset + i - window]
+            if old == old:
+                nobs -= 1
+                if old < 0:
+                    neg_ct -= 1
+                y = -old - compensation_remove
+                t = sum_x + y
+                compensation_remove = t - sum_x - y
+                sum_x = t
+        if value == value: # add the new value
+            nobs += 1
+            if value < 0:
+                neg_ct += 1
+            y = value - compensation_add
+            t = sum_x + y
+            compensation_add = t - sum_x - y
+            sum_x = t
+            same_count = same_count + 1 if value == prev_value else 1
+            prev_value = value
+        if nobs >= window and nobs > 0:
+            mean = sum_x / nobs
+            if neg_ct == 0 and mean < 0:
+                mean = 0.0
+            elif neg_ct == nobs and mean > 0:
+                mean = 0.0
+            if same_count >= nobs:
+                mean = prev_value # a constant window returns its value exactly
+            out[i] = mean
+    state.update(sum_x=sum_x, compensation_add=compensation_add, compensation_remove=compensation_remove, nobs=nobs,
+                 neg_ct=neg_ct, same_count=same_count, prev_value=prev_value, tail=buffer[-window:])
+    return np.array(out)
+
+def _rolling_std(values, window, state, ddof=1):
+    '''
+    Function to continue Series.rolling(window).std() over the next block of one series (Welford's online variance with Kahan
+    compensation, same operations as streaming_indicators.RollingStd).
+    :param values: 1-D float64 array with the block's values.
+    :param window: Number of bars in the window.
+    :param state: Dictionary with the running state, empty before the first block; updated in place.
+    :param ddof: Delta degrees of freedom.
+    :return: 1-D array with the rolling standard deviations of the block.
+    '''
+    values = values.tolist()
+    if not state:
+        state.update(mean_x=0.0, ssqdm_x=0.0, compensation_add=0.0, compensation_remove=0.0, nobs=0, same_count=0,
+                     prev_value=values[0] if values else math.nan, tail=[])
+    mean_x, ssqdm_x = state['mean_x'], state['ssqdm_x']
+    compensation_add, compensation_remove = state['compensation_add'], state['compensation_remove']
+    nobs, same_count, prev_value = state['nobs'], state['same_count'], state['prev_value']
+    buffer = state['tail'] + values
+    offset = len(state['tail'])
+    out = [math.nan] * len(values)
+    for i, value in enumerate(values):
+        if offset + i >= window:
+            old = buffer[offset + i - window]
+            if old == old:
+                nobs -= 1
+                if nobs:
+                    prev_mean = mean_x - compensation_remove
+                    y = old - compensation_remove
+                    t = y - mean_x
+                    compensation_remove = t + mean_x - y
+                    mean_x -= t / nobs
+                    ssqdm_x -= (old - prev_mean) * (old - mean_x)
+                else:
+                    mean_x = 0.0
+                    ssqdm_x = 0.0
+        if value == value:
+            same_count = same_count + 1 if value == prev_value else 1
+            prev_value = value
+            nobs += 1
+            prev_mean = mean_x - compensation_add
+            y = value - compensation_add
+            t = y - mean_x
+            compensation_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x += (value - prev_mean) * (value - mean_x)
+        if nobs >= window and nobs > ddof:
+            var = 0.0 if nobs == 1 or same_count >= nobs else ssqdm_x / (nobs - ddof)
+            out[i] = 0.0 if var < 0 else math.sqrt(var)
+    state.update(mean_x=mean_x, ssqdm_x=ssqdm_x, compensation_add=compensation_add, compensation_remove=compensation_remove,
+                 nobs=nobs, same_count=same_count, prev_value=prev_value, tail=buffer[-window:])
+    return np.array(out)
+
+def _ewm(values, state, min_periods=0, **params):
+    '''
+    Function to continue Series.ewm(adjust=False, **params).mean() over the next block of one series.
+    With adjust=False pandas only carries the last average and the weight it has decayed to since the last observation, so
+    running it on [last average, one NaN per bar since the last observation, block] reproduces the exact state of the whole
+    series: the first value starts the average, every NaN decays the weight the same way the missed bars did.
+    :param values: 1-D float64 array with the block's values.
+    :param state: Dictionary with 'weighted', 'gap' and 'nobs', empty before the first block; updated in place.
+    :param min_periods: Observations needed before a value is reported (applied on the count over the whole series).
+    :param params: span= or alpha= (passed to pandas as given, so alpha is derived the same way).
+    :return: 1-D array with the EMA of the block.
+    '''
+    prefix = [state['weighted']] + [math.nan] * state['gap'] if 'weighted' in state else []
+    weighted = pd.Series(np.concatenate([prefix, values])).ewm(adjust=False, **params).mean().to_numpy()[len(prefix):]
+    observed = ~np.isnan(values)
+    nobs = state.get('nobs', 0) + np.cumsum(observed)
+    if observed.any():
+        state['weighted'] = weighted[-1] # NaN bars after the last observation report the average unchanged
+        state['gap'] = len(values) - 1 - int(np.flatnonzero(observed)[-1])
+    elif 'weighted' in state:
+        state['gap'] += len(values)
+    state['nobs'] = int(nobs[-1]) if len(nobs) else state.get('nobs', 0)
+    return np.where(nobs >= max(min_periods, 1), weighted, np.nan)
+
+class ChunkArrays(FeatureArrays):
+    '''
+    FeatureArrays for one block of a longer history: the primitives continue from the state the previous blocks left.
+    :param recipes: Dictionary mapping column name -> recipe (FeaturePlan.recipes).
+    :param inputs: Dictionary with the block's 2-D float64 'Close' and 'Volume' arrays.
+    :param state: Carried state (ChunkedFeatures.state), updated in place.
+    :param lookahead: Dictionary with the next block's 2-D inputs (zero rows for the last block), for negative shifts.
+    '''
+    def __init__(self, recipes, inputs, state, lookahead):
+        super().__init__(recipes, inputs)
+        self.state = state
+        self.lookahead = lookahead
+
+    def _per_series(self, key, name, compute):
+        values = self.column(name)
+        states = self.state.setdefault(key, [{} for _ in range(values.shape[1])])
+        return np.column_stack([compute(values[:, j], states[j]) for j in range(values.shape[1])]).reshape(values.shape)
+
+    def shift(self, name, periods):
+        return self._memo(('shift', name, periods), lambda: self._shift(name, periods))
+
+    def _shift(self, name, periods):
+        values = self.column(name)
+        width = values.shape[1]
+        if periods < 0:
+            if name not in self.lookahead:
+                raise ValueError(f"Chunked processing can only look ahead on the inputs, not on '{name}'")
+            future = self.lookahead[name][:-periods]
+            ahead = np.concatenate([values, future, np.full((-periods - len(future), width), np.nan)])
+            return ahead[-periods:-periods + len(values)]
+        tail_rows = self.state.setdefault('tail_rows', {})
+        tail_rows[name] = max(tail_rows.get(name, 0), periods)
+        tail = self.state.setdefault('tails', {}).get(name, values[:0])[-periods:] if periods else values[:0]
+        behind = np.concatenate([np.full((periods - len(tail), width), np.nan), tail, values])
+        return behind[:len(values)]
+
+    def sma(self, name, window):
+        return self._memo(('sma', name, window), lambda: self._per_series(('sma', name, window), name,
+                                                                          lambda values, state: _rolling_mean(values, window, state)))
+
+    def std(self, name, window):
+        return self._memo(('std', name, window), lambda: self._per_series(('std', name, window), name,
+                                                                          lambda values, state: _rolling_std(values, window, state)))
+
+    def ema(self, name, span):
+        return self._memo(('ema', name, span), lambda: self._per_series(('ema', name, span), name,
+                                                                        lambda values, state: _ewm(values, state, span=span)))
+
+    def wilder(self, name, window):
+        return self._memo(('wilder', name, window), lambda: self._per_series(('wilder', name, window), name,
+                                                                             lambda values, state: _ewm(values, state, window, alpha=1 / window)))
+
+    def cumsum(self, name):
+        return self._memo(('cumsum', name), lambda: self._cumsum(name))
+
+    def _cumsum(self, name):
+        values = self.column(name)
+        missing = np.isnan(values)
+        filled = np.where(missing, 0.0, values)
+        total = self.state.get(('cumsum', name))
+        sums = np.cumsum(filled if total is None else np.concatenate([total[None, :], filled]), axis=0)
+        sums = sums if total is None else sums[1:] # the running total goes first, so the additions happen in the same order
+        if len(sums):
+            self.state[('cumsum', name)] = sums[-1]
+        return np.where(missing, np.nan, sums)
+
+    def finish(self):
+        '''
+        Function to keep the last rows of every shifted column for the next block (call once the block's columns are computed).
+        '''
+        tails = self.state.setdefault('tails', {})
+        for name, rows in self.state.get('tail_rows', {}).items():
+            previous = tails.get(name)
+            values = self.column(name)
+            tails[name] = (values if previous is None else np.concatenate([previous, values]))[-rows:]
+
+class ChunkedFeatures:
+    '''
+    Runs a FeaturePlan over a history one block at a time; the concatenated outputs are identical to plan.compute() on the
+    whole history.
+    :param plan: FeaturePlan to compute.
+    '''
+    def __init__(self, plan=DEFAULT_FEATURE_PLAN):
+        self.plan = plan
+        self.state = {}
+        self.rows = 0
+
+    def compute(self, close, volume, next_close=None, next_volume=None):
+        '''
+        Function to compute the next block's features.
+        :param close: Array of closing prices of the block, shape (rows,) or (rows, series).
+        :param volume: Array of volumes with the same shape.
+        :param next_close: Closing prices of the following block (Target looks one bar ahead), None for the last block.
+        :param next_volume: Volumes of the following block, None for the last block.
+        :return: Dictionary mapping each plan column -> array with the same shape as close.
+        '''
+        one_dimensional = np.ndim(close) == 1
+
+        def as_2d(values, like=None):
+            if values is None:
+                return np.empty((0, like.shape[1]))
+            values = np.ascontiguousarray(values, dtype=np.float64)
+            return values[:, None] if values.ndim == 1 else values
+
+        inputs = {'Close': as_2d(close), 'Volume': as_2d(volume)}
+        lookahead = {'Close': as_2d(next_close, inputs['Close']), 'Volume': as_2d(next_volume, inputs['Volume'])}
+        arrays = ChunkArrays(self.plan.recipes, inputs, self.state, lookahead)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features = {name: arrays.column(name) for name in self.plan.columns}
+        arrays.finish()
+        self.rows += len(inputs['Close'])
+        if one_dimensional:
+            features = {name: values[:, 0] for name, values in features.items()}
+        return features
+
+def build_features_chunked(chunks, df_name="stock_data", plan=DEFAULT_FEATURE_PLAN, root=None, compact=False, profile=None):
+    '''
+    Function to build the features of one ticker block by block and append each block to its partition as soon as it is done.
+    :param chunks: Iterable of raw DataFrames in date order (e.g. storage.iter_partition(root, ticker, 100_000), or
+                   pd.read_csv(path, parse_dates=['Date'], chunksize=100_000)).
+    :param df_name: Ticker name the features are stored under.
+    :param plan: FeaturePlan describing which columns to compute.
+    :param root: Feature store folder (defaults to storage.FEATURES_ROOT).
+    :param compact: Whether to store only the model features, downcast (see feature_engineering.compute_features). Every
+                    column keeps the dtype of its first block; a later block that needs a wider dtype raises ValueError.
+    Every block must have the raw columns and dtypes of the first one (e.g. a CSV block where Volume parses as float64
+    instead of int64 raises ValueError, pass read_csv an explicit dtype). Empty blocks are skipped, and without any rows
+    nothing is written.
+    :param profile: Same as build_features: True prints the 'read', 'features', 'assemble' and 'write' stages, a dictionary
+                    accumulates them.
+    :return: Dictionary with 'chunks', 'rows_read', 'rows' (written, warm-up rows dropped), 'bytes' (in memory, summed over the
+             written blocks) and 'path' (None when there were no rows and no partition was written).
+    '''
+    import storage
+
+    stages = {} if profile is True else (profile if isinstance(profile, dict) else None)
+    if compact:
+        plan = plan.without_intermediates()
+    engine = ChunkedFeatures(plan)
+    dtypes = None
+    report = {'chunks': 0, 'rows_read': 0, 'rows': 0, 'bytes': 0, 'path': None}
+    schema = None
+
+    def read_next(iterator):
+        nonlocal schema
+        start = time.perf_counter()
+        block = next(iterator, None)
+        while block is not None and block.empty: # e.g. a trailing empty CSV chunk; its dtypes don't mean anything
+            block = next(iterator, None)
+        profile_stage(stages, 'read', time.perf_counter() - start, 0 if block is None else len(block))
+        if block is not None:
+            schema = block.dtypes if schema is None else schema
+            changed = {name: f"{schema.get(name, 'missing')} -> {block.dtypes.get(name, 'missing')}"
+                       for name in dict.fromkeys([*schema.index, *block.columns]) if str(schema.get(name)) != str(block.dtypes.get(name))}
+            if changed:
+                raise ValueError(f"A block of '{df_name}' doesn't have the columns/dtypes of the first block ({changed}); "
+                                 "read every block with the same dtypes, e.g. pd.read_csv(..., dtype=...)")
+        return block
+
+    chunks = iter(chunks)
+    current = read_next(chunks)
+    if current is None: # no rows at all: there is no schema to write, so the ticker gets no partition
+        if profile is True:
+            print(format_profile(stages, f"build_features_chunked[{df_name}]"))
+        return report
+    with storage.PartitionWriter(root or storage.FEATURES_ROOT, df_name) as writer:
+        while current is not None:
+            upcoming = read_next(chunks)
+            start = time.perf_counter()
+            ahead = (None, None) if upcoming is None else (upcoming['Close'].to_numpy(), upcoming['Volume'].to_numpy())
+            features = engine.compute(current['Close'].to_numpy(), current['Volume'].to_numpy(), *ahead)
+            if compact:
+                block_dtypes = {name: compact_dtype(values) for name, values in features.items()}
+                dtypes = dtypes or block_dtypes
+                wider = [name for name, dtype in block_dtypes.items() if np.result_type(dtype, dtypes[name]) != dtypes[name]]
+                if wider:
+                    raise ValueError(f"Columns {wider} of '{df_name}' don't fit the compact dtypes of the first block; rerun without compact")
+                features = {name: values.astype(dtypes[name], copy=False) for name, values in features.items()}
+            profile_stage(stages, 'features', time.perf_counter() - start, len(current))
+
+            start = time.perf_counter()
+            raw = current.drop(columns=[name for name in features if name in current.columns])
+            frame = pd.concat([raw, pd.DataFrame(features, index=current.index)], axis=1).dropna() # same rows drop_nans_warmup keeps
+            profile_stage(stages, 'assemble', time.perf_counter() - start, len(current))
+
+            start = time.perf_counter()
+            writer.write(frame)
+            profile_stage(stages, 'write', time.perf_counter() - start, len(frame))
+            report['chunks'] += 1
+            report['rows_read'] += len(current)
+            report['rows'] += len(frame)
+            report['bytes'] += memory_report(frame)['bytes']
+            current = upcoming
+        report['path'] = writer.close()
+    if profile is True:
+        print(format_profile(stages, f"build_features_chunked[{df_name}]"))
+    return report
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from feature_engineering import _shift, compact_array, pack_panel, panel_mask, panel_order, unpack_panel
+
+# Cross-sectional and regime features: the per-ticker features only look at one ticker's own history. This stage works on a
+# date-aligned panel (see feature_engineering.make_panel / compute_panel_features) and adds features that compare tickers with
+# each other and with the market on each date:
+#   - per-date percentile rank and z-score of returns, RSI and volume ratio across the universe
+#   - relative strength vs. benchmarks (SPY, QQQ): the ticker's n-day return relative to the benchmark's
+#   - rolling beta and correlation of daily returns to the index
+#   - a volatility-regime label for each ticker and for the index (calm 0, normal 1, stressed 2: short-term realized volatility
+#     against its own longer-term level)
+#   - optionally, the daily return relative to the ticker's sector average
+# Everything is computed on whole (dates, tickers) arrays at once: ranks with DataFrame.rank(axis=1), moments with masked sums
+# along the ticker axis, rolling statistics with pandas' 2-D rolling windows and sector averages with one matrix product, so
+# the cost grows with the panel size and never loops over dates or tickers in Python (no groupby.apply).
+# Tickers without a bar on a date are NaN there and don't count in that date's statistics. The per-ticker time series (relative
+# strength, beta/correlation, volatility regime) run on each ticker's own bars, packed like compute_panel_features does, with the
+# benchmark prices taken on the ticker's bar dates: a missing bar is skipped instead of putting a NaN into 20 to 250 windows.
+# Only the truly cross-sectional statistics (ranks, z-scores, sector averages) use the date-aligned layout.
+
+DEFAULT_COLUMNS = ('Daily_Return', 'RSI_14', 'Volume_Ratio_20')
+DEFAULT_BENCHMARKS = ('SPY', 'QQQ')
+
+def _rolling(values, window, min_periods=None):
+    return pd.DataFrame(values, copy=False).rolling(window, min_periods=min_periods)
+
+def cross_sectional_rank(values):
+    '''
+    Function to rank every ticker against the others on each date.
+    :param values: Array of shape (dates, tickers), NaN where a ticker has no value.
+    :return: Percentile rank in (0, 1] (ties get their average rank, like DataFrame.rank(pct=True)), NaN where values is NaN.
+    '''
+    return pd.DataFrame(values, copy=False).rank(axis=1, pct=True).to_numpy()
+
+def cross_sectional_zscore(values):
+    '''
+    Function to standardize every ticker against the others on each date: (value - mean) / standard deviation (ddof=1).
+    :param values: Array of shape (dates, tickers), NaN where a ticker has no value.
+    :return: Z-scores, NaN where values is NaN or the date has fewer than 2 distinct values.
+    '''
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, values, 0.0).sum(axis=1, keepdims=True) / count
+        deviation = np.where(valid, values - mean, 0.0)
+        std = np.sqrt((deviation * deviation).sum(axis=1, keepdims=True) / (count - 1))
+        zscore = deviation / std
+    return np.where(valid & (std > 0), zscore, np.nan)
+
+def group_mean(values, groups):
+    '''
+    Function to average the tickers of each group (e.g. sector) on each date, and hand every ticker its group's average.
+    :param values: Array of shape (dates, tickers), NaN where a ticker has no value.
+    :param groups: Sequence with one group label per ticker (None = no group).
+    :return: Array of shape (dates, tickers) with the average of the ticker's group on that date (NaN without a group).
+    '''
+    labels = sorted({group for group in groups if group is not None})
+    codes = {group: i for i, group in enumerate(labels)}
+    members = np.zeros((len(groups), len(labels)))
+    for ticker, group in enumerate(groups):
+        if group is not None:
+            members[ticker, codes[group]] = 1.0
+    valid = ~np.isnan(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = (np.where(valid, values, 0.0) @ members) / (valid.astype(np.float64) @ members) # (dates, groups)
+    ticker_group = np.array([codes.get(group, -1) for group in groups], dtype=np.int64)
+    out = means[:, np.maximum(ticker_group, 0)] if labels else np.full(values.shape, np.nan)
+    out[:, ticker_group < 0] = np.nan
+    return out
+
+def rolling_beta_correlation(returns, index_returns, window):
+    '''
+    Function to compute the rolling beta and correlation of every ticker's returns to the index returns.
+    :param returns: Array of shape (dates, tickers) with daily returns (NaN = no bar).
+    :param index_returns: Array of shape (dates,) with the index's daily returns on the same dates, or (dates, tickers) with the
+                          index's returns over the same bars as each ticker's (see cross_sectional_features).
+    :param window: Number of rows in the window; the window must have a return for the ticker and the index on every row.
+    :return: Tuple (beta, correlation), arrays of shape (dates, tickers).
+    '''
+    index_returns = index_returns if index_returns.ndim == 2 else index_returns[:, None]
+    market = np.where(np.isnan(returns), np.nan, index_returns) # same observations on both sides
+    mean_x = _rolling(returns, window).mean().to_numpy()
+    mean_m = _rolling(market, window).mean().to_numpy()
+    covariance = _rolling(returns * market, window).mean().to_numpy() - mean_x * mean_m
+    variance_x = np.maximum(_rolling(returns * returns, window).mean().to_numpy() - mean_x * mean_x, 0.0)
+    variance_m = np.maximum(_rolling(market * market, window).mean().to_numpy() - mean_m * mean_m, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = np.where(variance_m > 0, covariance / variance_m, np.nan)
+        correlation = np.where((variance_x > 0) & (variance_m > 0), covariance / np.sqrt(variance_x * variance_m), np.nan)
+    return beta, np.clip(correlation, -1.0, 1.0)
+
+def volatility_regime(returns, window=20, long_window=250, min_periods=60, thresholds=(0.8, 1.25)):
+    '''
+    Function to label the volatility regime: the rolling standard deviation of returns over `window` dates divided by the one
+    over `long_window` dates, below thresholds[0] is calm (0), above thresholds[1] is stressed (2), in between normal (1).
+    :param returns: Array of shape (dates,) or (dates, tickers) with daily returns.
+    :param min_periods: Returns needed in the long window before a label is given (the long window fills up afterwards).
+    :return: float array with the same shape as returns: 0, 1, 2 or NaN during the warm-up.
+    '''
+    returns = np.asarray(returns, dtype=np.float64)
+    one_dimensional = returns.ndim == 1
+    returns = returns[:, None] if one_dimensional else returns
+    short = _rolling(returns, window).std().to_numpy()
+    long = _rolling(returns, long_window, min_periods=min_periods).std().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = short / long
+    regime = np.where(ratio < thresholds[0], 0.0, np.where(ratio > thresholds[1], 2.0, 1.0))
+    regime = np.where(np.isnan(ratio), np.nan, regime)
+    return regime[:, 0] if one_dimensional else regime
+
+def cross_sectional_features(panel, features, columns=DEFAULT_COLUMNS, benchmarks=DEFAULT_BENCHMARKS, index='SPY',
+                             strength_window=20, beta_window=60, vol_window=20, regime_window=250, regime_min_periods=60,
+                             regime_thresholds=(0.8, 1.25), sectors=None, benchmark_close=None, compact=False):
+    '''
+    Function to compute the cross-sectional and regime features of a panel.
+    :param panel: Panel DataFrame (see feature_engineering.make_panel).
+    :param features: Output of compute_panel_features for that panel (must contain `columns` and 'Daily_Return').
+    :param columns: Per-ticker features to rank and standardize on each date.
+    :param benchmarks: Tickers to measure relative strength against.
+    :param index: Ticker the betas, correlations and the market volatility regime are measured against.
+    :param strength_window: Number of dates of the returns compared for relative strength.
+    :param beta_window: Number of dates in the beta/correlation window.
+    :param vol_window: Short volatility window of the regime labels.
+    :param regime_window: Long volatility window of the regime labels.
+    :param regime_min_periods: Returns needed in the long window before a regime label is given.
+    :param regime_thresholds: Short/long volatility ratios separating calm, normal and stressed.
+    :param sectors: Optional dictionary mapping ticker -> sector; adds the daily return relative to the sector average.
+    :param benchmark_close: Optional DataFrame (indexed by date, one column per benchmark/index) with closing prices, for
+                            benchmarks that aren't tickers of the panel.
+    :param compact: Whether to downcast the features to float32 (see feature_engineering.compact_array).
+    :return: DataFrame indexed by Date with (feature, ticker) columns like compute_panel_features, NaN wherever the ticker has
+             no bar (concatenate it with the per-ticker features and pass both to panel_to_long).
+    '''
+    tickers = panel['Close'].columns
+    close = panel['Close'].to_numpy(dtype=np.float64)
+    mask = panel_mask(panel)
+    reference = panel['Close'] if benchmark_close is None else benchmark_close.reindex(panel.index)
+    missing = [name for name in (*benchmarks, index) if name not in reference.columns]
+    if missing:
+        raise ValueError(f"Benchmarks not in the panel (pass their prices with benchmark_close): {missing}")
+
+    out = {}
+    for column in columns:
+        values = features[column].to_numpy(dtype=np.float64)
+        out[f'{column}_CS_Rank'] = cross_sectional_rank(values)
+        out[f'{column}_CS_ZScore'] = cross_sectional_zscore(values)
+
+    order = panel_order(mask)
+    def on_bars(prices): # a benchmark's prices on every ticker's own bar dates, packed
+        return pack_panel(np.broadcast_to(prices.to_numpy(dtype=np.float64)[:, None], close.shape), order)
+
+    packed = {}
+    packed_close = pack_panel(close, order)
+    packed_returns = pack_panel(features['Daily_Return'].to_numpy(dtype=np.float64), order)
+    index_close = on_bars(reference[index])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ticker_return = packed_close / _shift(packed_close, strength_window)
+        for name in benchmarks:
+            benchmark = on_bars(reference[name])
+            packed[f'Relative_Strength_{name}_{strength_window}'] = ticker_return / (benchmark / _shift(benchmark, strength_window)) - 1
+        index_returns = index_close / _shift(index_close, 1) - 1 # over the same bars as the ticker's Daily_Return
+    beta, correlation = rolling_beta_correlation(packed_returns, index_returns, beta_window)
+    packed[f'Beta_{index}_{beta_window}'] = beta
+    packed[f'Correlation_{index}_{beta_window}'] = correlation
+    packed['Volatility_Regime'] = volatility_regime(packed_returns, vol_window, regime_window, regime_min_periods, regime_thresholds)
+    for name, values in packed.items():
+        out[name] = unpack_panel(values, order, mask)
+
+    market = reference[index].to_numpy(dtype=np.float64)
+    observed = ~np.isnan(market) # the market regime runs on the index's own bars too
+    own = market[observed][:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        own_returns = (own / _shift(own, 1) - 1)[:, 0]
+    market_regime = np.full(len(market), np.nan)
+    market_regime[observed] = volatility_regime(own_returns, vol_window, regime_window, regime_min_periods, regime_thresholds)
+    out['Market_Volatility_Regime'] = np.broadcast_to(market_regime[:, None], close.shape)
+
+    returns = features['Daily_Return'].to_numpy(dtype=np.float64)
+    if sectors is not None:
+        out['Sector_Relative_Return'] = returns - group_mean(returns, [sectors.get(ticker) for ticker in tickers])
+
+    frames = {}
+    for name, values in out.items():
+        values = np.where(mask, values, np.nan) # pandas may hand back read-only arrays
+        frames[name] = pd.DataFrame(compact_array(values) if compact else values, index=panel.index, columns=tickers)
+    return pd.concat(frames, axis=1)
@@ -1,20 +1,272 @@
-import yfinance as yf
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
 import pandas as pd
 
-tickers = ["SPY", "QQQ", "AAPL", "MSFT", "TSLA"]
-start_date = "2024-01-01"
-end_date = "2026-02-09"
+import storage
+
+# Downloader for the raw store.
+# The first version of this script looped over a hard-coded list and re-downloaded the full history of every ticker on each run.
+# Now:
+#   - the universe is configurable (--tickers or a --tickers-file with one symbol per line)
+#   - tickers are fetched concurrently by a thread pool, with a shared rate limit and retries with exponential backoff
+#   - each ticker's watermark is the last Date already in the raw store, so only the missing range is fetched and appended;
+#     the last few stored bars are fetched again, and if their closes changed (Yahoo re-adjusts the whole history after a split
+#     or dividend) the ticker's full history is fetched again and rewritten instead of appending a fake price jump
+#   - progress is checkpointed in data/raw/_download_state.json, so a crashed run picks up where it stopped
+#   - the data source is pluggable: YFinanceProvider for real data, LocalProvider serves in-memory frames (no network, for tests)
+
+DEFAULT_TICKERS = ["SPY", "QQQ", "AAPL", "MSFT", "TSLA"]
+DEFAULT_START_DATE = "2024-01-01"
+CHECKPOINT_FILE = '_download_state.json' # starts with '_' so open_dataset() ignores it
+OVERLAP_ROWS = 5 # stored bars re-fetched on every update, to catch a provider that re-adjusted the past
+
+class YFinanceProvider:
+    '''
+    Downloads daily bars from Yahoo Finance.
+    :param auto_adjust: Adjust prices for splits and dividends (the yfinance default).
+    '''
+    COLUMNS = ['Date', 'Close', 'High', 'Low', 'Open', 'Volume'] # the columns (and order) yf.download used to give
+
+    def __init__(self, auto_adjust=True):
+        self.auto_adjust = auto_adjust
+
+    def fetch(self, ticker, start, end):
+        '''
+        Function to download the bars of one ticker.
+        :param ticker: Ticker symbol.
+        :param start: First date to download (inclusive).
+        :param end: Last date to download (exclusive, same as yf.download).
+        :return: DataFrame with a 'Date' column and the price/volume columns.
+        '''
+        import yfinance as yf # imported here so the fake provider works without yfinance installed
+
+        # Ticker.history instead of yf.download: download() keeps its results in module-global dicts (yfinance.shared),
+        # so calls from several worker threads can overwrite each other's data
+        data = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=self.auto_adjust)
+        if data.empty:
+            return pd.DataFrame(columns=self.COLUMNS)
+        data = data.rename_axis('Date').reset_index() # the index is named 'Datetime' for intraday bars
+        data['Date'] = data['Date'].dt.tz_localize(None) # exchange-local, tz-naive dates like the rest of the store
+        return data[[column for column in self.COLUMNS if column in data.columns]]
+
+class LocalProvider:
+    '''
+    Serves bars from in-memory DataFrames instead of the network (used for tests and benchmarks).
+    :param frames: Dictionary mapping ticker -> DataFrame with a 'Date' column.
+    :param failures: Optional dictionary mapping ticker -> number of times fetch should fail before it succeeds.
+    :param delay: Seconds to sleep on every call, to simulate network latency.
+    '''
+    def __init__(self, frames, failures=None, delay=0.0):
+        self.frames = frames
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def fetch(self, ticker, start, end):
+        with self._lock:
+            self.calls.append((ticker, start, end))
+            if self.failures.get(ticker, 0) > 0:
+                self.failures[ticker] -= 1
+                raise ConnectionError(f"simulated failure for {ticker}")
+        time.sleep(self.delay)
+        df = self.frames[ticker]
+        selected = (df['Date'] >= pd.Timestamp(start)) & (df['Date'] < pd.Timestamp(end))
+        return df[selected].reset_index(drop=True)
+
+class RateLimiter:
+    '''
+    Thread-safe limiter that spaces calls at least 1/rate seconds apart across all workers.
+    :param rate: Maximum number of calls per second (None or 0 = unlimited).
+    '''
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(now, self.next_time)
+            self.next_time = wait_until + self.interval
+        if wait_until > now:
+            time.sleep(wait_until - now)
+
+def watermark(root, ticker):
+    '''
+    Function to find the last date already stored for a ticker.
+    :param root: Raw store folder.
+    :param ticker: Ticker symbol.
+    :return: pd.Timestamp of the last stored bar, or None if nothing is stored yet.
+    '''
+    if not os.path.exists(storage.partition_path(root, ticker)):
+        return None
+    dates = storage.read_table(root, ticker, columns=['Date']).column('Date')
+    return pd.Timestamp(dates[-1].as_py()) if len(dates) else None
+
+def fetch_with_retry(provider, ticker, start, end, limiter, max_retries=4, backoff=1.0):
+    '''
+    Function to call provider.fetch, retrying with exponential backoff (plus jitter) when it raises.
+    :param max_retries: Number of retries after the first attempt.
+    :param backoff: Seconds to wait before the first retry; doubles after every failure.
+    :return: DataFrame returned by the provider.
+    '''
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return provider.fetch(ticker, start, end)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random() * 0.1))
+
+def update_ticker(provider, ticker, start_date, end_date, limiter, root=storage.RAW_ROOT, max_retries=4, backoff=1.0,
+                  overlap=OVERLAP_ROWS):
+    '''
+    Function to bring one ticker's raw data up to date: fetches the range after its watermark plus the last `overlap` stored bars
+    and appends the new bars. If the re-fetched overlap no longer matches the stored closes (the provider re-adjusted the past
+    for a split or dividend), the full history is fetched again and rewritten instead, so no fake price jump is stored.
+    :param start_date: First date to download if the ticker has no data yet.
+    :param end_date: Last date to download (exclusive).
+    :param overlap: Number of stored bars re-fetched to check that the stored history still matches the provider.
+    :return: Number of new rows (bars after the previous watermark) written.
+    '''
+    last = watermark(root, ticker)
+    end = pd.Timestamp(end_date)
+    if last is None:
+        start = pd.Timestamp(start_date)
+    else:
+        stored = storage.read_partition(root, ticker, columns=['Date', 'Close']).tail(overlap)
+        start = stored['Date'].iloc[0] # no day arithmetic on the watermark, so intraday bars work too
+    if start >= end or (last is not None and last >= end):
+        return 0
+    new = fetch_with_retry(provider, ticker, start.date().isoformat(), end.date().isoformat(), limiter, max_retries, backoff)
+    new = new[new['Date'] >= start] # the range starts at a date, intraday bars before the first wanted one are dropped
+    if len(new) == 0:
+        return 0
+    if last is None:
+        storage.write_partition(new.sort_values('Date').reset_index(drop=True), root, ticker)
+        return len(new)
+    refetched = stored.merge(new[['Date', 'Close']], on='Date', how='left', suffixes=('', '_new')) # NaN = bar gone
+    rewrite = not np.allclose(refetched['Close'], refetched['Close_new'], rtol=1e-6, atol=0.0, equal_nan=True)
+    if not rewrite:
+        new = new[new['Date'] > last]
+        if len(new) == 0:
+            return 0
+    old = storage.read_partition(root, ticker)
+    if rewrite:
+        print(f"{ticker}: the provider's closes for the last {len(stored)} stored bars changed (split or dividend "
+              f"re-adjustment), rewriting the full history")
+        first = old['Date'].iloc[0]
+        new = fetch_with_retry(provider, ticker, first.date().isoformat(), end.date().isoformat(), limiter, max_retries, backoff)
+        new = new[new['Date'] >= first]
+        if len(new) < len(old):
+            raise ValueError(f"{ticker}: the provider returned {len(new)} bars to replace {len(old)} stored ones, the stored "
+                             f"data was left untouched")
+    missing = old.columns.difference(new.columns)
+    if len(missing):
+        raise ValueError(f"{ticker}: the provider returned no {list(missing)} columns, the stored data was left untouched")
+    appended = int((new['Date'] > last).sum())
+    new = new.reindex(columns=old.columns) # extra columns are dropped
+    if not rewrite:
+        new = pd.concat([old, new], ignore_index=True)
+    storage.write_partition(new.sort_values('Date').reset_index(drop=True), root, ticker) # atomic, so the watermark is always consistent
+    return appended
+
+def load_checkpoint(root, end_date):
+    '''
+    Function to load the progress of an unfinished run with the same end date (a finished or different run starts fresh).
+    :return: Dictionary with 'end', 'done' (tickers finished in this run) and 'failed' (ticker -> error message).
+    '''
+    path = os.path.join(root, CHECKPOINT_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('end') == end_date:
+            return checkpoint
+    return {'end': end_date, 'done': [], 'failed': {}}
+
+def save_checkpoint(root, checkpoint):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def download(tickers, start_date=DEFAULT_START_DATE, end_date=None, provider=None, root=storage.RAW_ROOT,
+             workers=8, rate=2.0, max_retries=4, backoff=1.0):
+    '''
+    Function to update the raw store for a whole universe of tickers.
+    :param tickers: List of ticker symbols.
+    :param start_date: First date to download for tickers that have no data yet.
+    :param end_date: Last date to download (exclusive); defaults to today.
+    :param provider: Data source with a fetch(ticker, start, end) method; defaults to YFinanceProvider.
+    :param root: Raw store folder.
+    :param workers: Number of concurrent downloads.
+    :param rate: Maximum number of requests per second across all workers.
+    :param max_retries: Retries per ticker before it is marked as failed.
+    :param backoff: Seconds before the first retry (doubles on each retry).
+    :return: Dictionary with 'rows' (ticker -> rows appended in this call) and 'failed' (ticker -> error message).
+    '''
+    end_date = end_date or date.today().isoformat()
+    provider = provider or YFinanceProvider()
+    limiter = RateLimiter(rate)
+    checkpoint = load_checkpoint(root, end_date)
+    done = set(checkpoint['done'])
+    pending = [ticker for ticker in dict.fromkeys(tickers) if ticker not in done]
+    rows = {}
+    lock = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(update_ticker, provider, ticker, start_date, end_date, limiter, root, max_retries, backoff): ticker
+                   for ticker in pending}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            with lock:
+                try:
+                    rows[ticker] = future.result()
+                    checkpoint['done'].append(ticker)
+                    checkpoint['failed'].pop(ticker, None)
+                    print(f"{ticker}: {rows[ticker]} new rows")
+                except Exception as error:
+                    checkpoint['failed'][ticker] = repr(error)
+                    print(f"{ticker}: failed ({error!r})")
+                save_checkpoint(root, checkpoint)
+
+    if not checkpoint['failed'] and set(tickers) <= set(checkpoint['done']):
+        os.remove(os.path.join(root, CHECKPOINT_FILE)) # run finished, the next run starts from the watermarks again
+    return {'rows': rows, 'failed': dict(checkpoint['failed'])}
+
+def read_universe(path):
+    '''
+    Function to read a universe file: one ticker per line, blank lines and lines starting with '#' are skipped.
+    '''
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
-for ticker in tickers:
-    print(f"Downloading data for {ticker}...")
-    # Download historical data for the specified ticker and date range
-    data = yf.download(ticker, start=start_date, end=end_date, progress=False)
-    print(f"Saving data for {ticker} to CSV...")
-    
-    data = data.reset_index()  # Reset index to have 'Date' as a column
-    data = data.droplevel(1, axis=1)  # Drop the multi-level column index
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download daily bars into the raw store (only what is missing).")
+    parser.add_argument('--tickers', nargs='+', default=None, help="ticker symbols (default: the starter universe)")
+    parser.add_argument('--tickers-file', default=None, help="file with one ticker per line")
+    parser.add_argument('--start', default=DEFAULT_START_DATE, help="first date for tickers with no data yet")
+    parser.add_argument('--end', default=None, help="last date, exclusive (default: today)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=2.0, help="max requests per second")
+    parser.add_argument('--root', default=storage.RAW_ROOT)
+    args = parser.parse_args(argv)
 
-    # Save the data to a CSV file ensuring it does not include the index
-    data.to_csv(f"../data/{ticker}_data.csv", index=False)
+    tickers = read_universe(args.tickers_file) if args.tickers_file else (args.tickers or DEFAULT_TICKERS)
+    result = download(tickers, args.start, args.end, root=args.root, workers=args.workers, rate=args.rate)
+    print(f"Data collection complete: {sum(result['rows'].values())} new rows, {len(result['failed'])} failed tickers.")
+    return 1 if result['failed'] else 0
 
-print("Data collection complete.")
\ No newline at end of file
+if __name__ == '__main__':
+    raise SystemExit(main())
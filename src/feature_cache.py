@@ -0,0 +1,123 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# Content-addressed cache for feature columns.
+# FeaturePlan.column_keys() gives every column a key built from the fingerprint of the raw input slice (Close/Volume values),
+# the column's recipe (bytecode + captured parameters), the shared primitives it calls and the keys of the columns it reads.
+# Each column is stored on its own, so rerunning build_features with unchanged data and parameters loads every column from disk,
+# and changing one parameter (say RSI 14 -> 21) only recomputes that column and the columns that depend on it.
+#
+# Layout: one .npy file per column in {cache_dir}/{key[:2]}/{key}.npy. The cache is bounded by max_bytes and evicts the least
+# recently used files first; a hit touches the file's mtime so recency survives across runs.
+
+# same data/ folder as storage.DATA_DIR (not imported from there, so the cache doesn't load pyarrow)
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('TRADING_ML_DATA_DIR') or
+                                 os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')), 'cache', 'features')
+
+class FeatureCache:
+    '''
+    Size-bounded LRU store of feature columns keyed by content fingerprints.
+    :param cache_dir: Folder holding the cached columns.
+    :param max_bytes: Maximum total size of the cached files; the least recently used columns are evicted above it.
+    '''
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> file size, least recently used first
+        self.total_bytes = 0
+        self.reset_stats()
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.npy')
+
+    def _scan(self):
+        '''
+        Function to rebuild the LRU index from the files already on disk (oldest mtime first).
+        '''
+        found = []
+        if os.path.isdir(self.cache_dir):
+            for folder in os.listdir(self.cache_dir):
+                folder_path = os.path.join(self.cache_dir, folder)
+                if not os.path.isdir(folder_path):
+                    continue
+                for name in os.listdir(folder_path):
+                    if name.endswith('.npy'):
+                        stat = os.stat(os.path.join(folder_path, name))
+                        found.append((stat.st_mtime, name[:-len('.npy')], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def reset_stats(self):
+        '''
+        Function to clear the hit/miss counters (e.g. at the start of a run).
+        '''
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_read': 0, 'bytes_written': 0}
+        self.recomputed = [] # names of the columns that were not in the cache
+        self.loaded = [] # names of the columns that were loaded from the cache
+
+    def get(self, key, name=None):
+        '''
+        Function to load a cached column.
+        :param key: Cache key (see FeaturePlan.column_keys).
+        :param name: Column name, only used for the recomputed/loaded lists.
+        :return: The cached array, or None on a miss.
+        '''
+        if key in self.entries:
+            try:
+                values = np.load(self._path(key))
+                os.utime(self._path(key))
+            except (FileNotFoundError, ValueError): # evicted or half-written by another process
+                self._forget(key)
+            else:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                self.stats['bytes_read'] += values.nbytes
+                self.loaded.append(name or key)
+                return values
+        self.stats['misses'] += 1
+        self.recomputed.append(name or key)
+        return None
+
+    def put(self, key, values, name=None):
+        '''
+        Function to store a computed column and evict the least recently used columns if the cache is over its size limit.
+        :param key: Cache key (see FeaturePlan.column_keys).
+        :param values: Array to store.
+        :param name: Column name (unused, kept so get/put have the same signature).
+        '''
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(values))
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        self._forget(key)
+        self.entries[key] = size
+        self.total_bytes += size
+        self.stats['bytes_written'] += size
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            self._forget(oldest)
+            try:
+                os.remove(self._path(oldest))
+            except FileNotFoundError:
+                pass
+            self.stats['evictions'] += 1
+
+    def _forget(self, key):
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)
+
+    def summary(self):
+        '''
+        Function to describe the cache and the counters since the last reset_stats().
+        :return: Dictionary with the counters, the hit rate, the number of entries and the total size.
+        '''
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {**self.stats, 'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'entries': len(self.entries), 'total_bytes': self.total_bytes}
@@ -1,8 +1,14 @@
+import hashlib
+import time
+
 import pandas as pd
 import numpy as np
-from ta.momentum import RSIIndicator
 
-df = pd.read_csv('../data/AAPL_data.csv', parse_dates=['Date'])
+import kernels
+
+# Only pandas, numpy and kernels.py are imported up front. Optional or heavier dependencies (ta, pyarrow through storage.py, the
+# feature cache, numba through kernels.py) are imported inside the functions that need them, so importing this module stays cheap
+# (see benchmarks/bench_import_time.py).
 
 # Target Variable: For each row, I need to answer: did the price go up or down the next trading day?
 
@@ -222,6 +228,8 @@ def relative_strength_index(df, window=14):
     :param window: Period for RSI (default 14).
     :return: DataFrame with the new RSI column.
     '''
+    from ta.momentum import RSIIndicator # only this helper needs ta; build_features computes the same RSI without it
+
     # Initialize the RSI Indicator
     rsi_io = RSIIndicator(close=df['Close'], window=window)
     
@@ -375,53 +383,728 @@ def drop_nans_warmup(df):
 
 
 
-def build_features(df, df_name="stock_data"):
+# Fused feature plan: build_features used to call every helper above one after another. Each helper inserted its columns into the
+# same DataFrame (so the frame got reallocated ~30 times per ticker) and recomputed the windows it needed, e.g. MA_20 was rolled once
+# for price_relative_to_ma and again for the Bollinger middle band.
+# The plan below compiles the requested columns into recipes, computes every shared primitive (rolling mean/std, EMA, shift) once
+# over contiguous float64 arrays and only materializes the requested output columns at the end.
+# The primitives go through the same pandas rolling/ewm kernels as the helpers, so the output is bit-for-bit identical to the old chain
+# (the EMA and rolling mean use kernels.py instead only when its backend gives pandas' exact bits faster, see kernels.replaces_pandas).
+# Arrays are always 2-D (rows = dates, columns = series) so the same plan works for one ticker or for many side by side.
+
+def _shift(values, periods):
+    '''
+    Function to shift a 2-D array along the rows, filling the gap with NaN (same as pandas' shift).
+    :param values: float64 array of shape (rows, series).
+    :param periods: Number of rows to shift down (positive) or up (negative).
+    :return: Shifted array with the same shape as values.
+    '''
+    out = np.full_like(values, np.nan)
+    if periods > 0:
+        out[periods:] = values[:-periods]
+    elif periods < 0:
+        out[:periods] = values[-periods:]
+    else:
+        out[:] = values
+    return out
+
+def _cumsum_skipna(values):
+    '''
+    Function to take the cumulative sum down the rows while skipping NaN values (same as pandas' cumsum).
+    :param values: float64 array of shape (rows, series).
+    :return: Cumulative sum with NaN kept at the positions where the input was NaN.
+    '''
+    mask = np.isnan(values)
+    out = np.cumsum(np.where(mask, 0.0, values), axis=0)
+    out[mask] = np.nan
+    return out
+
+class FeatureArrays:
+    '''
+    Memoizes the columns and primitives of one plan run, so a window shared by several features is only computed once.
+    :param recipes: Dictionary mapping column name -> function(arrays) that returns the column as a 2-D array.
+    :param inputs: Dictionary with the raw 2-D float64 input arrays ('Close' and 'Volume').
+    :param store: Optional FeatureCache; columns found in it are loaded instead of computed, and computed columns are saved to it.
+    :param keys: Dictionary mapping column name -> cache key (required with store, see FeaturePlan.column_keys).
+    '''
+    def __init__(self, recipes, inputs, store=None, keys=None):
+        self.recipes = recipes
+        self.store = store
+        self.keys = keys
+        self.cache = {('column', name): values for name, values in inputs.items()}
+
+    def _memo(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def _load_or_compute(self, name):
+        if self.store is None:
+            return self.recipes[name](self)
+        values = self.store.get(self.keys[name], name)
+        if values is None:
+            values = self.recipes[name](self)
+            self.store.put(self.keys[name], values, name)
+        return values
+
+    def column(self, name):
+        return self._memo(('column', name), lambda: self._load_or_compute(name))
+
+    def shift(self, name, periods):
+        return self._memo(('shift', name, periods), lambda: _shift(self.column(name), periods))
+
+    def sma(self, name, window):
+        if kernels.replaces_pandas('rolling_mean'):
+            return self._memo(('sma', name, window), lambda: kernels.rolling_mean(self.column(name), window))
+        return self._memo(('sma', name, window), lambda: pd.DataFrame(self.column(name), copy=False).rolling(window=window).mean().to_numpy())
+
+    def std(self, name, window):
+        return self._memo(('std', name, window), lambda: pd.DataFrame(self.column(name), copy=False).rolling(window=window).std().to_numpy())
+
+    def ema(self, name, span):
+        if kernels.replaces_pandas('ema'):
+            return self._memo(('ema', name, span), lambda: kernels.ema(self.column(name), span=span))
+        return self._memo(('ema', name, span), lambda: pd.DataFrame(self.column(name), copy=False).ewm(span=span, adjust=False).mean().to_numpy())
+
+    def cumsum(self, name):
+        return self._memo(('cumsum', name), lambda: _cumsum_skipna(self.column(name)))
+
+    def wilder(self, name, window):
+        # Wilder's smoothing is an EMA with alpha = 1/window that only starts reporting after a full window (same as ta's RSI)
+        if kernels.replaces_pandas('wilder'):
+            return self._memo(('wilder', name, window), lambda: kernels.wilder(self.column(name), window))
+        return self._memo(('wilder', name, window), lambda: pd.DataFrame(self.column(name), copy=False).ewm(alpha=1 / window, min_periods=window, adjust=False).mean().to_numpy())
+
+def _rsi(a, window):
+    '''
+    Function to calculate the RSI the same way ta.momentum.RSIIndicator does, but on 2-D arrays.
+    :param a: FeatureArrays for the current run.
+    :param window: Period for RSI.
+    :return: 2-D array with the RSI values.
+    '''
+    avg_gain = a.wilder('Gain', window)
+    avg_loss = a.wilder('Loss', window)
+    return np.where(avg_loss == 0, 100, 100 - (100 / (1 + avg_gain / avg_loss)))
+
+def _recipe_fingerprint(func):
+    '''
+    Function to fingerprint a recipe: its bytecode plus the values it captured (windows, spans...), so changing either one
+    gives the column a new cache key.
+    '''
+    code = func.__code__
+    captured = [cell.cell_contents for cell in func.__closure__ or ()]
+    parts = (code.co_code, code.co_consts, code.co_names, func.__defaults__, captured)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+_kernel_version = None
+
+def _kernel_fingerprint():
+    '''
+    Function to fingerprint the shared primitives the recipes call (and the pandas/numpy versions behind them), so editing a
+    primitive or upgrading pandas invalidates every cached column. The kernels module and its active backend are part of it too,
+    since FeatureArrays only uses the kernels on some backends (see kernels.replaces_pandas).
+    '''
+    global _kernel_version
+    if _kernel_version is None:
+        import inspect
+        sources = [inspect.getsource(obj) for obj in (FeatureArrays, _shift, _cumsum_skipna, _rsi, kernels)]
+        _kernel_version = hashlib.blake2b(repr((sources, pd.__version__, np.__version__)).encode(), digest_size=16).hexdigest()
+    return f'{_kernel_version}-{kernels.fingerprint()}' # the backend can change within a process (TRADING_ML_KERNELS, benchmarks)
+
+def fingerprint_inputs(close, volume):
+    '''
+    Function to fingerprint the raw input slice of a plan run (values, shape and dtype of Close and Volume).
+    :return: Hex digest string.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (close, volume):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        digest.update(repr(values.shape).encode())
+        digest.update(values.data)
+    return digest.hexdigest()
+
+class FeaturePlan:
+    '''
+    Compiled list of feature recipes. Only the columns in `columns` are returned by compute(), every other recipe is only
+    evaluated if one of the requested columns depends on it.
+    :param columns: Output column names (in order), or None for every feature build_features has always produced.
+    The remaining parameters are the same windows build_features uses.
+    '''
+    def __init__(self, columns=None, ma_windows=(20, 50), n_days=10, rsi_window=14, short_window=12, long_window=26,
+                 signal_window=9, bollinger_window=20, volume_window=20, obv_window=20):
+        recipes = {}
+        dependencies = {} # column name -> columns the recipe reads, used to build the cache keys
+        intermediates = [] # price/volume-scale building blocks the model doesn't use (dropped by without_intermediates)
+
+        def add(name, depends_on, recipe, intermediate=False):
+            recipes[name] = recipe
+            dependencies[name] = tuple(depends_on)
+            if intermediate:
+                intermediates.append(name)
+
+        # helper series that are not outputs by default, but other recipes build on them
+        add('Change', ['Close'], lambda a: a.column('Close') - a.shift('Close', 1)) # same as Close.diff()
+        add('Gain', ['Change'], lambda a: np.where(a.column('Change') > 0, a.column('Change'), 0.0))
+        add('Loss', ['Change'], lambda a: -np.where(a.column('Change') < 0, a.column('Change'), 0.0))
+        add('Signed_Volume', ['Change', 'Volume'], lambda a: np.nan_to_num(np.sign(a.column('Change')), nan=0.0) * a.column('Volume'))
+        helpers = list(recipes)
+
+        add('Target', ['Close'], lambda a: ((a.shift('Close', -1) - a.column('Close')) / a.column('Close') > 0).astype(np.int64))
+        add('Daily_Return', ['Close'], lambda a: a.column('Close') / a.shift('Close', 1) - 1)
+        for window in ma_windows:
+            add(f'MA_{window}', ['Close'], lambda a, w=window: a.sma('Close', w), intermediate=True)
+            add(f'Price_Relative_to_MA_{window}', ['Close'], lambda a, w=window: a.column('Close') / a.sma('Close', w) - 1)
+        for i in range(1, n_days + 1):
+            add(f'Return_Day_{i}', ['Close'], lambda a, i=i: (a.column('Close') - a.shift('Close', i)) / a.column('Close'))
+        add(f'RSI_{rsi_window}', ['Gain', 'Loss'], lambda a: _rsi(a, rsi_window))
+        add(f'EMA_{short_window}', ['Close'], lambda a: a.ema('Close', short_window), intermediate=True)
+        add(f'EMA_{long_window}', ['Close'], lambda a: a.ema('Close', long_window), intermediate=True)
+        add('MACD', [f'EMA_{short_window}', f'EMA_{long_window}'], lambda a: a.column(f'EMA_{short_window}') - a.column(f'EMA_{long_window}'))
+        add('Signal_Line', ['MACD'], lambda a: a.ema('MACD', signal_window))
+        add(f'MACD_Histogram_{signal_window}', ['MACD', 'Signal_Line'], lambda a: a.column('MACD') - a.column('Signal_Line'))
+        w = bollinger_window
+        add(f'Middle_Band_{w}', ['Close'], lambda a: a.sma('Close', w), intermediate=True)
+        add(f'Standard_Deviation_{w}', ['Close'], lambda a: a.std('Close', w), intermediate=True)
+        add(f'Upper_Band_{w}', [f'Middle_Band_{w}', f'Standard_Deviation_{w}'], lambda a: a.column(f'Middle_Band_{w}') + (2 * a.column(f'Standard_Deviation_{w}')), intermediate=True)
+        add(f'Lower_Band_{w}', [f'Middle_Band_{w}', f'Standard_Deviation_{w}'], lambda a: a.column(f'Middle_Band_{w}') - (2 * a.column(f'Standard_Deviation_{w}')), intermediate=True)
+        add(f'Bollinger_Normalized_{w}', ['Close', f'Middle_Band_{w}', f'Standard_Deviation_{w}'], lambda a: (a.column('Close') - a.column(f'Middle_Band_{w}')) / a.column(f'Standard_Deviation_{w}'))
+        add(f'Volume_SMA_{volume_window}', ['Volume'], lambda a: a.sma('Volume', volume_window), intermediate=True)
+        add(f'Volume_Ratio_{volume_window}', ['Volume', f'Volume_SMA_{volume_window}'], lambda a: a.column('Volume') / a.column(f'Volume_SMA_{volume_window}'))
+        add('OBV', ['Signed_Volume'], lambda a: a.cumsum('Signed_Volume'), intermediate=True)
+        add(f'OBV_ROC_{obv_window}', ['OBV'], lambda a: np.clip(a.column('OBV') / a.shift('OBV', obv_window) - 1, -10, 10))
+
+        features = [name for name in recipes if name not in helpers]
+        self.columns = features if columns is None else list(columns)
+        unknown = [name for name in self.columns if name not in features]
+        if unknown:
+            raise ValueError(f"Unknown feature columns: {unknown}. Available: {features}")
+        self.recipes = recipes
+        self.dependencies = dependencies
+        self.intermediates = intermediates
+        self.params = dict(columns=self.columns, ma_windows=tuple(ma_windows), n_days=n_days, rsi_window=rsi_window,
+                           short_window=short_window, long_window=long_window, signal_window=signal_window,
+                           bollinger_window=bollinger_window, volume_window=volume_window, obv_window=obv_window)
+
+    def without_intermediates(self):
+        '''
+        Function to get the same plan without the intermediate columns (moving averages, EMAs, bands, Volume_SMA, raw OBV).
+        They are still computed when an output depends on them, but only while compute() runs; they never reach the output.
+        :return: New FeaturePlan with the same parameters.
+        '''
+        return FeaturePlan(**{**self.params, 'columns': [name for name in self.columns if name not in self.intermediates]})
+
+    def __reduce__(self):
+        # the recipes are closures and can't be pickled, so a plan is sent to other processes as its parameters and rebuilt there
+        return (_plan_from_params, (self.params,))
+
+    def column_keys(self, input_key):
+        '''
+        Function to build the cache key of every column for one input slice. A column's key combines its recipe fingerprint
+        with the keys of the columns it reads, so changing a parameter changes the key of that column and of its dependents only.
+        :param input_key: Fingerprint of the raw inputs (see fingerprint_inputs).
+        :return: Dictionary mapping column name -> cache key.
+        '''
+        keys = {'Close': f'{input_key}-Close', 'Volume': f'{input_key}-Volume'}
+        kernel = _kernel_fingerprint()
+
+        def key(name):
+            if name not in keys:
+                parts = [kernel, name, _recipe_fingerprint(self.recipes[name])] + [key(dep) for dep in self.dependencies[name]]
+                keys[name] = hashlib.blake2b('|'.join(parts).encode(), digest_size=16).hexdigest()
+            return keys[name]
+
+        for name in self.recipes:
+            key(name)
+        return keys
+
+    def compute(self, close, volume, cache=None):
+        '''
+        Function to run the plan over raw price and volume arrays.
+        :param close: Array of closing prices, shape (rows,) or (rows, series).
+        :param volume: Array of trading volumes with the same shape as close.
+        :param cache: Optional FeatureCache (see feature_cache.py) to load unchanged columns from instead of recomputing them.
+        :return: Dictionary mapping each requested column name -> array with the same shape as close.
+        '''
+        one_dimensional = np.ndim(close) == 1
+        inputs = {name: np.ascontiguousarray(values, dtype=np.float64) for name, values in (('Close', close), ('Volume', volume))}
+        if one_dimensional:
+            inputs = {name: values[:, None] for name, values in inputs.items()}
+        keys = self.column_keys(fingerprint_inputs(inputs['Close'], inputs['Volume'])) if cache is not None else None
+        arrays = FeatureArrays(self.recipes, inputs, cache, keys)
+        with np.errstate(divide='ignore', invalid='ignore'): # 0/0 and x/0 give NaN/inf just like they do in pandas
+            features = {name: arrays.column(name) for name in self.columns}
+        if one_dimensional:
+            features = {name: values[:, 0] for name, values in features.items()}
+        return features
+
+def _plan_from_params(params):
+    return FeaturePlan(**params)
+
+DEFAULT_FEATURE_PLAN = FeaturePlan() # the windows build_features has always used
+
+# Compact mode: the model only needs the normalized features, so compact=True drops the intermediate columns (see
+# FeaturePlan.without_intermediates), stores float features as float32 (~7 significant digits, far below the noise in any of
+# these indicators) and Target as int8. The raw columns keep their dtypes so prices stay exact for backtests.
+# memory_report() gives the resulting bytes per row.
+
+def compact_dtype(values):
+    '''
+    Function to pick the smallest dtype that holds a feature column: float32 for floats when every finite value fits,
+    int8 for 0/1-style integers.
+    :param values: NumPy array.
+    :return: NumPy dtype (values.dtype when no smaller dtype can hold the values).
+    '''
+    if values.dtype.kind == 'f':
+        finite = values[np.isfinite(values)]
+        if not finite.size or np.abs(finite).max() <= np.finfo(np.float32).max:
+            return np.dtype(np.float32)
+    elif values.dtype.kind in 'iu' and values.size and values.min() >= np.iinfo(np.int8).min and values.max() <= np.iinfo(np.int8).max:
+        return np.dtype(np.int8)
+    return values.dtype
+
+def compact_array(values):
+    '''
+    Function to downcast one feature column to compact_dtype(values).
+    '''
+    return values.astype(compact_dtype(values), copy=False)
+
+def memory_report(df):
+    '''
+    Function to measure how much memory a feature frame takes.
+    :param df: DataFrame (e.g. the output of build_features or combine_datasets).
+    :return: Dictionary with 'rows', 'bytes', 'bytes_per_row' and 'columns' (column -> bytes).
+    '''
+    usage = df.memory_usage(index=False, deep=True)
+    return {'rows': len(df), 'bytes': int(usage.sum()), 'bytes_per_row': usage.sum() / len(df) if len(df) else 0.0,
+            'columns': {column: int(size) for column, size in usage.items()}}
+
+def profile_stage(profile, stage, seconds, rows):
+    '''
+    Function to add one timed stage to a profile dictionary (see build_features), accumulating across calls.
+    :param profile: Dictionary stage -> {'calls', 'seconds', 'rows', 'rows_per_sec'}, or None to do nothing.
+    :param stage: Stage name.
+    :param seconds: Wall time of the stage.
+    :param rows: Number of rows the stage processed.
+    '''
+    if profile is None:
+        return
+    entry = profile.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'rows_per_sec': 0.0})
+    entry['calls'] += 1
+    entry['seconds'] += seconds
+    entry['rows'] += rows
+    entry['rows_per_sec'] = entry['rows'] / entry['seconds'] if entry['seconds'] else 0.0
+
+def format_profile(profile, label="build_features"):
+    '''
+    Function to format a profile dictionary as one line per stage.
+    '''
+    return "\n".join(f"{label} {stage:10s} {entry['seconds'] * 1e3:9.2f} ms  {entry['rows']:>10d} rows  {entry['rows_per_sec']:>14,.0f} rows/s"
+                     for stage, entry in profile.items())
+
+def compute_features(df, plan=DEFAULT_FEATURE_PLAN, cache=None, compact=False, profile=None):
+    '''
+    Function to compute the features of a compiled plan for one ticker, without saving anything to disk.
+    :param df: DataFrame containing the raw stock data with at least 'Close' and 'Volume' columns.
+    :param plan: FeaturePlan describing which columns to compute (defaults to every feature).
+    :param cache: Optional FeatureCache; columns whose inputs and parameters didn't change are loaded from it.
+    :param compact: Whether to drop the intermediate columns and downcast the features (see compact_array).
+    :param profile: Optional dictionary to add the 'features' and 'assemble' stage timings to (see profile_stage).
+    :return: DataFrame with the raw columns plus the requested feature columns, with NaN warm-up rows dropped.
+    '''
+    start = time.perf_counter()
+    if compact:
+        plan = plan.without_intermediates()
+    features = plan.compute(df['Close'].to_numpy(), df['Volume'].to_numpy(), cache)
+    if compact:
+        features = {name: compact_array(values) for name, values in features.items()}
+    profile_stage(profile, 'features', time.perf_counter() - start, len(df))
+
+    start = time.perf_counter()
+    raw = df.drop(columns=[name for name in features if name in df.columns]) # avoids duplicated columns if df was already processed
+    df = drop_nans_warmup(pd.concat([raw, pd.DataFrame(features, index=df.index)], axis=1))
+    profile_stage(profile, 'assemble', time.perf_counter() - start, len(raw))
+    return df
+
+def build_features(df, df_name="stock_data", plan=DEFAULT_FEATURE_PLAN, cache=None, root=None, compact=False, profile=None):
     '''
     Function to build all features for the stock price prediction model.
     :param df: DataFrame containing the raw stock data with at least 'Close', 'Volume', 'High', 'Low', and 'Open' columns.
+    :param df_name: Ticker name the features are stored under in data/processed/features.
+    :param plan: FeaturePlan describing which columns to compute (defaults to every feature).
+    :param cache: Optional FeatureCache; columns whose inputs and parameters didn't change are loaded from it.
+    :param root: Feature store folder (defaults to storage.FEATURES_ROOT).
+    :param compact: Whether to store only the model features, as float32 with an int8 Target (see compute_features).
+    :param profile: Opt-in profiling: True to print the wall time and rows/sec of every stage ('features', 'assemble', 'write'),
+                    or a dictionary to accumulate them into (e.g. over many tickers, see profile_stage). Off by default.
     :return: DataFrame with all engineered features added and NaN values dropped.
     '''
-    df = get_target_variable(df) # adds the target variable column
-    df = daily_returns(df) # adds daily return feature
-    df = price_relative_to_ma(df, window=20) # adds price relative to 20-day moving average feature
-    df = price_relative_to_ma(df, window=50) # adds price relative to 50-day moving average feature
-    df = multi_day_returns(df, n_days=10) # adds multi-day return features
-    df = relative_strength_index(df, window=14) # adds RSI feature
-    df = moving_average_convergence_divergence(df, short_window=12, long_window=26, signal_window=9) # adds MACD and Signal Line features
-    # df = bollinger_bands(df, window=20) # adds Bollinger Bands features
-    df = bollinger_normalized(df, window=20) # adds Bollinger Normalized feature
-    df = volume_ratio(df, window=20) # adds Volume Ratio feature (which also calculates Volume SMA)
-    df = on_balance_volume(df) # adds On-Balance Volume feature
-    df = obv_rate_of_change(df, window=20) # adds OBV Rate of Change feature
-    df = drop_nans_warmup(df) # drops rows with NaN values resulting from feature calculations
-    df.to_csv(f'../data/processed/{df_name}_with_features.csv', index=False) # saves the processed DataFrame with features to a CSV file
+    import storage
+
+    stages = {} if profile is True else (profile if isinstance(profile, dict) else None)
+    df = compute_features(df, plan, cache, compact, stages) # computes every feature in a single fused pass (see FeaturePlan)
+    start = time.perf_counter()
+    storage.write_partition(df, root or storage.FEATURES_ROOT, df_name) # saves the processed DataFrame with features to the columnar store
+    profile_stage(stages, 'write', time.perf_counter() - start, len(df))
+    if profile is True:
+        print(format_profile(stages, f"build_features[{df_name}]"))
     return df
 
-build_features(df, df_name="AAPL")
-build_features(pd.read_csv('../data/MSFT_data.csv', parse_dates=['Date']), df_name="MSFT")
-build_features(pd.read_csv('../data/QQQ_data.csv', parse_dates=['Date']), df_name="QQQ")
-build_features(pd.read_csv('../data/SPY_data.csv', parse_dates=['Date']), df_name="SPY")
-build_features(pd.read_csv('../data/TSLA_data.csv', parse_dates=['Date']), df_name="TSLA")
+# Combining tickers: the first version concatenated the growing combined frame with every new ticker (pd.concat inside the loop),
+# which copies everything collected so far once per ticker (quadratic in the number of tickers), and it also added the 'Dataset'
+# column to the caller's frames. Now each ticker is copied once into preallocated column buffers (or written straight to an Arrow
+# file), and 'Dataset' is stored as a categorical (one small integer code per row instead of a repeated string).
+# df_list can be a generator that loads one ticker at a time, so only one ticker plus the output is ever held in memory.
 
-def combine_datasets(df_list, df_names):
+def combine_datasets(df_list, df_names, output_path=None, chunk_rows=None):
     '''
     Function to combine multiple DataFrames with features into a single DataFrame for modeling.
-    :param df_list: List of DataFrames to combine.
+    :param df_list: List (or any iterable, e.g. a generator reading one ticker at a time) of DataFrames to combine. They are not modified.
     :param df_names: List of names corresponding to each DataFrame for identification.
-    :return: Combined DataFrame with an additional column indicating the source dataset.
-    '''
-    combined_df = pd.DataFrame() # initializes an empty DataFrame to hold the combined data
-    for df, name in zip(df_list, df_names): # iterates through each DataFrame and its corresponding name
-        df['Dataset'] = name # adds a new column to indicate the source dataset
-        combined_df = pd.concat([combined_df, df], ignore_index=True) # concatenates the current DataFrame to the combined DataFrame
-    return combined_df
-
-appl_feat_df = pd.read_csv('../data/processed/AAPL_with_features.csv', parse_dates=['Date']) # loads the AAPL dataset with features
-msft_feat_df = pd.read_csv('../data/processed/MSFT_with_features.csv', parse_dates=['Date']) # loads the MSFT dataset with features
-qqq_feat_df = pd.read_csv('../data/processed/QQQ_with_features.csv', parse_dates=['Date']) # loads the QQQ dataset with features
-spy_feat_df = pd.read_csv('../data/processed/SPY_with_features.csv', parse_dates=['Date']) # loads the SPY dataset with features
-tsla_feat_df = pd.read_csv('../data/processed/TSLA_with_features.csv', parse_dates=['Date']) # loads the TSLA dataset with features
-datasets = [appl_feat_df, msft_feat_df, qqq_feat_df, spy_feat_df, tsla_feat_df]
-dataset_names = ["AAPL", "MSFT", "QQQ", "SPY", "TSLA"]
-
-combine_datasets(datasets, dataset_names).to_csv('../data/processed/combined_stock_data_with_features.csv', index=False) # combines all datasets and saves to a CSV file
\ No newline at end of file
+    :param output_path: Optional Arrow IPC file to stream the combined rows into instead of building a DataFrame.
+    :param chunk_rows: With output_path, maximum number of rows per written record batch.
+    :return: Combined DataFrame with a categorical 'Dataset' column indicating the source dataset (or output_path if given).
+    '''
+    df_names = list(df_names)
+    categories = list(dict.fromkeys(df_names)) # one category per name, in order of first appearance
+    codes = {name: code for code, name in enumerate(categories)}
+    pairs = zip(df_list, df_names)
+
+    if output_path is not None:
+        import storage
+
+        with storage.CombinedWriter(output_path, categories) as writer:
+            for df, name in pairs:
+                writer.write(df.drop(columns=['Dataset'], errors='ignore'), name, chunk_rows)
+        return output_path
+
+    # exact size when the frames are already in memory, otherwise buffers start small and double when full
+    capacity = sum(len(df) for df in df_list) if isinstance(df_list, (list, tuple)) else 1 << 16
+    columns, buffers, size = None, {}, 0
+    dataset_codes = np.empty(capacity, dtype=np.min_scalar_type(max(len(categories) - 1, 0)))
+    for df, name in pairs:
+        df_columns = [column for column in df.columns if column != 'Dataset']
+        if columns is None:
+            columns = df_columns
+        elif df_columns != columns:
+            raise ValueError(f"Columns of '{name}' don't match the first dataset: {df_columns} vs {columns}")
+        end = size + len(df)
+        if end > capacity:
+            capacity = max(end, 2 * capacity)
+            buffers = {column: _resize(values, capacity) for column, values in buffers.items()}
+            dataset_codes = _resize(dataset_codes, capacity)
+        for column in columns:
+            values = df[column].to_numpy()
+            if column not in buffers:
+                buffers[column] = np.empty(capacity, dtype=values.dtype)
+            elif np.result_type(buffers[column].dtype, values.dtype) != buffers[column].dtype:
+                buffers[column] = buffers[column].astype(np.result_type(buffers[column].dtype, values.dtype))
+            buffers[column][size:end] = values
+        dataset_codes[size:end] = codes[name]
+        size = end
+
+    if columns is None:
+        return pd.DataFrame()
+    combined = {column: _resize(values, size) for column, values in buffers.items()}
+    combined['Dataset'] = pd.Categorical.from_codes(_resize(dataset_codes, size), categories=categories)
+    return pd.DataFrame(combined, copy=False)
+
+def _resize(values, size):
+    '''
+    Function to return values with exactly `size` rows: the same array if it already fits, otherwise a copy that is truncated
+    or grown (new rows are left uninitialized).
+    '''
+    if len(values) == size:
+        return values
+    out = np.empty(size, dtype=values.dtype)
+    n = min(size, len(values))
+    out[:n] = values[:n]
+    return out
+
+# Panel mode: instead of running build_features once per ticker, all tickers are loaded into one date-aligned panel
+# (rows = dates, columns = (field, ticker)) and the FeaturePlan runs over every ticker at once, since all of its primitives work
+# column by column on 2-D arrays.
+# Tickers don't share the same dates (different listing dates, halts, missing bars), and a window must only ever see the ticker's
+# own bars, like it does in build_features. So before running the plan each ticker's valid rows are packed to the top of its
+# column (gaps move to the end, where they can't leak into any window), and the results are scattered back to their dates after.
+
+def make_panel(frames):
+    '''
+    Function to align several tickers' raw data on one date index.
+    :param frames: Dictionary mapping ticker -> DataFrame with a 'Date' column and the raw price/volume columns.
+    :return: DataFrame indexed by Date with (field, ticker) columns; dates where a ticker has no bar are NaN.
+    '''
+    first = next(iter(frames.values()))
+    fields = [column for column in first.columns if column != 'Date']
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([df['Date'].to_numpy() for df in frames.values()])), name='Date')
+    # one array per field, filled ticker by ticker at the rows of its dates (numeric fields as float64, for the NaN)
+    values = {field: np.full((len(dates), len(frames)), np.nan, dtype=np.float64 if first[field].dtype.kind in 'biuf' else object)
+              for field in fields}
+    for j, (ticker, df) in enumerate(frames.items()):
+        rows = dates.get_indexer(df['Date'])
+        if np.bincount(rows, minlength=len(dates)).max(initial=0) > 1:
+            raise ValueError(f"{ticker} has several bars with the same Date, the panel needs one bar per date")
+        for field in fields:
+            values[field][rows, j] = df[field].to_numpy()
+    tickers = pd.Index(list(frames))
+    panel = pd.concat({field: pd.DataFrame(array, index=dates, columns=tickers) for field, array in values.items()}, axis=1)
+    panel.attrs['dtypes'] = first[fields].dtypes.to_dict() # so panel_to_long can give Volume back its integer dtype
+    return panel
+
+def load_panel(tickers, root=None):
+    '''
+    Function to read each ticker's raw data and align them into one panel.
+    :param tickers: List of ticker symbols stored in root.
+    :param root: Raw store folder written by data_collection.py (defaults to storage.RAW_ROOT).
+    :return: Panel DataFrame (see make_panel).
+    '''
+    import storage
+
+    return make_panel({ticker: storage.read_partition(root or storage.RAW_ROOT, ticker) for ticker in tickers})
+
+def panel_mask(panel):
+    '''
+    Function to find which (date, ticker) cells hold a real bar.
+    :param panel: Panel DataFrame (see make_panel).
+    :return: Boolean array of shape (dates, tickers), True where the ticker has a bar on that date.
+    '''
+    fields = panel.columns.get_level_values(0).unique()
+    return np.logical_or.reduce([panel[field].notna().to_numpy() for field in fields])
+
+def panel_order(mask):
+    '''
+    Function to find the row order that packs every ticker's own bars at the top of its column (in date order), with the
+    dates it has no bar on after them, so rolling windows and shifts only ever see the ticker's own bars.
+    :param mask: Boolean array of shape (dates, tickers), see panel_mask.
+    :return: Integer array of the same shape, for pack_panel and unpack_panel.
+    '''
+    return np.argsort(~mask, axis=0, kind='stable')
+
+def pack_panel(values, order):
+    '''
+    Function to pack a date-aligned (dates, tickers) array with the order from panel_order.
+    '''
+    return np.take_along_axis(values, order, axis=0)
+
+def unpack_panel(values, order, mask, dtype=np.float64):
+    '''
+    Function to move packed values back to their dates (the inverse of pack_panel), NaN where the ticker has no bar.
+    :param values: Packed array of shape (dates, tickers).
+    :param order: Order from panel_order.
+    :param mask: Mask the order was built from.
+    :param dtype: Output dtype (a float type, for the NaN).
+    :return: Date-aligned array.
+    '''
+    out = np.empty(values.shape, dtype=dtype)
+    np.put_along_axis(out, order, values, axis=0) # moves each value back to its date
+    out[~mask] = np.nan
+    return out
+
+def _packed_features(panel, plan, cache, compact):
+    '''
+    Function to run a plan over a panel's packed Close and Volume (see compute_panel_features).
+    :return: Tuple (mask, order, dictionary mapping column name -> packed array).
+    '''
+    if compact:
+        plan = plan.without_intermediates()
+    mask = panel_mask(panel)
+    order = panel_order(mask) # per ticker: its own bars first (in date order), then the missing dates
+    packed = {field: pack_panel(panel[field].to_numpy(dtype=np.float64), order) for field in ('Close', 'Volume')}
+    return mask, order, plan.compute(packed['Close'], packed['Volume'], cache)
+
+def _feature_dtype(values, compact):
+    return np.float32 if compact and compact_dtype(values) == np.float32 else np.float64 # NaN for missing bars, so Target stays float here
+
+def compute_panel_features(panel, plan=DEFAULT_FEATURE_PLAN, cache=None, compact=False):
+    '''
+    Function to compute the features of a plan for every ticker in a panel in one vectorized pass.
+    :param panel: Panel DataFrame (see make_panel).
+    :param plan: FeaturePlan describing which columns to compute (defaults to every feature).
+    :param cache: Optional FeatureCache (the whole panel is one input slice).
+    :param compact: Whether to drop the intermediate columns and downcast the features to float32 (see compute_features).
+    :return: DataFrame indexed by Date with (feature, ticker) columns, NaN wherever the ticker has no bar.
+    '''
+    mask, order, features = _packed_features(panel, plan, cache, compact)
+    tickers = panel['Close'].columns
+    unpacked = {name: pd.DataFrame(unpack_panel(values, order, mask, _feature_dtype(values, compact)), index=panel.index, columns=tickers)
+                for name, values in features.items()}
+    return pd.concat(unpacked, axis=1)
+
+def _long_layout(mask, order):
+    '''
+    Function to find where every row of the long format (tickers one after another, each in date order) comes from.
+    :param mask: Panel mask (see panel_mask).
+    :param order: Order from panel_order.
+    :return: Tuple (packed index, date index, ticker) integer arrays with one entry per bar; the indexes are flat positions in a
+             C-ordered (dates, tickers) array, for np.take.
+    '''
+    n_tickers = mask.shape[1]
+    counts = mask.sum(axis=0)
+    tickers = np.repeat(np.arange(n_tickers), counts)
+    packed_rows = np.arange(len(tickers)) - np.repeat(np.cumsum(counts) - counts, counts) # 0..count-1 within each ticker
+    packed_index = packed_rows * n_tickers + tickers
+    return packed_index, np.take(order, packed_index) * n_tickers + tickers, tickers
+
+def _long_frame(panel, features, index, date_index, tickers, compact):
+    '''
+    Function to gather the long format (see panel_to_long) from 2-D arrays.
+    :param features: Dictionary mapping column name -> array of shape (dates, tickers), packed or date-aligned.
+    :param index: Flat position of every bar in the feature arrays, in long order (see _long_layout).
+    :param date_index: Flat position of every bar in the date-aligned panel, in long order.
+    :param tickers: Ticker number of every bar.
+    '''
+    names = panel['Close'].columns
+    raw = {field: panel[field][names].to_numpy() for field in panel.columns.get_level_values(0).unique()}
+    # same rows drop_nans_warmup would keep per ticker, found on the 2-D arrays so every column is only gathered once
+    keep = np.take(np.logical_and.reduce([pd.notna(values) for values in features.values()]), index)
+    keep &= np.take(np.logical_and.reduce([pd.notna(values) for values in raw.values()]), date_index)
+    index, date_index, tickers = index[keep], date_index[keep], tickers[keep]
+
+    columns = {'Date': panel.index.to_numpy()[date_index // len(names)]}
+    columns.update({field: np.take(values, date_index) for field, values in raw.items()})
+    columns.update({name: np.take(values, index) for name, values in features.items()})
+    long_df = pd.DataFrame(columns)
+    long_df['Dataset'] = pd.Categorical.from_codes(tickers, categories=names.to_numpy())
+    dtypes = {name: dtype for name, dtype in panel.attrs.get('dtypes', {}).items() if name in long_df.columns}
+    if 'Target' in long_df.columns:
+        dtypes['Target'] = np.int8 if compact else np.int64
+    return long_df.astype(dtypes)
+
+def panel_to_long(panel, features, compact=False):
+    '''
+    Function to turn a panel and its features into the long format combine_datasets produces (one row per ticker and date,
+    tickers one after another, warm-up rows dropped and a 'Dataset' column with the ticker).
+    :param panel: Panel DataFrame (see make_panel).
+    :param features: Output of compute_panel_features for that panel.
+    :param compact: Whether Target is stored as int8 (use with compute_panel_features(..., compact=True)).
+    :return: Long DataFrame with Date, the raw columns, the features and Dataset.
+    '''
+    mask = panel_mask(panel)
+    _, date_index, tickers = _long_layout(mask, panel_order(mask))
+    names = panel['Close'].columns
+    arrays = {name: features[name][names].to_numpy() for name in features.columns.get_level_values(0).unique()}
+    return _long_frame(panel, arrays, date_index, date_index, tickers, compact)
+
+def compute_panel_long(panel, plan=DEFAULT_FEATURE_PLAN, cache=None, compact=False):
+    '''
+    Function to compute the features of every ticker in a panel straight into the long format, i.e. the same frame as
+    panel_to_long(panel, compute_panel_features(panel, ...)) without building the date-aligned features in between: every
+    column is gathered from the packed arrays, where each ticker's bars already sit in date order.
+    :param panel: Panel DataFrame (see make_panel).
+    :param plan: FeaturePlan describing which columns to compute (defaults to every feature).
+    :param cache: Optional FeatureCache (the whole panel is one input slice).
+    :param compact: Whether to drop the intermediate columns, downcast the features to float32 and store Target as int8.
+    :return: Long DataFrame with Date, the raw columns, the features and Dataset.
+    '''
+    mask, order, features = _packed_features(panel, plan, cache, compact)
+    packed_index, date_index, tickers = _long_layout(mask, order)
+    features = {name: values.astype(_feature_dtype(values, compact), copy=False) for name, values in features.items()}
+    return _long_frame(panel, features, packed_index, date_index, tickers, compact)
+
+# Batch pipeline: reads the raw store, builds the features of every ticker and writes them to the feature store.
+# It only runs through main() (python feature_engineering.py from src/, or the trading-ml-features command), never on import.
+
+DEFAULT_TICKERS = ["AAPL", "MSFT", "QQQ", "SPY", "TSLA"]
+
+def main(argv=None):
+    '''
+    Function to run the batch feature pipeline from the command line.
+    :param argv: Command line arguments (defaults to sys.argv[1:]).
+    :return: Exit code.
+    '''
+    import argparse
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Build the features of every ticker in the raw store.")
+    parser.add_argument('--tickers', nargs='+', default=None, help="tickers to process (default: every ticker in the raw store, or the starter universe)")
+    parser.add_argument('--raw-root', default=storage.RAW_ROOT, help="raw store folder")
+    parser.add_argument('--features-root', default=storage.FEATURES_ROOT, help="feature store folder")
+    parser.add_argument('--panel', action='store_true', help="compute all tickers at once in panel mode")
+    parser.add_argument('--cross-sectional', action='store_true', help="with --panel, also add the cross-sectional and regime features (see cross_sectional.py)")
+    parser.add_argument('--compact', action='store_true', help="store only the model features, as float32 with an int8 Target")
+    parser.add_argument('--workers', type=int, default=1, help="shard the tickers across this many processes (see pipeline.py)")
+    parser.add_argument('--no-cache', action='store_true', help="recompute every column instead of using the feature cache")
+    parser.add_argument('--cache-dir', default=None, help="feature cache folder (default: data/cache/features)")
+    parser.add_argument('--combined-output', default=None, help="also write every ticker into one Arrow file")
+    parser.add_argument('--profile', action='store_true', help="print the wall time and rows/sec of every build_features stage")
+    parser.add_argument('--chunk-rows', type=int, default=None, help="read and write every ticker in blocks of this many bars (see chunked_features.py)")
+    args = parser.parse_args(argv)
+    if args.cross_sectional and not args.panel:
+        parser.error("--cross-sectional needs --panel (it compares tickers on each date)")
+    if args.chunk_rows is not None and (args.panel or args.workers > 1 or args.chunk_rows < 1):
+        parser.error("--chunk-rows must be positive and runs one ticker at a time (no --panel or --workers)")
+
+    tickers = args.tickers or storage.list_partitions(args.raw_root) or DEFAULT_TICKERS
+    cache_dir = None
+    if not args.no_cache and args.chunk_rows is None: # chunked runs never hold a whole column to cache
+        from feature_cache import DEFAULT_CACHE_DIR
+        cache_dir = args.cache_dir or DEFAULT_CACHE_DIR # unchanged tickers/parameters are loaded instead of recomputed
+
+    cache = None
+    if args.workers > 1 and not args.panel:
+        from pipeline import run_pipeline
+        report, _ = run_pipeline(tickers, args.raw_root, args.features_root, workers=args.workers, cache_dir=cache_dir,
+                                 compact=args.compact)
+        print(f"{report['tickers']} tickers, {report['rows']} rows in {report['wall']:.2f}s with {args.workers} workers")
+        n_rows, n_bytes = report['rows'], report['bytes_per_row'] * report['rows']
+        print("stage seconds (summed over workers):", {stage: round(seconds, 3) for stage, seconds in report['stages'].items()})
+    else:
+        if cache_dir is not None:
+            from feature_cache import FeatureCache
+            cache = FeatureCache(cache_dir)
+        if args.panel:
+            panel = load_panel(tickers, args.raw_root)
+            if args.cross_sectional:
+                from cross_sectional import DEFAULT_BENCHMARKS, cross_sectional_features
+
+                features = compute_panel_features(panel, cache=cache, compact=args.compact)
+                stored = set(tickers) | set(storage.list_partitions(args.raw_root))
+                benchmarks = [name for name in DEFAULT_BENCHMARKS if name in stored]
+                if 'SPY' not in benchmarks:
+                    parser.error("--cross-sectional needs SPY in the raw store (betas and the market regime are measured against it)")
+                # benchmarks outside the universe are read from the raw store just for their prices
+                benchmark_close = None if set(benchmarks) <= set(tickers) else load_panel(benchmarks, args.raw_root)['Close']
+                features = pd.concat([features, cross_sectional_features(panel, features, benchmarks=benchmarks,
+                                                                         benchmark_close=benchmark_close, compact=args.compact)], axis=1)
+                long_df = panel_to_long(panel, features, args.compact)
+            else:
+                long_df = compute_panel_long(panel, cache=cache, compact=args.compact)
+            for name, rows in long_df.groupby('Dataset', observed=True, sort=False):
+                storage.write_partition(rows.reset_index(drop=True), args.features_root, name)
+            n_rows, n_bytes = len(long_df), memory_report(long_df.drop(columns=['Dataset']))['bytes']
+        else:
+            n_rows = n_bytes = 0
+            profile = {} if args.profile else None # summed over tickers
+            for name in tickers:
+                if args.chunk_rows:
+                    from chunked_features import build_features_chunked
+
+                    report = build_features_chunked(storage.iter_partition(args.raw_root, name, args.chunk_rows), df_name=name,
+                                                    root=args.features_root, compact=args.compact, profile=profile)
+                    n_rows, n_bytes = n_rows + report['rows'], n_bytes + report['bytes']
+                    if report['path'] is None:
+                        print(f"{name}: no bars in the raw store, no feature partition written")
+                        tickers = [ticker for ticker in tickers if ticker != name]
+                    continue
+                df = build_features(storage.read_partition(args.raw_root, name), df_name=name, cache=cache, root=args.features_root,
+                                    compact=args.compact, profile=profile)
+                n_rows, n_bytes = n_rows + len(df), n_bytes + memory_report(df)['bytes']
+            if profile:
+                print(format_profile(profile))
+
+    if cache is not None:
+        print("feature cache:", cache.summary())
+        if cache.recomputed:
+            print("recomputed columns:", sorted(set(cache.recomputed)))
+    print(f"{n_bytes / max(n_rows, 1):.1f} bytes per row in memory ({'compact' if args.compact else 'full'} frames, ticker column excluded)")
+    if args.combined_output:
+        frames = (storage.read_partition(args.features_root, name) for name in tickers) # loads one ticker at a time
+        combine_datasets(frames, tickers, output_path=args.combined_output)
+
+    # The combined dataset doesn't need to be written as a separate copy: storage.open_dataset(storage.FEATURES_ROOT) is a lazy view
+    # over the per-ticker files, and storage.read_dataset() loads just the tickers/columns you need (with 'Dataset' as a categorical).
+    print(storage.open_dataset(args.features_root).count_rows(), "rows in the combined feature dataset")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
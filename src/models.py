@@ -0,0 +1,29 @@
+import numpy as np
+
+# Model classes shared by the offline trainer (training.py) and the signal service (signal_service.py). They live here, with
+# nothing but numpy, so training doesn't import the HTTP service and its broker code just to build a model the service loads.
+# Pickled models keep loading either way: signal_service still exposes LogisticModel under its old name.
+
+
+class LogisticModel:
+    '''
+    Dependency-free logistic regression for serving (e.g. coefficients exported from a fitted model). Any object with a
+    predict_proba(X) method returning one column per class works with the service; this one keeps tests and benchmarks free of
+    scikit-learn.
+    :param coef: Array with one coefficient per feature.
+    :param intercept: Intercept.
+    :param feature_names: Feature columns, in the order of coef.
+    '''
+    def __init__(self, coef, intercept, feature_names):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object) # same attribute scikit-learn models set
+
+    def predict_proba(self, X):
+        '''
+        Function to compute the class probabilities.
+        :param X: Array of shape (rows, features).
+        :return: Array of shape (rows, 2) with P(down) and P(up).
+        '''
+        p = 1.0 / (1.0 + np.exp(-(np.asarray(X, dtype=np.float64) @ self.coef + self.intercept)))
+        return np.column_stack([1.0 - p, p])
@@ -0,0 +1,197 @@
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+import storage
+from feature_engineering import DEFAULT_FEATURE_PLAN, combine_datasets, compute_features, memory_report
+
+# Multi-process batch pipeline: the serial loop in feature_engineering.main() (read, build features, write, next ticker) sharded
+# across a process pool, one ticker per task.
+#   - every worker reads its ticker from the raw store, computes the features and writes its own partition, so nothing but a
+#     small summary goes back to the parent
+#   - when the caller wants the frames back (collect=True), the worker copies the columns into one shared memory block and only
+#     sends its name and layout; the parent maps it and builds the DataFrame, no DataFrame is ever pickled
+#   - at most max_in_flight tickers are submitted at a time and results are consumed in ticker order, so memory is bounded by
+#     the window (not the universe) and the output is deterministic: the same files and frames as the serial path
+#   - every stage is timed in the worker and summed in the report
+
+_WORKER_CACHES = {} # cache_dir -> FeatureCache, one per worker process
+
+def _worker_cache(cache_dir):
+    if cache_dir is None:
+        return None
+    if cache_dir not in _WORKER_CACHES:
+        from feature_cache import FeatureCache
+        _WORKER_CACHES[cache_dir] = FeatureCache(cache_dir)
+    return _WORKER_CACHES[cache_dir]
+
+def _to_shared(df):
+    '''
+    Function to copy a DataFrame's columns into one shared memory block.
+    :param df: DataFrame to send to the parent process.
+    :return: Tuple (block name, layout) for _from_shared; columns that aren't fixed-width arrays are pickled into the layout.
+    '''
+    arrays = {column: df[column].to_numpy() for column in df.columns if isinstance(df[column].dtype, np.dtype)} # no extension dtypes
+    layout = []
+    offset = 0
+    for column in df.columns:
+        values = arrays.get(column)
+        if values is not None and values.dtype.kind in 'biufmM':
+            layout.append((column, values.dtype.str, offset, None))
+            offset += values.nbytes
+        else:
+            layout.append((column, None, None, pickle.dumps(df[column]))) # e.g. strings, categoricals or nullable ints, usually absent
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for column, dtype, start, _ in layout:
+        if dtype is not None:
+            values = arrays[column]
+            np.ndarray(values.shape, values.dtype, buffer=block.buf, offset=start)[:] = values
+    block.close()
+    _untrack(block.name) # the parent owns the block now and unlinks it once it has copied the data out
+    return block.name, (len(df), layout)
+
+def _untrack(name):
+    '''
+    Function to stop this process's resource tracker from unlinking a shared memory block when the process exits.
+    :param name: Shared memory block name (SharedMemory.name).
+    '''
+    if os.name == 'posix': # only POSIX blocks are tracked, under their full name, with the leading slash that .name strips
+        resource_tracker.unregister('/' + name.lstrip('/'), 'shared_memory')
+
+def _from_shared(name, shape):
+    '''
+    Function to rebuild the DataFrame written by _to_shared and free the shared memory block.
+    :param name: Shared memory block name.
+    :param shape: Layout returned by _to_shared.
+    :return: DataFrame with the same columns and dtypes as the one the worker sent.
+    '''
+    n_rows, layout = shape
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        columns = {}
+        for column, dtype, start, pickled in layout:
+            if dtype is None:
+                columns[column] = pickle.loads(pickled).array # keeps categorical/extension dtypes
+            else:
+                columns[column] = np.ndarray(n_rows, np.dtype(dtype), buffer=block.buf, offset=start).copy()
+    finally:
+        block.close()
+        block.unlink()
+    return pd.DataFrame(columns)
+
+def _release(result):
+    if result.get('block') is not None:
+        block = shared_memory.SharedMemory(name=result['block'][0])
+        block.close()
+        block.unlink()
+
+def process_ticker(ticker, raw_root, features_root=None, plan=DEFAULT_FEATURE_PLAN, cache_dir=None, collect=False, share=False,
+                   compact=False):
+    '''
+    Function to run every stage of the pipeline for one ticker (the unit of work of a pool worker).
+    :param ticker: Ticker symbol.
+    :param raw_root: Raw store folder.
+    :param features_root: Feature store folder to write to, or None to not write anything.
+    :param plan: FeaturePlan to compute.
+    :param cache_dir: Optional feature cache folder.
+    :param collect: Whether to return the feature frame.
+    :param share: Whether to return the frame through shared memory (in a worker) instead of as a DataFrame (in-process).
+    :param compact: Whether to compute the compact frame (see feature_engineering.compute_features).
+    :return: Dictionary with 'ticker', 'rows', 'bytes' (in memory), 'timings' (stage -> seconds) and 'frame' or 'block'.
+    '''
+    timings = {}
+    start = time.perf_counter()
+    raw = storage.read_partition(raw_root, ticker)
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = compute_features(raw, plan, _worker_cache(cache_dir), compact)
+    timings['compute'] = time.perf_counter() - start
+
+    if features_root is not None:
+        start = time.perf_counter()
+        storage.write_partition(df, features_root, ticker)
+        timings['write'] = time.perf_counter() - start
+
+    result = {'ticker': ticker, 'rows': len(df), 'bytes': memory_report(df)['bytes'], 'timings': timings}
+    if collect and share:
+        start = time.perf_counter()
+        result['block'] = _to_shared(df.reset_index(drop=True))
+        timings['share'] = time.perf_counter() - start
+    elif collect:
+        result['frame'] = df.reset_index(drop=True)
+    return result
+
+def run_pipeline(tickers, raw_root=None, features_root=None, plan=DEFAULT_FEATURE_PLAN, workers=None, max_in_flight=None,
+                 cache_dir=None, collect=False, compact=False):
+    '''
+    Function to build the features of many tickers across a process pool.
+    :param tickers: List of ticker symbols in the raw store.
+    :param raw_root: Raw store folder (defaults to storage.RAW_ROOT).
+    :param features_root: Feature store folder to write to (defaults to storage.FEATURES_ROOT); False to not write anything.
+    :param plan: FeaturePlan to compute.
+    :param workers: Number of worker processes (defaults to the number of CPUs); 0 or 1 runs everything in this process.
+    :param max_in_flight: Maximum number of tickers submitted but not yet consumed (defaults to 4 per worker).
+    :param cache_dir: Optional feature cache folder shared by every worker.
+    :param collect: Whether to also return every ticker's features combined into one DataFrame (see combine_datasets).
+    :param compact: Whether to drop intermediates and downcast the features (see feature_engineering.compute_features).
+    :return: Tuple (report, combined DataFrame or None). The report has 'tickers', 'rows', 'workers', 'wall', 'rows_per_sec',
+             'bytes_per_row' (in memory), 'stages' (stage -> seconds summed over tickers) and 'rows_per_ticker'.
+    '''
+    raw_root = raw_root or storage.RAW_ROOT
+    features_root = None if features_root is False else (features_root or storage.FEATURES_ROOT)
+    workers = os.cpu_count() if workers is None else workers
+    max_in_flight = max_in_flight or 4 * max(workers, 1)
+    stages = {}
+    rows_per_ticker = {}
+    total_bytes = 0
+    frames = [] if collect else None
+
+    def consume(result):
+        nonlocal total_bytes
+        rows_per_ticker[result['ticker']] = result['rows']
+        total_bytes += result['bytes']
+        for stage, seconds in result['timings'].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        if collect:
+            start = time.perf_counter()
+            frames.append(_from_shared(*result['block']) if 'block' in result else result['frame'])
+            stages['collect'] = stages.get('collect', 0.0) + time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    if workers <= 1:
+        for ticker in tickers:
+            consume(process_ticker(ticker, raw_root, features_root, plan, cache_dir, collect, compact=compact))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            queued = iter(tickers)
+            try:
+                while True:
+                    while len(pending) < max_in_flight:
+                        ticker = next(queued, None)
+                        if ticker is None:
+                            break
+                        pending.append(pool.submit(process_ticker, ticker, raw_root, features_root, plan, cache_dir, collect, True, compact))
+                    if not pending:
+                        break
+                    consume(pending.popleft().result()) # in submission order, so the output order never depends on timing
+            except BaseException:
+                for future in pending: # free the blocks of tickers that finished but were never consumed
+                    future.cancel()
+                    if not future.cancelled() and future.exception() is None:
+                        _release(future.result())
+                raise
+    wall = time.perf_counter() - wall_start
+
+    total_rows = sum(rows_per_ticker.values())
+    report = {'tickers': len(rows_per_ticker), 'rows': total_rows, 'workers': workers, 'wall': wall,
+              'rows_per_sec': total_rows / wall if wall else 0.0, 'bytes_per_row': total_bytes / total_rows if total_rows else 0.0, 'stages': stages, 'rows_per_ticker': rows_per_ticker}
+    combined = combine_datasets(frames, list(tickers)) if collect else None
+    return report, combined
@@ -0,0 +1,433 @@
+import argparse
+import json
+import math
+import os
+import pickle
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import DEFAULT_FEATURE_PLAN, load_panel, panel_mask
+from models import LogisticModel # re-exported: pickles of models saved before models.py existed refer to signal_service.LogisticModel
+from streaming_indicators import StreamingFeatures
+
+# Long-running signal service for the daily paper-trading loop. Producing a prediction used to mean rerunning the batch feature
+# pipeline over every ticker's full history; the service instead:
+#   - warms a StreamingFeatures object up once (from the raw store, or from the state it saved on its last run) and keeps the
+#     model loaded, so every new session only costs one O(1) streaming update per ticker and one predict_proba call
+#   - ingests the latest bar of every ticker (ingest(), or POST /bars), refuses bars that aren't newer than the last one (a
+#     replayed bar would be counted twice) and publishes an immutable snapshot of the features and probabilities
+#   - serves the snapshot through a small local JSON API (serve()); reads never wait for an ingest, and the JSON of the whole
+#     universe and of every ticker is encoded at most once per snapshot
+#   - sends orders through a pluggable broker: AlpacaBroker for paper trading, FakeBroker fills locally (tests, dry runs)
+# A ticker without a bar in a session is skipped by the streaming indicators, its state stays where its last bar left it (see
+# StreamingFeatures.update), so its features keep matching the batch features training uses, which only see each ticker's own
+# bars; its features and probability are null for that session.
+#
+# Endpoints (all JSON):
+#   GET  /health              -> {'status', 'date', 'bars', 'tickers'}
+#   GET  /signals             -> {'date', 'signals': {ticker: {'probability', 'close', 'features': {column: value}}}}
+#   GET  /signals/<ticker>    -> {'date', 'ticker', 'probability', 'close', 'features'}
+#   POST /bars                {'date', 'bars': {ticker: {'Close', 'Volume'}}} -> same as GET /signals
+#   POST /orders              {'threshold', 'exit_threshold', 'notional'} (all optional) -> {'orders': [...]}
+#   GET  /positions           -> {'positions': {ticker: quantity}}
+
+MODEL_FEATURES = [column for column in DEFAULT_FEATURE_PLAN.without_intermediates().columns if column != 'Target']
+
+
+def load_model(path):
+    '''
+    Function to load a pickled model (anything with predict_proba, e.g. a fitted scikit-learn classifier or a LogisticModel).
+    '''
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class FakeBroker:
+    '''
+    Local broker that fills every market order immediately at the reference price (no network, for tests and dry runs).
+    :param cash: Starting cash.
+    '''
+    def __init__(self, cash=100_000.0):
+        self.cash = float(cash)
+        self.positions = {}
+        self.orders = []
+        self._lock = threading.Lock()
+
+    def submit_order(self, ticker, qty, side, reference_price=None):
+        '''
+        Function to submit a market order.
+        :param ticker: Ticker symbol.
+        :param qty: Number of shares (positive).
+        :param side: 'buy' or 'sell'.
+        :param reference_price: Last known price; the fake broker fills at it.
+        :return: Dictionary with 'id', 'ticker', 'qty', 'side', 'status' and 'filled_price'.
+        '''
+        if side not in ('buy', 'sell') or qty <= 0:
+            raise ValueError(f"invalid order: {side} {qty} {ticker}")
+        with self._lock:
+            signed = qty if side == 'buy' else -qty
+            self.positions[ticker] = self.positions.get(ticker, 0) + signed
+            if self.positions[ticker] == 0:
+                del self.positions[ticker]
+            self.cash -= signed * reference_price
+            order = {'id': uuid.uuid4().hex, 'ticker': ticker, 'qty': qty, 'side': side, 'status': 'filled',
+                     'filled_price': reference_price}
+            self.orders.append(order)
+        return order
+
+    def get_positions(self):
+        with self._lock:
+            return dict(self.positions)
+
+
+class AlpacaBroker:
+    '''
+    Sends orders to Alpaca (paper trading by default). Credentials come from the arguments or the APCA_API_KEY_ID /
+    APCA_API_SECRET_KEY environment variables.
+    '''
+    def __init__(self, key_id=None, secret_key=None, paper=True):
+        from alpaca.trading.client import TradingClient # imported here so the service runs without alpaca-py installed
+
+        self.client = TradingClient(key_id or os.environ['APCA_API_KEY_ID'], secret_key or os.environ['APCA_API_SECRET_KEY'], paper=paper)
+
+    def submit_order(self, ticker, qty, side, reference_price=None):
+        from alpaca.trading.enums import OrderSide, TimeInForce
+        from alpaca.trading.requests import MarketOrderRequest
+
+        request = MarketOrderRequest(symbol=ticker, qty=qty, side=OrderSide.BUY if side == 'buy' else OrderSide.SELL,
+                                     time_in_force=TimeInForce.DAY)
+        order = self.client.submit_order(request)
+        return {'id': str(order.id), 'ticker': ticker, 'qty': qty, 'side': side, 'status': str(order.status),
+                'filled_price': None if order.filled_avg_price is None else float(order.filled_avg_price)}
+
+    def get_positions(self):
+        return {position.symbol: float(position.qty) for position in self.client.get_all_positions()}
+
+
+def _json_values(values):
+    '''
+    Function to convert an array to a list of floats with None for NaN/inf (which aren't valid JSON).
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    return [None if value != value else value for value in np.where(np.isfinite(values), values, np.nan).tolist()]
+
+
+class Snapshot:
+    '''
+    Features and probabilities of one session. Never modified after it is built, so readers don't need a lock; the JSON
+    encodings are cached on first use.
+    '''
+    def __init__(self, date, tickers, close, features, probability):
+        self.date = date
+        self.tickers = tickers
+        self.index = {ticker: i for i, ticker in enumerate(tickers)}
+        self.close = close
+        self.features = features
+        self.probability = probability
+        self._columns = None
+        self._encoded = {}
+
+    def ticker_signal(self, ticker):
+        if self._columns is None: # every column converted once, instead of one value at a time per request
+            self._columns = {'probability': _json_values(self.probability), 'close': _json_values(self.close),
+                             'features': {name: _json_values(values) for name, values in self.features.items()}}
+        columns, i = self._columns, self.index[ticker]
+        return {'probability': columns['probability'][i], 'close': columns['close'][i],
+                'features': {name: values[i] for name, values in columns['features'].items()}}
+
+    def encoded(self, ticker=None):
+        '''
+        Function to get the JSON body for the whole universe (ticker=None) or one ticker.
+        :return: UTF-8 encoded JSON.
+        '''
+        if ticker not in self._encoded:
+            date = None if self.date is None else self.date.isoformat()
+            if ticker is None:
+                body = {'date': date, 'signals': {name: self.ticker_signal(name) for name in self.tickers}}
+            else:
+                body = {'date': date, 'ticker': ticker, **self.ticker_signal(ticker)}
+            self._encoded[ticker] = json.dumps(body).encode() # two threads may encode the same body, which is harmless
+        return self._encoded[ticker]
+
+
+class SignalService:
+    '''
+    Keeps the warm streaming feature state and the model in memory and turns each session's bars into probabilities.
+    :param streaming: Warmed-up StreamingFeatures (its ticker order is the service's universe).
+    :param model: Object with predict_proba(X); if it has feature_names_in_, those columns are used in that order.
+    :param broker: Optional broker (FakeBroker, AlpacaBroker or anything with submit_order/get_positions).
+    :param feature_columns: Model input columns (defaults to model.feature_names_in_, then MODEL_FEATURES).
+    :param last_date: Date of the last bar in the warm state; bars must be newer.
+    :param state_path: Optional .npz file the state is saved to after every ingest (in the background, see flush).
+    '''
+    def __init__(self, streaming, model, broker=None, feature_columns=None, last_date=None, state_path=None):
+        self.streaming = streaming
+        self.model = model
+        self.broker = broker
+        names = getattr(model, 'feature_names_in_', None)
+        self.feature_columns = list(feature_columns or (names if names is not None else MODEL_FEATURES))
+        self.tickers = list(streaming.tickers)
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.state_path = state_path
+        self.last_date = None if last_date is None else pd.Timestamp(last_date)
+        self.snapshot = Snapshot(self.last_date, self.tickers, np.full(len(self.tickers), np.nan), {}, np.full(len(self.tickers), np.nan))
+        self._lock = threading.Lock()
+        self._orders_lock = threading.Lock() # serializes rebalances only; the broker is never called under _lock
+        self._saver = None
+
+    @classmethod
+    def from_store(cls, tickers, model, raw_root=None, **kwargs):
+        '''
+        Function to start a service from the raw store: replays every ticker's history (aligned on dates, each ticker only
+        through its own bars) through the streaming indicators and publishes the signals of the last session.
+        :param tickers: List of ticker symbols in the raw store.
+        :param model: Loaded model (see SignalService).
+        :param raw_root: Raw store folder (defaults to storage.RAW_ROOT).
+        :return: SignalService ready for the next session's bars.
+        '''
+        panel = load_panel(tickers, raw_root)
+        close = panel['Close'][list(tickers)].to_numpy(dtype=np.float64)
+        volume = panel['Volume'][list(tickers)].to_numpy(dtype=np.float64)
+        bars = panel_mask(panel.loc[:, (slice(None), list(tickers))])
+        streaming = StreamingFeatures(tickers)
+        streaming.warm_up(close[:-1], volume[:-1], bars[:-1])
+        service = cls(streaming, model, last_date=panel.index[-2] if len(panel) > 1 else None, **kwargs)
+        service.ingest_arrays(panel.index[-1], close[-1], volume[-1], save=False, bar=bars[-1]) # publishes the last session's signals
+        return service
+
+    @classmethod
+    def from_state(cls, path, model, **kwargs):
+        '''
+        Function to start a service from a state file saved by a previous run (see save_state), without replaying any history.
+        The last session's signals are published again, with probabilities from the given model.
+        '''
+        streaming = StreamingFeatures.load(path)
+        with np.load(path) as data:
+            date = str(data['__date__']) or None
+            close = data['__close__']
+            features = {key[len('__features__/'):]: data[key] for key in data.files if key.startswith('__features__/')}
+        service = cls(streaming, model, last_date=date, state_path=path, **kwargs)
+        if date is not None and all(name in features for name in service.feature_columns):
+            service._publish(service.last_date, close, features)
+        return service
+
+    def ingest(self, date, bars):
+        '''
+        Function to add one session's bars.
+        :param date: Session date (anything pd.Timestamp accepts); must be later than the last ingested session.
+        :param bars: Dictionary mapping ticker -> {'Close': price, 'Volume': volume}; missing tickers are skipped this session.
+        :return: The new Snapshot.
+        '''
+        close = np.full(len(self.tickers), np.nan)
+        volume = np.full(len(self.tickers), np.nan)
+        for ticker, bar in bars.items():
+            if ticker not in self.index:
+                raise KeyError(f"unknown ticker: {ticker}")
+            close[self.index[ticker]] = bar['Close']
+            volume[self.index[ticker]] = bar['Volume']
+        return self.ingest_arrays(date, close, volume)
+
+    def ingest_arrays(self, date, close, volume, save=True, bar=None):
+        '''
+        Function to add one session's bars given as arrays in ticker order (NaN Close and Volume = no bar).
+        :param bar: Optional boolean array, True for the tickers that have a bar (see StreamingFeatures.update).
+        :return: The new Snapshot.
+        '''
+        date = pd.Timestamp(date)
+        with self._lock:
+            if self.last_date is not None and date <= self.last_date:
+                raise ValueError(f"bar for {date.date()} is not newer than the last session ({self.last_date.date()})")
+            features = self.streaming.update(close, volume, bar)
+            self.last_date = date
+            self._publish(date, close, features)
+            if save and self.state_path:
+                # the copy is taken under the lock and written by a background thread, off the request path; if the process dies
+                # before it lands, the file still holds the previous session, whose successor is then simply accepted again
+                if self._saver is None:
+                    self._saver = ThreadPoolExecutor(max_workers=1) # one writer, so files are written in session order
+                self._saver.submit(_write_state, self.state_path, self._state_arrays())
+        return self.snapshot
+
+    def _publish(self, date, close, features):
+        X = np.column_stack([features[name] for name in self.feature_columns])
+        complete = np.isfinite(X).all(axis=1) # warm-up rows and gaps have no prediction
+        probability = np.full(len(self.tickers), np.nan)
+        if complete.any():
+            probability[complete] = self.model.predict_proba(X[complete])[:, 1]
+        self.snapshot = Snapshot(date, self.tickers, np.asarray(close, dtype=np.float64),
+                                 {name: np.asarray(features[name]) for name in self.feature_columns}, probability)
+
+    def _state_arrays(self):
+        snapshot = self.snapshot
+        return {**self.streaming.state_arrays(), '__date__': np.array('' if self.last_date is None else self.last_date.isoformat()),
+                '__close__': snapshot.close, **{f'__features__/{name}': values for name, values in snapshot.features.items()}}
+
+    def save_state(self, path=None):
+        '''
+        Function to save the streaming state, the last session date and its features, so a restarted service can use from_state
+        instead of replaying the history. The file is replaced atomically, so it always holds one consistent session.
+        :param path: Output .npz file (defaults to state_path).
+        '''
+        with self._lock:
+            arrays = self._state_arrays()
+        _write_state(path or self.state_path, arrays)
+
+    def flush(self):
+        '''
+        Function to wait until the state of every ingested session is written (see ingest_arrays).
+        '''
+        if self._saver is not None:
+            self._saver.submit(lambda: None).result()
+
+    def rebalance(self, threshold=0.6, exit_threshold=0.5, notional=1_000.0):
+        '''
+        Function to turn the current snapshot into orders: buys `notional` worth of every ticker not held whose probability is
+        above threshold, and sells the whole position of held tickers whose probability fell below exit_threshold.
+        The snapshot is taken under the lock and the broker is called after releasing it, so sessions keep being ingested and
+        served during the broker's round-trips (the orders use the snapshot taken at the start).
+        :return: List of the orders the broker returned.
+        '''
+        if self.broker is None:
+            raise RuntimeError("no broker configured")
+        with self._lock:
+            snapshot = self.snapshot # immutable, so the broker round-trips below don't hold up ingests
+        with self._orders_lock: # one rebalance at a time, so two can't both buy a ticker neither sees held
+            positions = self.broker.get_positions()
+            orders = []
+            for i, ticker in enumerate(snapshot.tickers):
+                p, price = snapshot.probability[i], snapshot.close[i]
+                if not (math.isfinite(p) and math.isfinite(price)):
+                    continue
+                held = positions.get(ticker, 0)
+                if held <= 0 and p > threshold and notional >= price:
+                    orders.append(self.broker.submit_order(ticker, int(notional // price), 'buy', price))
+                elif held > 0 and p < exit_threshold:
+                    orders.append(self.broker.submit_order(ticker, held, 'sell', price))
+        return orders
+
+
+def _write_state(path, arrays):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None # set by serve()
+    protocol_version = 'HTTP/1.1' # keep-alive, so a client doesn't pay a TCP handshake per request
+    disable_nagle_algorithm = True # headers and body are separate writes; with Nagle the body waits ~40 ms for the client's ACK
+
+    def _send(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        snapshot = self.service.snapshot
+        if self.path == '/health':
+            self._send(200, {'status': 'ok', 'date': None if snapshot.date is None else snapshot.date.isoformat(),
+                             'bars': self.service.streaming.bars, 'tickers': len(snapshot.tickers)})
+        elif self.path == '/signals':
+            self._send(200, snapshot.encoded())
+        elif self.path.startswith('/signals/'):
+            ticker = self.path[len('/signals/'):]
+            if ticker in snapshot.index:
+                self._send(200, snapshot.encoded(ticker))
+            else:
+                self._send(404, {'error': f"unknown ticker: {ticker}"})
+        elif self.path == '/positions' and self.service.broker is not None:
+            self._send(200, {'positions': self.service.broker.get_positions()})
+        else:
+            self._send(404, {'error': f"no route for GET {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+            if self.path == '/bars':
+                self._send(200, self.service.ingest(payload['date'], payload['bars']).encoded())
+            elif self.path == '/orders':
+                orders = self.service.rebalance(**{key: float(payload[key]) for key in ('threshold', 'exit_threshold', 'notional')
+                                                   if key in payload})
+                self._send(200, {'orders': orders})
+            else:
+                self._send(404, {'error': f"no route for POST {self.path}"})
+        except ValueError as error: # stale session or malformed JSON (json.JSONDecodeError is a ValueError)
+            self._send(409 if self.path == '/bars' and not isinstance(error, json.JSONDecodeError) else 400, {'error': str(error)})
+        except (KeyError, TypeError, RuntimeError) as error:
+            self._send(400, {'error': str(error)})
+
+    def log_message(self, format, *args):
+        pass # one line per request would cost more than the request itself
+
+
+def serve(service, host='127.0.0.1', port=8765):
+    '''
+    Function to create the local HTTP server for a service (call serve_forever() on it, or run it in a thread).
+    :param service: SignalService.
+    :param host: Interface to listen on (localhost only by default).
+    :param port: Port (0 picks a free one, see server.server_address).
+    :return: ThreadingHTTPServer.
+    '''
+    handler = type('SignalHandler', (_Handler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    '''
+    Function to run the signal service from the command line.
+    :param argv: Command line arguments (defaults to sys.argv[1:]).
+    :return: Exit code.
+    '''
+    import storage
+
+    parser = argparse.ArgumentParser(description="Serve features and model probabilities for a universe of tickers.")
+    parser.add_argument('--model', required=True, help="pickled model with predict_proba (see load_model)")
+    parser.add_argument('--tickers', nargs='+', default=None, help="universe (default: every ticker in the raw store)")
+    parser.add_argument('--raw-root', default=storage.RAW_ROOT, help="raw store folder to warm up from")
+    parser.add_argument('--state', default=None, help="state file: loaded if it exists (no warm-up), saved after every session")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--broker', choices=['fake', 'alpaca'], default='fake', help="where POST /orders sends orders")
+    parser.add_argument('--cash', type=float, default=100_000.0, help="starting cash of the fake broker")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    broker = FakeBroker(args.cash) if args.broker == 'fake' else AlpacaBroker()
+    start = time.perf_counter()
+    if args.state and os.path.exists(args.state):
+        service = SignalService.from_state(args.state, model, broker=broker)
+    else:
+        tickers = args.tickers or storage.list_partitions(args.raw_root)
+        service = SignalService.from_store(tickers, model, args.raw_root, broker=broker, state_path=args.state)
+        if args.state:
+            service.save_state(args.state)
+    print(f"{len(service.tickers)} tickers warm up to {service.last_date} in {time.perf_counter() - start:.2f}s")
+
+    server = serve(service, args.host, args.port)
+    print(f"serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.flush()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,257 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Columnar storage for the raw and processed data.
+# Every ticker is stored as one uncompressed Arrow IPC file in a hive-style partition folder:
+#     data/raw/Dataset=AAPL/part-0.arrow
+#     data/processed/features/Dataset=AAPL/part-0.arrow
+# Why Arrow IPC instead of CSV:
+#   - no text parsing or date parsing on load, columns come back with their dtypes (Date stays a timestamp, Volume an int)
+#   - uncompressed IPC files can be memory-mapped, so reading a column doesn't copy it and columns you don't ask for are never touched
+#   - the folder of partitions can be opened as one lazy dataset, which replaces the materialized combined CSV: the ticker
+#     name comes from the folder (dictionary-encoded), instead of being repeated as a string on every row
+# NaN values are stored as NaN (not as Arrow nulls) so float columns stay zero-copy.
+
+PARTITION_COLUMN = 'Dataset' # same column name combine_datasets uses for the ticker
+# data/ at the root of the repo, whatever the current working directory is (TRADING_ML_DATA_DIR overrides it)
+DATA_DIR = os.environ.get('TRADING_ML_DATA_DIR') or os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+RAW_ROOT = os.path.join(DATA_DIR, 'raw')
+FEATURES_ROOT = os.path.join(DATA_DIR, 'processed', 'features')
+
+def partition_path(root, ticker):
+    '''
+    Function to get the file that holds one ticker's data.
+    :param root: Store folder (e.g. RAW_ROOT or FEATURES_ROOT).
+    :param ticker: Ticker symbol.
+    :return: Path to the ticker's Arrow IPC file.
+    '''
+    return os.path.join(root, f'{PARTITION_COLUMN}={ticker}', 'part-0.arrow')
+
+def _to_table(df):
+    '''
+    Function to convert a DataFrame to an Arrow table, keeping NaN as a float value instead of turning it into a null.
+    '''
+    return pa.table({column: pa.array(df[column].to_numpy()) if df[column].dtype.kind in 'fiub' else pa.array(df[column])
+                     for column in df.columns})
+
+def write_partition(df, root, ticker):
+    '''
+    Function to write one ticker's DataFrame to the store, replacing what was there before.
+    :param df: DataFrame to store (the index is not stored, same as to_csv(index=False)).
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    :return: Path of the written file.
+    '''
+    path = partition_path(root, ticker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = _to_table(df.drop(columns=[PARTITION_COLUMN], errors='ignore')) # the ticker is stored in the folder name
+    tmp_path = os.path.join(os.path.dirname(path), '.part-0.arrow.tmp') # dot files are ignored by open_dataset
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path) # readers never see a half-written file
+    return path
+
+def list_partitions(root):
+    '''
+    Function to list the tickers stored in a store folder.
+    :param root: Store folder.
+    :return: Sorted list of ticker symbols.
+    '''
+    if not os.path.isdir(root):
+        return []
+    prefix = f'{PARTITION_COLUMN}='
+    return sorted(name[len(prefix):] for name in os.listdir(root)
+                  if name.startswith(prefix) and os.path.exists(partition_path(root, name[len(prefix):])))
+
+def read_table(root, ticker, columns=None):
+    '''
+    Function to memory-map one ticker's file as an Arrow table (no data is copied or read until it is used).
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    :param columns: Optional list of columns to keep.
+    :return: pyarrow.Table backed by the memory-mapped file.
+    '''
+    table = pa.ipc.open_file(pa.memory_map(partition_path(root, ticker), 'r')).read_all()
+    return table.select(columns) if columns is not None else table
+
+def read_partition(root, ticker, columns=None):
+    '''
+    Function to load one ticker's data as a DataFrame (what pd.read_csv(..., parse_dates=['Date']) used to return).
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    :param columns: Optional list of columns to load; the other columns are never read.
+    :return: DataFrame with the stored columns.
+    '''
+    return read_table(root, ticker, columns).to_pandas(split_blocks=True) # one block per column lets pandas reuse the mapped buffers
+
+def read_arrays(root, ticker, columns):
+    '''
+    Function to get zero-copy NumPy views of numeric columns, e.g. to feed Close/Volume straight into a FeaturePlan.
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    :param columns: List of numeric columns.
+    :return: Dictionary mapping column -> read-only NumPy array backed by the memory-mapped file.
+    '''
+    table = read_table(root, ticker, columns)
+    return {column: table.column(column).to_numpy() for column in columns}
+
+def iter_partition(root, ticker, chunk_rows, columns=None):
+    '''
+    Function to load one ticker's data in blocks of rows, for histories too long to hold in memory as one DataFrame.
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    :param chunk_rows: Number of rows per block (the last block may be shorter).
+    :param columns: Optional list of columns to load.
+    :return: Generator of DataFrames, in row order; only the block being converted is ever copied out of the mapped file.
+    '''
+    table = read_table(root, ticker, columns)
+    for start in range(0, table.num_rows, chunk_rows):
+        yield table.slice(start, chunk_rows).to_pandas(split_blocks=True)
+
+def open_dataset(root):
+    '''
+    Function to open every partition of a store folder as one lazy dataset: the combined view that replaces
+    combined_stock_data_with_features.csv. Nothing is read until to_table()/to_batches() is called, and columns/tickers
+    that are not selected are skipped.
+    :param root: Store folder.
+    :return: pyarrow.dataset.Dataset with a dictionary-encoded 'Dataset' column taken from the folder names.
+    '''
+    return ds.dataset(root, format='ipc', partitioning=ds.HivePartitioning.discover(infer_dictionary=True))
+
+def read_dataset(root, columns=None, tickers=None):
+    '''
+    Function to materialize a selection of the combined view as one DataFrame.
+    :param root: Store folder.
+    :param columns: Optional list of columns to load ('Dataset' is always included).
+    :param tickers: Optional list of tickers to load.
+    :return: DataFrame with the selected rows and columns, tickers one after another in sorted order, 'Dataset' as a categorical.
+    '''
+    if columns is not None and PARTITION_COLUMN not in columns:
+        columns = list(columns) + [PARTITION_COLUMN]
+    row_filter = ds.field(PARTITION_COLUMN).isin(list(tickers)) if tickers is not None else None
+    df = open_dataset(root).to_table(columns=columns, filter=row_filter).to_pandas()
+    df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype(pd.CategoricalDtype(sorted(df[PARTITION_COLUMN].unique())))
+    return df
+
+def import_csv_dir(data_dir=DATA_DIR, root=RAW_ROOT):
+    '''
+    Function to move data downloaded before the store existed ({ticker}_data.csv files) into the raw store.
+    :param data_dir: Folder with the old CSV files.
+    :param root: Store folder to write to.
+    :return: List of imported tickers.
+    '''
+    tickers = sorted(name[:-len('_data.csv')] for name in os.listdir(data_dir) if name.endswith('_data.csv'))
+    for ticker in tickers:
+        write_partition(pd.read_csv(os.path.join(data_dir, f'{ticker}_data.csv'), parse_dates=['Date']), root, ticker)
+    return tickers
+
+class CombinedWriter:
+    '''
+    Writes several tickers one after another into a single Arrow IPC file, without holding more than one ticker in memory.
+    The 'Dataset' column is dictionary-encoded with a fixed dictionary, so every row only stores a small integer code.
+    :param path: Output file path.
+    :param tickers: Every ticker that will be written (the dictionary of the 'Dataset' column).
+    '''
+    def __init__(self, path, tickers):
+        self.path = path
+        self.dictionary = pa.array(list(tickers), type=pa.string())
+        self.codes = {ticker: code for code, ticker in enumerate(tickers)}
+        self.sink = None
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, df, ticker, chunk_rows=None):
+        '''
+        Function to append one ticker's rows, split into record batches of at most chunk_rows rows.
+        '''
+        table = _to_table(df)
+        codes = pa.array(np.full(len(df), self.codes[ticker], dtype=np.int32))
+        table = table.append_column(PARTITION_COLUMN, pa.DictionaryArray.from_arrays(codes, self.dictionary))
+        if self.writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.sink = pa.OSFile(self.path, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, table.schema)
+        self.writer.write_table(table, max_chunksize=chunk_rows)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            self.writer = None
+
+class PartitionWriter:
+    '''
+    Writes one ticker's partition block by block (e.g. from chunked feature processing), so the whole frame never has to be in
+    memory. The file appears in the store on close(), replacing what was there before; after an error it is never published.
+    :param root: Store folder.
+    :param ticker: Ticker symbol.
+    '''
+    def __init__(self, root, ticker):
+        self.path = partition_path(root, ticker)
+        self.tmp_path = os.path.join(os.path.dirname(self.path), '.part-0.arrow.tmp') # dot files are ignored by open_dataset
+        self.sink = None
+        self.writer = None
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, df):
+        '''
+        Function to append a block of rows (same columns and dtypes as the first block).
+        '''
+        table = _to_table(df.drop(columns=[PARTITION_COLUMN], errors='ignore'))
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.sink = pa.OSFile(self.tmp_path, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, table.schema)
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        '''
+        Function to finish the file and publish it (calling it again does nothing).
+        :return: Path of the written file.
+        '''
+        if self.writer is None:
+            if self.sink is None:
+                raise ValueError("nothing was written: the schema of the partition is unknown")
+            return self.path
+        self.writer.close()
+        self.sink.close()
+        self.writer = None
+        os.replace(self.tmp_path, self.path) # readers never see a half-written file
+        return self.path
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            self.writer = None
+            os.remove(self.tmp_path)
+        self.sink = None
+
+def read_combined(path, columns=None):
+    '''
+    Function to load a file written by CombinedWriter (memory-mapped, only the selected columns are read).
+    :param path: Path to the combined Arrow IPC file.
+    :param columns: Optional list of columns to load.
+    :return: DataFrame with 'Dataset' as a categorical column.
+    '''
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return (table.select(columns) if columns is not None else table).to_pandas()
@@ -0,0 +1,490 @@
+import json
+
+import numpy as np
+
+# Streaming (online) indicators: build_features recomputes every rolling mean, EMA, RSI and the OBV cumsum from the first bar each
+# time it runs. For the daily paper-trading loop (and intraday bars later) that is wasted work, because only one new bar arrives.
+# Each class below keeps the running state of one indicator for many tickers at once (state arrays have one entry per ticker),
+# and update() takes the newest bar for every ticker and returns the indicator value for that bar in O(1).
+#
+# The goal is to match the batch output exactly, not just approximately, so the updates replay the same floating point operations
+# pandas does internally:
+#   - rolling mean: running sum with Kahan compensation (separate compensation terms for adds and removes)
+#   - rolling std: Welford's online variance with Kahan compensation
+#   - ewm(adjust=False): weighted = (old_wt * weighted + new_wt * value) / (old_wt + new_wt), with alpha derived from the center of mass
+#   - cumsum: plain running sum that skips NaN
+# NaN values inside a bar are skipped the same way pandas skips them. A ticker with no bar at all in a session (not listed yet,
+# halted) is left out of that update entirely: its state doesn't move, so every ticker's features only depend on its own bars,
+# like the per-ticker packing in compute_panel_features and the batch features training uses.
+#
+# Every indicator can save its state with get_state()/set_state(), and StreamingFeatures.save()/load() writes all of them to one .npz file.
+
+
+class StreamingIndicator:
+    '''
+    Base class for the streaming indicators. Subclasses list the attributes that make up their state in `state_fields`,
+    and the attributes holding nested indicators (e.g. the ring buffer of a rolling mean) in `children`.
+    '''
+    state_fields = ()
+    children = ()
+
+    def get_state(self):
+        '''
+        Function to return a copy of the indicator state.
+        :return: Dictionary mapping state field -> numpy array (or scalar); nested indicators use 'child.field' keys.
+        '''
+        state = {field: np.copy(getattr(self, field)) for field in self.state_fields}
+        for child in self.children:
+            state.update({f'{child}.{key}': value for key, value in getattr(self, child).get_state().items()})
+        return state
+
+    def set_state(self, state):
+        '''
+        Function to restore a state returned by get_state().
+        :param state: Dictionary mapping state field -> numpy array (or scalar).
+        '''
+        for field in self.state_fields:
+            value = np.asarray(state[field])
+            setattr(self, field, value.item() if value.ndim == 0 else value.copy())
+        for child in self.children:
+            prefix = f'{child}.'
+            getattr(self, child).set_state({key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)})
+
+
+class RingBuffer(StreamingIndicator):
+    '''
+    Keeps the last `size` values for each ticker, so lagged values (Close n bars ago, OBV 20 bars ago) are available in O(1).
+    Every ticker has its own position, because a ticker without a bar in a session is not pushed (see StreamingFeatures.update).
+    :param size: Number of past bars to keep.
+    :param n_series: Number of tickers.
+    '''
+    state_fields = ('buffer', 'pos', 'count')
+
+    def __init__(self, size, n_series):
+        self.size = size
+        self.buffer = np.full((size, n_series), np.nan)
+        self.pos = np.zeros(n_series, dtype=np.int64) # row that holds each ticker's oldest value (and gets overwritten next)
+        self.count = np.zeros(n_series, dtype=np.int64) # number of values pushed so far, per ticker
+        self.columns = np.arange(n_series)
+        self.aligned = True # every ticker at the same row (no skipped bars): whole rows are read and written, no fancy indexing
+
+    def lag(self, periods):
+        '''
+        Function to get the value pushed `periods` bars ago (1 = previous bar), NaN if there is no such bar yet.
+        '''
+        if self.aligned:
+            if len(self.count) and (periods > self.count[0] or periods > self.size):
+                return np.full(self.buffer.shape[1], np.nan)
+            return self.buffer[(self.pos[0] - periods) % self.size] if len(self.pos) else self.buffer[0]
+        values = self.buffer[(self.pos - periods) % self.size, self.columns]
+        return np.where((periods <= self.count) & (periods <= self.size), values, np.nan)
+
+    def push(self, values):
+        '''
+        Function to add the newest values and return the ones that fell out of the buffer (None while it is filling up, NaN for
+        the tickers whose buffer isn't full yet).
+        '''
+        if self.aligned and len(self.pos):
+            row = self.pos[0]
+            dropped = self.buffer[row].copy() if self.count[0] >= self.size else None
+            self.buffer[row] = values
+        elif self.aligned:
+            dropped = None
+        else:
+            dropped = np.where(self.count >= self.size, self.buffer[self.pos, self.columns], np.nan)
+            self.buffer[self.pos, self.columns] = values
+        self.pos = (self.pos + 1) % self.size
+        self.count += 1
+        return dropped
+
+    def set_state(self, state):
+        super().set_state(state)
+        n_series = self.buffer.shape[1]
+        self.pos = np.broadcast_to(self.pos, n_series).astype(np.int64) # files saved before positions were per ticker hold scalars
+        self.count = np.broadcast_to(self.count, n_series).astype(np.int64)
+        self.aligned = bool((self.pos == self.pos[:1]).all() and (self.count == self.count[:1]).all())
+
+
+class RollingMean(StreamingIndicator):
+    '''
+    Streaming version of Series.rolling(window).mean().
+    :param window: Number of bars in the window.
+    :param n_series: Number of tickers.
+    '''
+    state_fields = ('sum_x', 'compensation_add', 'compensation_remove', 'nobs', 'neg_ct', 'same_count', 'prev_value', 'first')
+    children = ('values',)
+
+    def __init__(self, window, n_series):
+        self.window = window
+        self.values = RingBuffer(window, n_series)
+        self.sum_x = np.zeros(n_series)
+        self.compensation_add = np.zeros(n_series)
+        self.compensation_remove = np.zeros(n_series)
+        self.nobs = np.zeros(n_series, dtype=np.int64)
+        self.neg_ct = np.zeros(n_series, dtype=np.int64)
+        self.same_count = np.zeros(n_series, dtype=np.int64) # how many of the latest observations are equal (constant windows return that value exactly)
+        self.prev_value = np.full(n_series, np.nan)
+        self.first = True
+
+    def update(self, values):
+        '''
+        Function to add one bar for every ticker.
+        :param values: Array with one value per ticker (NaN = no observation).
+        :return: Rolling mean for this bar, NaN until the window has `window` observations.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        if self.first:
+            self.prev_value = values.copy()
+            self.first = False
+        dropped = self.values.push(values)
+        if dropped is not None:
+            self._remove(dropped) # NaN (a ticker whose window isn't full yet) is not an observation, so it's not removed
+        self._add(values)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.sum_x / self.nobs
+        mean = np.where((self.neg_ct == 0) & (mean < 0), 0.0, mean)
+        mean = np.where((self.neg_ct == self.nobs) & (mean > 0), 0.0, mean)
+        mean = np.where(self.same_count >= self.nobs, self.prev_value, mean)
+        return np.where((self.nobs >= self.window) & (self.nobs > 0), mean, np.nan)
+
+    def _add(self, values):
+        observed = ~np.isnan(values)
+        y = values - self.compensation_add
+        t = self.sum_x + y
+        self.compensation_add = np.where(observed, t - self.sum_x - y, self.compensation_add)
+        self.sum_x = np.where(observed, t, self.sum_x)
+        self.nobs += observed
+        self.neg_ct += observed & np.signbit(values)
+        same = np.where(values == self.prev_value, self.same_count + 1, 1)
+        self.same_count = np.where(observed, same, self.same_count)
+        self.prev_value = np.where(observed, values, self.prev_value)
+
+    def _remove(self, values):
+        observed = ~np.isnan(values)
+        y = -values - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = np.where(observed, t - self.sum_x - y, self.compensation_remove)
+        self.sum_x = np.where(observed, t, self.sum_x)
+        self.nobs -= observed
+        self.neg_ct -= observed & np.signbit(values)
+
+
+class RollingStd(StreamingIndicator):
+    '''
+    Streaming version of Series.rolling(window).std() (sample standard deviation, ddof=1).
+    :param window: Number of bars in the window.
+    :param n_series: Number of tickers.
+    '''
+    state_fields = ('mean_x', 'ssqdm_x', 'compensation_add', 'compensation_remove', 'nobs', 'same_count', 'prev_value', 'first')
+    children = ('values',)
+
+    def __init__(self, window, n_series, ddof=1):
+        self.window = window
+        self.ddof = ddof
+        self.values = RingBuffer(window, n_series)
+        self.mean_x = np.zeros(n_series)
+        self.ssqdm_x = np.zeros(n_series) # sum of squared differences from the mean
+        self.compensation_add = np.zeros(n_series)
+        self.compensation_remove = np.zeros(n_series)
+        self.nobs = np.zeros(n_series)
+        self.same_count = np.zeros(n_series, dtype=np.int64)
+        self.prev_value = np.full(n_series, np.nan)
+        self.first = True
+
+    def update(self, values):
+        '''
+        Function to add one bar for every ticker.
+        :param values: Array with one value per ticker (NaN = no observation).
+        :return: Rolling standard deviation for this bar, NaN until the window has `window` observations.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        if self.first:
+            self.prev_value = values.copy()
+            self.first = False
+        dropped = self.values.push(values)
+        if dropped is not None:
+            self._remove(dropped) # NaN (a ticker whose window isn't full yet) is not an observation, so it's not removed
+        self._add(values)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = self.ssqdm_x / (self.nobs - self.ddof)
+        var = np.where((self.nobs == 1) | (self.same_count >= self.nobs), 0.0, var)
+        var = np.where((self.nobs >= self.window) & (self.nobs > self.ddof), var, np.nan)
+        with np.errstate(invalid='ignore'):
+            return np.where(var < 0, 0.0, np.sqrt(var))
+
+    def _add(self, values):
+        observed = ~np.isnan(values)
+        same = np.where(values == self.prev_value, self.same_count + 1, 1)
+        self.same_count = np.where(observed, same, self.same_count)
+        self.prev_value = np.where(observed, values, self.prev_value)
+
+        nobs = self.nobs + observed
+        prev_mean = self.mean_x - self.compensation_add
+        y = values - self.compensation_add
+        t = y - self.mean_x
+        compensation = t + self.mean_x - y
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = np.where(nobs > 0, self.mean_x + t / nobs, 0.0)
+        ssqdm_x = self.ssqdm_x + (values - prev_mean) * (values - mean_x)
+
+        self.nobs = nobs
+        self.compensation_add = np.where(observed, compensation, self.compensation_add)
+        self.mean_x = np.where(observed, mean_x, self.mean_x)
+        self.ssqdm_x = np.where(observed, ssqdm_x, self.ssqdm_x)
+
+    def _remove(self, values):
+        observed = ~np.isnan(values)
+        nobs = self.nobs - observed
+        prev_mean = self.mean_x - self.compensation_remove
+        y = values - self.compensation_remove
+        t = y - self.mean_x
+        compensation = t + self.mean_x - y
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = self.mean_x - t / nobs
+        ssqdm_x = self.ssqdm_x - (values - prev_mean) * (values - mean_x)
+
+        self.nobs = nobs
+        self.compensation_remove = np.where(observed & (nobs > 0), compensation, self.compensation_remove)
+        self.mean_x = np.where(observed, np.where(nobs > 0, mean_x, 0.0), self.mean_x)
+        self.ssqdm_x = np.where(observed, np.where(nobs > 0, ssqdm_x, 0.0), self.ssqdm_x)
+
+
+class EMA(StreamingIndicator):
+    '''
+    Streaming version of Series.ewm(span=span or alpha=alpha, adjust=False, min_periods=min_periods).mean().
+    :param n_series: Number of tickers.
+    :param span: EMA span (e.g. 12 for EMA_12). Either span or alpha must be given.
+    :param alpha: Smoothing factor (e.g. 1/14 for Wilder's RSI smoothing).
+    :param min_periods: Number of observations before a value is reported.
+    '''
+    state_fields = ('weighted', 'old_wt', 'nobs')
+
+    def __init__(self, n_series, span=None, alpha=None, min_periods=0):
+        # pandas turns span/alpha into a center of mass first and derives alpha back from it, so we do the same to get the same bits
+        com = (span - 1) / 2.0 if span is not None else 1.0 / alpha - 1.0
+        self.alpha = 1.0 / (1.0 + com)
+        self.min_periods = max(min_periods, 1)
+        self.weighted = np.full(n_series, np.nan)
+        self.old_wt = np.ones(n_series) # weight of the current EMA, decays further for every missing bar
+        self.nobs = np.zeros(n_series, dtype=np.int64)
+
+    def update(self, values):
+        '''
+        Function to add one bar for every ticker.
+        :param values: Array with one value per ticker (NaN = no observation).
+        :return: EMA for this bar, NaN until min_periods observations were seen.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        started = ~np.isnan(self.weighted)
+        self.nobs += observed
+        old_wt = np.where(started, self.old_wt * (1.0 - self.alpha), self.old_wt)
+        new_wt = self.alpha
+        blended = (old_wt * self.weighted + new_wt * values) / (old_wt + new_wt)
+        # values equal to the current EMA are skipped to avoid rounding drift on constant series (same as pandas)
+        update = started & observed & (self.weighted != values)
+        self.weighted = np.where(update, blended, np.where(~started & observed, values, self.weighted))
+        self.old_wt = np.where(started & observed, 1.0, old_wt)
+        return np.where(self.nobs >= self.min_periods, self.weighted, np.nan)
+
+
+class RSI(StreamingIndicator):
+    '''
+    Streaming version of ta.momentum.RSIIndicator(close, window).rsi() (Wilder-smoothed average gains and losses).
+    :param window: Period for RSI.
+    :param n_series: Number of tickers.
+    '''
+    state_fields = ('prev_close',)
+    children = ('avg_gain', 'avg_loss')
+
+    def __init__(self, window, n_series):
+        self.window = window
+        self.prev_close = np.full(n_series, np.nan)
+        self.avg_gain = EMA(n_series, alpha=1 / window, min_periods=window)
+        self.avg_loss = EMA(n_series, alpha=1 / window, min_periods=window)
+
+    def update(self, close):
+        '''
+        Function to add one closing price for every ticker.
+        :param close: Array with one closing price per ticker.
+        :return: RSI for this bar, NaN during the first `window` bars.
+        '''
+        close = np.asarray(close, dtype=np.float64)
+        change = close - self.prev_close
+        self.prev_close = close
+        # ta turns the NaN change of a ticker's first bar into a zero gain/loss; bars before that (a ticker that isn't listed yet
+        # in a date-aligned panel) are not observations at all, so the averages start exactly where the ticker's own history does
+        unlisted = np.isnan(close) & (self.avg_gain.nobs == 0)
+        avg_gain = self.avg_gain.update(np.where(unlisted, np.nan, np.where(change > 0, change, 0.0)))
+        avg_loss = self.avg_loss.update(np.where(unlisted, np.nan, -np.where(change < 0, change, 0.0)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(avg_loss == 0, 100, 100 - (100 / (1 + avg_gain / avg_loss)))
+
+
+class OnBalanceVolume(StreamingIndicator):
+    '''
+    Streaming version of on_balance_volume: running sum of volume signed by the direction of the close.
+    :param n_series: Number of tickers.
+    '''
+    state_fields = ('obv', 'prev_close')
+
+    def __init__(self, n_series):
+        self.obv = np.zeros(n_series)
+        self.prev_close = np.full(n_series, np.nan)
+
+    def update(self, close, volume):
+        '''
+        Function to add one bar for every ticker.
+        :param close: Array with one closing price per ticker.
+        :param volume: Array with one volume per ticker.
+        :return: OBV for this bar (NaN where the signed volume is NaN, like pandas' cumsum).
+        '''
+        close = np.asarray(close, dtype=np.float64)
+        signed = np.nan_to_num(np.sign(close - self.prev_close), nan=0.0) * np.asarray(volume, dtype=np.float64)
+        self.prev_close = close
+        observed = ~np.isnan(signed)
+        self.obv = np.where(observed, self.obv + signed, self.obv)
+        return np.where(observed, self.obv, np.nan)
+
+
+class StreamingFeatures:
+    '''
+    Keeps every indicator build_features computes (except Target, which needs the next bar) up to date one bar at a time.
+    The windows are the same parameters FeaturePlan takes, and update() returns the same column names.
+    :param tickers: List of ticker symbols; every update takes one value per ticker in this order.
+    '''
+    def __init__(self, tickers, ma_windows=(20, 50), n_days=10, rsi_window=14, short_window=12, long_window=26,
+                 signal_window=9, bollinger_window=20, volume_window=20, obv_window=20):
+        self.tickers = list(tickers)
+        self.params = dict(ma_windows=list(ma_windows), n_days=n_days, rsi_window=rsi_window, short_window=short_window,
+                           long_window=long_window, signal_window=signal_window, bollinger_window=bollinger_window,
+                           volume_window=volume_window, obv_window=obv_window)
+        n = len(self.tickers)
+        self.indicators = {
+            'closes': RingBuffer(max(n_days, 1), n),
+            **{f'MA_{window}': RollingMean(window, n) for window in ma_windows},
+            f'RSI_{rsi_window}': RSI(rsi_window, n),
+            f'EMA_{short_window}': EMA(n, span=short_window),
+            f'EMA_{long_window}': EMA(n, span=long_window),
+            'Signal_Line': EMA(n, span=signal_window),
+            f'Middle_Band_{bollinger_window}': RollingMean(bollinger_window, n),
+            f'Standard_Deviation_{bollinger_window}': RollingStd(bollinger_window, n),
+            f'Volume_SMA_{volume_window}': RollingMean(volume_window, n),
+            'OBV': OnBalanceVolume(n),
+            'obvs': RingBuffer(obv_window, n),
+        }
+        self.bars = 0
+
+    def update(self, close, volume, bar=None):
+        '''
+        Function to add the newest bar for every ticker.
+        :param close: Array with one closing price per ticker.
+        :param volume: Array with one volume per ticker.
+        :param bar: Optional boolean array, True for the tickers that have a bar (defaults to a Close or Volume that isn't NaN).
+                    Tickers without a bar are skipped: their state is left untouched and their features are NaN for this bar.
+        :return: Dictionary mapping feature column -> array with one value per ticker for this bar.
+        '''
+        close = np.asarray(close, dtype=np.float64)
+        volume = np.asarray(volume, dtype=np.float64)
+        bar = ~(np.isnan(close) & np.isnan(volume)) if bar is None else np.asarray(bar, dtype=bool)
+        if bar.all():
+            return self._update(close, volume)
+        kept = {name: indicator.get_state() for name, indicator in self.indicators.items()}
+        out = self._update(close, volume)
+        for name, indicator in self.indicators.items(): # put the skipped tickers' state back (every per-ticker field ends in the ticker axis)
+            indicator.set_state({key: np.where(bar, value, kept[name][key]) if np.ndim(value) else value
+                                 for key, value in indicator.get_state().items()})
+        return {name: np.where(bar, values, np.nan) for name, values in out.items()}
+
+    def _update(self, close, volume):
+        p = self.params
+        ind = self.indicators
+        out = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            closes = ind['closes']
+            out['Daily_Return'] = close / closes.lag(1) - 1
+            for window in p['ma_windows']:
+                out[f'MA_{window}'] = ind[f'MA_{window}'].update(close)
+                out[f'Price_Relative_to_MA_{window}'] = close / out[f'MA_{window}'] - 1
+            for i in range(1, p['n_days'] + 1):
+                out[f'Return_Day_{i}'] = (close - closes.lag(i)) / close
+            closes.push(close)
+
+            out[f'RSI_{p["rsi_window"]}'] = ind[f'RSI_{p["rsi_window"]}'].update(close)
+            ema_short = out[f'EMA_{p["short_window"]}'] = ind[f'EMA_{p["short_window"]}'].update(close)
+            ema_long = out[f'EMA_{p["long_window"]}'] = ind[f'EMA_{p["long_window"]}'].update(close)
+            out['MACD'] = ema_short - ema_long
+            out['Signal_Line'] = ind['Signal_Line'].update(out['MACD'])
+            out[f'MACD_Histogram_{p["signal_window"]}'] = out['MACD'] - out['Signal_Line']
+
+            w = p['bollinger_window']
+            middle = out[f'Middle_Band_{w}'] = ind[f'Middle_Band_{w}'].update(close)
+            std = out[f'Standard_Deviation_{w}'] = ind[f'Standard_Deviation_{w}'].update(close)
+            out[f'Upper_Band_{w}'] = middle + (2 * std)
+            out[f'Lower_Band_{w}'] = middle - (2 * std)
+            out[f'Bollinger_Normalized_{w}'] = (close - middle) / std
+
+            v = p['volume_window']
+            out[f'Volume_SMA_{v}'] = ind[f'Volume_SMA_{v}'].update(volume)
+            out[f'Volume_Ratio_{v}'] = volume / out[f'Volume_SMA_{v}']
+
+            out['OBV'] = ind['OBV'].update(close, volume)
+            obvs = ind['obvs']
+            out[f'OBV_ROC_{p["obv_window"]}'] = np.clip(out['OBV'] / obvs.lag(p['obv_window']) - 1, -10, 10)
+            obvs.push(out['OBV'])
+        self.bars += 1
+        return out
+
+    def warm_up(self, close, volume, bars=None):
+        '''
+        Function to replay a history of bars (e.g. the CSV history) so the state is ready for the next live bar.
+        :param close: Array of shape (bars, tickers) with closing prices.
+        :param volume: Array of shape (bars, tickers) with volumes.
+        :param bars: Optional boolean array of the same shape, True where the ticker has a bar (see update).
+        :return: Features of the last replayed bar.
+        '''
+        close = np.asarray(close, dtype=np.float64)
+        volume = np.asarray(volume, dtype=np.float64)
+        bars = [None] * len(close) if bars is None else np.asarray(bars, dtype=bool)
+        out = None
+        for close_row, volume_row, bar in zip(close, volume, bars):
+            out = self.update(close_row, volume_row, bar)
+        return out
+
+    def state_arrays(self):
+        '''
+        Function to copy the full state (tickers, parameters and every indicator) into the arrays save() writes.
+        :return: Dictionary mapping array name -> numpy array.
+        '''
+        arrays = {'__meta__': np.array(json.dumps({'tickers': self.tickers, 'params': self.params, 'bars': self.bars}))}
+        for name, indicator in self.indicators.items():
+            for field, value in indicator.get_state().items():
+                arrays[f'{name}/{field}'] = value
+        return arrays
+
+    def save(self, path, extra=None):
+        '''
+        Function to write the full state to an .npz file.
+        :param path: Output file path.
+        :param extra: Optional dictionary of additional arrays to store in the same file (keys starting with '__'); load() ignores them.
+        '''
+        with open(path, 'wb') as f:
+            np.savez(f, **self.state_arrays(), **(extra or {}))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Function to rebuild a StreamingFeatures object from a file written by save().
+        :param path: Path to the .npz file.
+        :return: StreamingFeatures with the saved state.
+        '''
+        with np.load(path) as data:
+            meta = json.loads(data['__meta__'].item())
+            streaming = cls(meta['tickers'], **meta['params'])
+            streaming.bars = meta['bars']
+            for name, indicator in streaming.indicators.items():
+                prefix = f'{name}/'
+                indicator.set_state({key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)})
+        return streaming
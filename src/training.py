@@ -0,0 +1,401 @@
+import argparse
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+
+from backtest import parameter_grid, walk_forward_folds
+from models import LogisticModel
+
+# Hyperparameter search over walk-forward folds: instead of training one configuration at a time in a notebook, every
+# (model, parameter set, fold) pair of a grid is trained on the fold's train window and scored on its test window.
+#   - the folds split the dates (walk_forward_folds from backtest.py), so with several tickers every fold trains on all the
+#     tickers' rows before its test window and the split stays strictly date-ordered. Target is the next bar's direction, so
+#     the last train date's label comes from the first test date's close: TARGET_HORIZON dates are embargoed between the two
+#   - the feature matrix and the targets are saved once as .npy files and memory-mapped by every worker of the process pool; a
+#     task only reads the rows of its own fold
+#   - every fitted model is cached on disk with its test probabilities, under a key made of the fingerprint of the fold's rows
+#     (features, targets, column names), the model, its parameters and the code/library version that fits it. A rerun only
+#     fits the pairs whose key changed: new dates add new folds and leave the old ones cached, a new parameter value only fits
+#     that value
+#   - scores come from the cached probabilities: accuracy, precision and recall of P(up) > 0.5, the always-up baseline, log
+#     loss, and the confidence-sliced accuracy (only the predictions with P(up) > confidence or < 1 - confidence). Feature
+#     importances are the model's own (feature_importances_ of tree models, |coefficient| x feature std for the logistic
+#     regression), normalized to sum to 1
+# 'logistic' is fitted with numpy (no scikit-learn needed) and gives a LogisticModel the signal service can load;
+# 'random_forest' and 'xgboost' need scikit-learn / xgboost (pip install -e ".[ml]").
+
+TARGET_HORIZON = 1 # dates ahead the Target label looks (see feature_engineering.get_target_variable), the default embargo
+
+# the week-2 starting feature set
+DEFAULT_FEATURES = ['RSI_14', 'MACD_Histogram_9', 'Volume_Ratio_20', 'Daily_Return', 'Price_Relative_to_MA_20',
+                    'Bollinger_Normalized_20']
+DEFAULT_GRIDS = {
+    'logistic': {'C': [0.01, 0.1, 1.0, 10.0]},
+    'random_forest': {'n_estimators': [100], 'max_depth': [3, 5, 8], 'random_state': [42]},
+    'xgboost': {'n_estimators': [100], 'max_depth': [2, 3], 'learning_rate': [0.05, 0.1], 'random_state': [42]},
+}
+# same data/ folder as storage.DATA_DIR (not imported from there, so the module doesn't load pyarrow)
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('TRADING_ML_DATA_DIR') or
+                                 os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')), 'cache', 'models')
+
+def fit_logistic(X, y, feature_names, C=1.0, max_iter=100, tol=1e-10):
+    '''
+    Function to fit an L2-regularized logistic regression with Newton's method (same objective as scikit-learn's
+    LogisticRegression: 0.5 * |coef|^2 + C * log loss summed over the rows, intercept not penalized).
+    :param X: Array of shape (rows, features).
+    :param y: Array of 0/1 targets.
+    :param feature_names: Feature columns, in the order of X's columns.
+    :param C: Inverse regularization strength.
+    :param max_iter: Maximum number of Newton steps.
+    :param tol: Stop once no coefficient moves by more than tol.
+    :return: LogisticModel.
+    '''
+    X = np.column_stack([np.asarray(X, dtype=np.float64), np.ones(len(X))]) # last column = intercept
+    y = np.asarray(y, dtype=np.float64)
+    penalty = np.ones(X.shape[1])
+    penalty[-1] = 0.0
+
+    def loss(w):
+        z = X @ w
+        return 0.5 * (penalty * w) @ w + C * (np.logaddexp(0.0, z) - y * z).sum()
+
+    w = np.zeros(X.shape[1])
+    current = loss(w)
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        gradient = penalty * w + C * (X.T @ (p - y))
+        hessian = np.diag(penalty) + C * (X.T * (p * (1 - p))) @ X
+        step = np.linalg.solve(hessian + 1e-12 * np.eye(len(w)), gradient)
+        scale = 1.0
+        while scale > 1e-10: # backtracking: a full Newton step can overshoot while far from the optimum
+            candidate = loss(w - scale * step)
+            if candidate <= current:
+                break
+            scale *= 0.5
+        w -= scale * step
+        current = candidate
+        if np.abs(scale * step).max() <= tol:
+            break
+    return LogisticModel(w[:-1], w[-1], feature_names)
+
+def fit_random_forest(X, y, feature_names, **params):
+    from sklearn.ensemble import RandomForestClassifier
+
+    return RandomForestClassifier(**params).fit(pd.DataFrame(X, columns=feature_names), y) # fitted on named columns, so the model has feature_names_in_
+
+def fit_xgboost(X, y, feature_names, **params):
+    from xgboost import XGBClassifier
+
+    return XGBClassifier(**params).fit(pd.DataFrame(X, columns=feature_names), y)
+
+MODELS = {'logistic': fit_logistic, 'random_forest': fit_random_forest, 'xgboost': fit_xgboost}
+_PACKAGES = {'random_forest': 'scikit-learn', 'xgboost': 'xgboost'} # library versions that go into the cache keys
+
+def model_fingerprint(name):
+    '''
+    Function to fingerprint the code that fits a model (and the version of the library behind it), so changing the fit
+    function or upgrading scikit-learn/xgboost invalidates that model's cached folds.
+    '''
+    fit = MODELS[name]
+    parts = [inspect.getsource(fit), np.__version__]
+    if fit is fit_logistic:
+        parts.append(inspect.getsource(LogisticModel))
+    if name in _PACKAGES:
+        try:
+            parts.append(metadata.version(_PACKAGES[name]))
+        except metadata.PackageNotFoundError:
+            pass # fitting will fail with the ImportError anyway
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def fingerprint_rows(X, y, start, end, feature_names):
+    '''
+    Function to fingerprint the rows of one fold (feature values, targets and column names).
+    :return: Hex digest string.
+    '''
+    digest = hashlib.blake2b(repr((list(feature_names), start, end, X.shape[1])).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(X[start:end]).data)
+    digest.update(np.ascontiguousarray(y[start:end]).data)
+    return digest.hexdigest()
+
+def feature_importances(model, X):
+    '''
+    Function to get the feature importances of a fitted model, normalized to sum to 1.
+    :param model: Fitted model: feature_importances_ is used when it has one, otherwise |coefficient| x the feature's standard
+                  deviation on the training rows (the effect of a one-std move on the log-odds).
+    :param X: Training rows of the model.
+    :return: Array with one importance per feature (NaN if the model has neither).
+    '''
+    if hasattr(model, 'feature_importances_'):
+        importances = np.asarray(model.feature_importances_, dtype=np.float64)
+    elif hasattr(model, 'coef'):
+        importances = np.abs(model.coef) * np.asarray(X, dtype=np.float64).std(axis=0)
+    else:
+        return np.full(X.shape[1], np.nan)
+    total = importances.sum()
+    return importances / total if total > 0 else importances
+
+def score_predictions(y, probability, confidence=0.6):
+    '''
+    Function to score the predicted probabilities of one test window.
+    :param y: Array of 0/1 targets.
+    :param probability: Array of predicted P(up).
+    :param confidence: Confidence slice: only predictions with probability > confidence or < 1 - confidence are kept.
+    :return: Dictionary with n_test, accuracy, precision, recall, baseline (accuracy of always predicting up), log_loss,
+             confident_count, confident_share and confident_accuracy (NaN when no prediction is confident).
+    '''
+    y = np.asarray(y, dtype=np.int64)
+    probability = np.asarray(probability, dtype=np.float64)
+    predicted = (probability > 0.5).astype(np.int64)
+    correct = predicted == y
+    true_positives = (correct & (y == 1)).sum()
+    clipped = np.clip(probability, 1e-15, 1 - 1e-15)
+    confident = (probability > confidence) | (probability < 1 - confidence)
+    n = len(y)
+    scores = {
+        'n_test': n,
+        'accuracy': correct.mean() if n else np.nan,
+        'precision': true_positives / predicted.sum() if predicted.sum() else np.nan,
+        'recall': true_positives / y.sum() if y.sum() else np.nan,
+        'baseline': y.mean() if n else np.nan,
+        'log_loss': -(y * np.log(clipped) + (1 - y) * np.log(1 - clipped)).mean() if n else np.nan,
+        'confident_count': int(confident.sum()),
+        'confident_share': confident.mean() if n else np.nan,
+        'confident_accuracy': correct[confident].mean() if confident.any() else np.nan,
+    }
+    return {name: value if isinstance(value, int) else float(value) for name, value in scores.items()}
+
+class ModelCache:
+    '''
+    On-disk store of fitted fold models, one pickle per key in {cache_dir}/{key[:2]}/{key}.pkl.
+    :param cache_dir: Folder holding the cached models.
+    '''
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.pkl')
+
+    def get(self, key):
+        '''
+        Function to load a cached fold.
+        :return: Dictionary with 'model', 'probabilities', 'importances' and 'fit_seconds', or None on a miss.
+        '''
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path) # workers writing the same key never leave a half-written file
+
+_TRAIN_ARRAYS = {} # set in every worker by _init_train_worker
+
+def _init_train_worker(X_path, y_path):
+    _TRAIN_ARRAYS['X'] = np.load(X_path, mmap_mode='r')
+    _TRAIN_ARRAYS['y'] = np.load(y_path, mmap_mode='r')
+
+def _fit_fold(task):
+    name, params, (train_start, train_end, test_start, test_end), feature_names, key, cache_dir = task
+    X, y = _TRAIN_ARRAYS['X'], _TRAIN_ARRAYS['y']
+    X_train = np.asarray(X[train_start:train_end])
+    start = time.perf_counter()
+    model = MODELS[name](X_train, np.asarray(y[train_start:train_end]), feature_names, **params)
+    fit_seconds = time.perf_counter() - start
+    X_test = np.asarray(X[test_start:test_end])
+    X_test = X_test if isinstance(model, LogisticModel) else pd.DataFrame(X_test, columns=feature_names) # same input type as fit
+    entry = {'model': model, 'probabilities': model.predict_proba(X_test)[:, 1],
+             'importances': feature_importances(model, X_train), 'fit_seconds': fit_seconds}
+    if cache_dir is not None:
+        ModelCache(cache_dir).put(key, entry)
+    return {name: value for name, value in entry.items() if name != 'model'} # the model stays in the cache, only scores come back
+
+def load_training_data(tickers, root=None, features=DEFAULT_FEATURES, target='Target'):
+    '''
+    Function to load the model inputs of several tickers from the feature store, sorted by date.
+    :param tickers: List of ticker symbols.
+    :param root: Feature store folder (defaults to storage.FEATURES_ROOT).
+    :param features: Feature columns to load.
+    :param target: Target column.
+    :return: DataFrame with Date, Dataset, the features and the target, one row per ticker and date. Every ticker's last row is
+             dropped: its target needs the next close, which isn't in the store yet.
+    '''
+    import storage
+
+    root = root or storage.FEATURES_ROOT
+    frames = []
+    for ticker in tickers:
+        df = storage.read_partition(root, ticker, columns=['Date', *features, target]).iloc[:-1]
+        frames.append(df.assign(Dataset=ticker))
+    data = pd.concat(frames, ignore_index=True)
+    data = data[data[list(features)].notna().all(axis=1)]
+    return data.sort_values('Date', kind='stable').reset_index(drop=True)
+
+def _config_label(params):
+    return ', '.join(f'{name}={value}' for name, value in params.items())
+
+def run_search(data, grids=None, features=DEFAULT_FEATURES, target='Target', train_size=252, test_size=63, step=None,
+               expanding=False, confidence=0.6, workers=None, cache_dir=DEFAULT_CACHE_DIR, embargo=TARGET_HORIZON):
+    '''
+    Function to train and score every (model, parameter set, fold) pair of a hyperparameter grid across a process pool.
+    :param data: DataFrame sorted by Date with the feature and target columns (see load_training_data).
+    :param grids: Dictionary mapping model name (see MODELS) -> parameter grid (dictionary of lists, or list of dictionaries);
+                  defaults to DEFAULT_GRIDS['logistic'] only, the model that needs no extra library.
+    :param features: Feature columns.
+    :param target: Target column.
+    :param train_size: Number of dates in the (first) train window.
+    :param test_size: Number of dates in every test window.
+    :param step: Number of dates between folds (defaults to test_size).
+    :param expanding: Whether every train window starts at the first date.
+    :param confidence: Confidence slice of the confident_* scores (see score_predictions).
+    :param workers: Number of worker processes (defaults to the number of CPUs); 0 or 1 runs in this process.
+    :param cache_dir: Folder of the model cache, or None to fit everything and cache nothing.
+    :param embargo: Number of dates between every train window and its test window (defaults to the label horizon, so no
+                    train label is computed from a test date's price).
+    :return: Tuple (scores, importances) of DataFrames. scores has one row per (model, parameter set, fold): the model, its
+             parameters ('config' as text, and one column per parameter), the fold number and dates, n_train, the scores of
+             score_predictions, fit_seconds, 'cached' and the cache 'key' (ModelCache(cache_dir).get(key)['model'] is the
+             fitted model). importances has one row per (model, config, fold, feature).
+    '''
+    grids = {'logistic': DEFAULT_GRIDS['logistic']} if grids is None else grids
+    unknown = [name for name in grids if name not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models: {unknown}. Available: {list(MODELS)}")
+    dates = pd.DatetimeIndex(data['Date'])
+    if not dates.is_monotonic_increasing:
+        raise ValueError("data must be sorted by Date (see load_training_data)")
+    unique_dates = dates.unique()
+    # fold bounds are dates; rows are sorted by date, so every date range is a contiguous block of rows
+    date_rows = np.searchsorted(unique_dates.searchsorted(dates), np.arange(len(unique_dates) + 1))
+    folds = [tuple(int(date_rows[bound]) for bound in fold) for fold in walk_forward_folds(len(unique_dates), train_size, test_size, step, expanding, embargo)]
+    if not folds:
+        raise ValueError(f"{len(unique_dates)} dates are not enough for one fold of {train_size} + {embargo} + {test_size} dates")
+    X = np.ascontiguousarray(data[list(features)].to_numpy(dtype=np.float64))
+    y = np.ascontiguousarray(data[target].to_numpy(dtype=np.int8))
+
+    fold_keys = [fingerprint_rows(X, y, fold[0], fold[3], features) for fold in folds]
+    tasks = []
+    for name, grid in grids.items():
+        fingerprint = model_fingerprint(name)
+        for params in (parameter_grid(grid) if isinstance(grid, dict) else list(grid)):
+            for number, (fold, fold_key) in enumerate(zip(folds, fold_keys)):
+                key = hashlib.blake2b(repr((fold_key, fold, name, fingerprint, sorted(params.items()))).encode(), digest_size=16).hexdigest()
+                tasks.append((name, params, number, fold, key))
+
+    cache = ModelCache(cache_dir) if cache_dir is not None else None
+    entries = [cache.get(key) if cache is not None else None for *_, key in tasks]
+    missing = [i for i, entry in enumerate(entries) if entry is None]
+    fit_tasks = [(tasks[i][0], tasks[i][1], tasks[i][3], list(features), tasks[i][4], cache_dir) for i in missing]
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(fit_tasks) <= 1:
+        _TRAIN_ARRAYS.update(X=X, y=y)
+        fitted = [_fit_fold(task) for task in fit_tasks]
+        _TRAIN_ARRAYS.clear()
+    else:
+        folder = tempfile.mkdtemp(prefix='training_')
+        try:
+            paths = [os.path.join(folder, 'X.npy'), os.path.join(folder, 'y.npy')]
+            np.save(paths[0], X)
+            np.save(paths[1], y)
+            with ProcessPoolExecutor(max_workers=min(workers, len(fit_tasks)), initializer=_init_train_worker, initargs=tuple(paths)) as pool:
+                fitted = list(pool.map(_fit_fold, fit_tasks)) # one fit per task: fits are long and uneven, map keeps the order
+        finally:
+            shutil.rmtree(folder)
+    for i, entry in zip(missing, fitted):
+        entries[i] = entry
+
+    score_rows = []
+    importance_rows = []
+    cached = set(range(len(tasks))) - set(missing)
+    for i, ((name, params, number, (train_start, train_end, test_start, test_end), key), entry) in enumerate(zip(tasks, entries)):
+        config = _config_label(params)
+        score_rows.append({'model': name, 'config': config, **params, 'fold': number,
+                           'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+                           'test_start': dates[test_start], 'test_end': dates[test_end - 1], 'n_train': train_end - train_start,
+                           **score_predictions(y[test_start:test_end], entry['probabilities'], confidence),
+                           'fit_seconds': entry['fit_seconds'], 'cached': i in cached, 'key': key})
+        for feature, importance in zip(features, entry['importances']):
+            importance_rows.append({'model': name, 'config': config, 'fold': number, 'feature': feature, 'importance': importance})
+    return pd.DataFrame(score_rows), pd.DataFrame(importance_rows)
+
+def summarize(scores):
+    '''
+    Function to average the fold scores of every (model, config), best mean accuracy first.
+    :param scores: Scores DataFrame from run_search.
+    :return: DataFrame indexed by (model, config) with the mean scores over the folds and the number of folds.
+    '''
+    columns = ['accuracy', 'precision', 'recall', 'baseline', 'log_loss', 'confident_share', 'confident_accuracy']
+    summary = scores.groupby(['model', 'config'], sort=False)[columns].mean()
+    summary['folds'] = scores.groupby(['model', 'config'], sort=False).size()
+    return summary.sort_values('accuracy', ascending=False, kind='stable')
+
+def main(argv=None):
+    '''
+    Function to run a hyperparameter search on the feature store from the command line.
+    :param argv: Command line arguments (defaults to sys.argv[1:]).
+    :return: Exit code.
+    '''
+    import storage
+
+    parser = argparse.ArgumentParser(description="Train and score a hyperparameter grid on walk-forward folds of the feature store.")
+    parser.add_argument('--tickers', nargs='+', default=None, help="tickers to train on (default: every ticker in the feature store)")
+    parser.add_argument('--features-root', default=storage.FEATURES_ROOT, help="feature store folder")
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=['logistic'], help="models to search (grids in DEFAULT_GRIDS)")
+    parser.add_argument('--features', nargs='+', default=DEFAULT_FEATURES, help="feature columns")
+    parser.add_argument('--train-size', type=int, default=252, help="dates in every train window")
+    parser.add_argument('--test-size', type=int, default=63, help="dates in every test window")
+    parser.add_argument('--step', type=int, default=None, help="dates between folds (default: --test-size)")
+    parser.add_argument('--expanding', action='store_true', help="train every fold from the first date")
+    parser.add_argument('--embargo', type=int, default=TARGET_HORIZON, help="dates left out between train and test windows (default: the label horizon)")
+    parser.add_argument('--confidence', type=float, default=0.6, help="confidence slice: P(up) above it or below 1 - it")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: number of CPUs)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="model cache folder")
+    parser.add_argument('--no-cache', action='store_true', help="fit every fold and cache nothing")
+    parser.add_argument('--output', default=None, help="folder to write scores.csv, importances.csv and summary.csv to")
+    parser.add_argument('--save-model', default=None, help="pickle the best config's model of the last fold here (for trading-ml-serve)")
+    args = parser.parse_args(argv)
+    if args.save_model and args.no_cache:
+        parser.error("--save-model needs the model cache (drop --no-cache)")
+
+    tickers = args.tickers or storage.list_partitions(args.features_root)
+    data = load_training_data(tickers, args.features_root, args.features)
+    start = time.perf_counter()
+    scores, importances = run_search(data, {name: DEFAULT_GRIDS[name] for name in args.models}, args.features,
+                                     train_size=args.train_size, test_size=args.test_size, step=args.step, expanding=args.expanding,
+                                     confidence=args.confidence, workers=args.workers, cache_dir=None if args.no_cache else args.cache_dir,
+                                     embargo=args.embargo)
+    summary = summarize(scores)
+    print(f"{len(data)} rows of {len(tickers)} tickers, {len(scores)} fold fits ({int(scores['cached'].sum())} from the cache) "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(summary.to_string(float_format=lambda value: f'{value:.4f}'))
+    print(importances.groupby('feature')['importance'].mean().sort_values(ascending=False).to_string(float_format=lambda value: f'{value:.4f}'))
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        scores.to_csv(os.path.join(args.output, 'scores.csv'), index=False)
+        importances.to_csv(os.path.join(args.output, 'importances.csv'), index=False)
+        summary.to_csv(os.path.join(args.output, 'summary.csv'))
+    if args.save_model:
+        model, config = summary.index[0]
+        best = scores[(scores['model'] == model) & (scores['config'] == config)].iloc[-1]
+        with open(args.save_model, 'wb') as f:
+            pickle.dump(ModelCache(args.cache_dir).get(best['key'])['model'], f)
+        print(f"saved {model} ({config}) trained on {best['train_start']:%Y-%m-%d}..{best['train_end']:%Y-%m-%d} to {args.save_model}")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())